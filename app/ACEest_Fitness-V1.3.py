@@ -1,3 +1,4 @@
+import sys
 import tkinter as tk
 from tkinter import messagebox, ttk
 from datetime import datetime, date, timedelta
@@ -23,6 +24,15 @@ MET_VALUES = {
     "Workout": 6,
     "Cool-down": 2.5
 }
+
+# ---------- Exercise Names ----------
+# One shared string per exercise, whatever case or punctuation it is typed
+# with. Same folding as the web API's app/vocabulary.py; this file ships on its own.
+EXERCISE_NAMES = {}
+
+def canonical_exercise(name):
+    key = "".join(ch for ch in name.casefold() if ch.isalnum())
+    return EXERCISE_NAMES.setdefault(key, sys.intern(name)) if key else name
         
 class FitnessTrackerApp:
     def __init__(self, master):
@@ -170,6 +180,7 @@ class FitnessTrackerApp:
             if duration <= 0: raise ValueError
         except ValueError:
             messagebox.showerror("Input Error", "Duration must be a positive whole number."); return
+        workout = canonical_exercise(workout)
         # Calories calculation
         weight = self.user_info.get("weight", 70)
         met = MET_VALUES.get(category, 5)
@@ -0,0 +1,599 @@
+"""asyncio-native (ASGI) variant of the web API.
+
+Serves the same routes and responses as ``app.web_app`` from the same store
+(``web_app.store``, looked up per request), but a waiting client costs an
+idle coroutine instead of a worker thread. Work that blocks runs on the
+default thread pool: writes (they wait for the log's group commit), batch
+parsing, compression, and reads from backends with ``blocking_reads``.
+In-memory views are lock-free, so they are read on the event loop.
+
+Run it with ``python -m app.asgi_app`` or ``uvicorn app.asgi_app:fitness_app``.
+It opens the store and warms itself up (see ``app.readiness``) when the
+server sends the lifespan startup event, so it needs a server that does.
+"""
+import asyncio
+import logging
+import re
+import time
+from urllib.parse import unquote
+
+from werkzeug.datastructures import Headers
+from werkzeug.http import quote_etag
+from werkzeug.sansio.request import Request
+
+from app import web_app
+from app.capture import UNCAPTURED, BodyTee, entry as capture_entry
+from app.changes import (EVENT_STREAM, HEARTBEAT, HEARTBEAT_EVENT, change_args, changes_body, events,
+                         stream_head, wants_event_stream)
+from app.codec import dumps
+from app.idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyCache, IdempotencyError
+from app.compression import ENCODINGS, CACHED_HEADERS, CompressedCache, compress, etag_variants
+from app.ingest import (BodyTooLarge, MalformedBody, TooManyRecords, UnsupportedContentType, iter_records,
+                        parse_workout, read_batch)
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, UNMATCHED, Metrics, Shard, store_gauges
+from app.pagination import (InvalidPageRequest, listing_sources, next_link, page_args, page_body,
+                            search_sources)
+from app.ratelimit import RateLimits, client_key, retry_after
+from app.readiness import LIVE_PATHS, LOADING, RETRY_AFTER, WARM_UP, WARM_UP_HEADERS, Readiness, warm_up_paths
+from app.schema import MET_VALUES, InvalidWorkout, canonicalize
+from app.store import MEMBER_FIELD
+
+logger = logging.getLogger(__name__)
+
+settings = web_app.settings
+compression_cache = CompressedCache(settings.compress_cache_bytes)
+rate_limits = RateLimits(settings)
+idempotency = IdempotencyCache(settings.idempotency_max_keys, settings.idempotency_window,
+                               settings.idempotency_bloom_keys)
+metrics = Metrics()
+readiness = Readiness()
+# The running warm-up, kept referenced until it finishes.
+_warm_up = None
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Response:
+    __slots__ = ("status", "body", "headers")
+
+    def __init__(self, body=b"", status=200, headers=None, content_type="application/json"):
+        self.status = status
+        self.body = body
+        self.headers = Headers(headers)
+        if content_type and status != 304:
+            self.headers["Content-Type"] = content_type
+
+    async def send(self, send, receive, head=False):
+        self.headers["Content-Length"] = str(len(self.body))
+        await send({
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in self.headers.items()],
+        })
+        await send({"type": "http.response.body", "body": b"" if head else self.body})
+
+
+class StreamingResponse:
+    """A response whose body comes from an async iterator, until it ends or the client leaves."""
+
+    __slots__ = ("status", "chunks", "headers")
+
+    def __init__(self, chunks, status=200, headers=None, content_type="application/json"):
+        self.status = status
+        self.chunks = chunks
+        self.headers = Headers(headers)
+        self.headers["Content-Type"] = content_type
+
+    async def send(self, send, receive, head=False):
+        await send({
+            "type": "http.response.start",
+            "status": self.status,
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in self.headers.items()],
+        })
+        if not head:
+            pump = asyncio.ensure_future(self._pump(send))
+            disconnect = asyncio.ensure_future(_disconnected(receive))
+            await asyncio.wait({pump, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+            for task in (pump, disconnect):
+                task.cancel()
+            if disconnect.done() and not disconnect.cancelled():
+                return
+        await send({"type": "http.response.body", "body": b""})
+
+    async def _pump(self, send):
+        async for chunk in self.chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+def json_response(obj, status=200):
+    return Response(dumps(obj), status)
+
+
+def make_request(scope):
+    headers = Headers([(k.decode("latin-1"), v.decode("latin-1")) for k, v in scope["headers"]])
+    client = scope.get("client") or (None, None)
+    return Request(scope["method"], scope.get("scheme", "http"), scope.get("server"), scope.get("root_path", ""),
+                   scope["path"], scope.get("query_string", b""), headers, client[0])
+
+
+async def receive_body(receive, max_bytes):
+    """The whole request body, failing as soon as it grows past ``max_bytes``."""
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            raise ConnectionResetError("client disconnected")
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > max_bytes:
+            raise BodyTooLarge(f"body exceeds {max_bytes} bytes")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+class ReceiveStream:
+    """A blocking ``read`` over ASGI ``receive`` for a worker thread, so a body is parsed as it arrives.
+
+    Each ``receive`` still runs on ``loop``; only the body not yet parsed is held.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._pending = b""
+        self._more = True
+
+    def read(self, size=-1):
+        while not self._pending and self._more:
+            message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+            if message["type"] == "http.disconnect":
+                raise ConnectionResetError("client disconnected")
+            self._pending = message.get("body", b"")
+            self._more = message.get("more_body", False)
+        if size < 0 or size >= len(self._pending):
+            data, self._pending = self._pending, b""
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+async def add_once(request, receive, overrides=None):
+    """``web_app.add_once``: store the request's workout unless it is a retry."""
+    if not request.is_json:
+        raise UnsupportedContentType("Content-Type must be application/json")
+    max_bytes = settings.max_body_bytes
+    if request.headers.get("Content-Length", max_bytes, type=int) > max_bytes:
+        raise BodyTooLarge(f"body exceeds {max_bytes} bytes")
+    body = await receive_body(receive, max_bytes)
+    workout = parse_workout(body, overrides)
+    store = web_app.store
+    claim = idempotency.claim(
+        request.headers.get(IDEMPOTENCY_HEADER), client_key(request.headers, request.remote_addr, settings),
+        f"{store.epoch}:{request.path}", body, web_app.ADDED)
+    if claim.replay is not None:
+        status, payload = claim.replay
+        return Response(payload, status, [(REPLAYED_HEADER, "true")])
+    try:
+        await asyncio.to_thread(store.add, canonicalize([workout])[0])
+    except BaseException:
+        claim.release()
+        raise
+    claim.complete(*web_app.ADDED)
+    return Response(web_app.ADDED[1], web_app.ADDED[0])
+
+
+async def read(fn, *args):
+    """Call a store read, on a worker thread when the backend blocks on I/O."""
+    if web_app.store.blocking_reads:
+        return await asyncio.to_thread(fn, *args)
+    return fn(*args)
+
+
+class CommitSignal:
+    """Wakes coroutines on one event loop when the store commits.
+
+    There is one store listener per store and loop, however many requests are
+    waiting, and it only schedules ``_fire`` on the loop.
+    """
+
+    def __init__(self, store, loop):
+        self.event = asyncio.Event()
+
+        def listener():
+            try:
+                loop.call_soon_threadsafe(self._fire)
+            except RuntimeError:  # the loop is closed
+                unsubscribe()
+                _signals.pop((store, loop), None)
+        unsubscribe = store.subscribe(listener)
+
+    def _fire(self):
+        self.event.set()
+        self.event = asyncio.Event()
+
+
+_signals = {}
+
+
+async def wait_for(store, since, timeout):
+    """Async ``store.wait_for``: the latest view once it is newer than ``since`` or ``timeout`` passes."""
+    loop = asyncio.get_running_loop()
+    signal = _signals.get((store, loop))
+    if signal is None:
+        signal = _signals[(store, loop)] = CommitSignal(store, loop)
+    store.watch()
+    deadline = loop.time() + timeout
+    while True:
+        # Take the event before reading, so a commit in between still wakes us.
+        event = signal.event
+        view = await read(store.view)
+        remaining = deadline - loop.time()
+        if view.version > since or remaining <= 0:
+            return view
+        try:
+            await asyncio.wait_for(event.wait(), remaining)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def home(request, receive):
+    return json_response({"message": "Welcome to ACEest Fitness Web API"})
+
+
+async def add_workout(request, receive):
+    return await add_once(request, receive)
+
+
+def _ingest_batch(stream, content_type, content_encoding):
+    records = iter_records(stream, content_type, content_encoding, settings.batch_max_bytes,
+                           settings.max_body_bytes)
+    accepted, results = read_batch(records, settings.batch_max_records)
+    web_app.store.add_many(canonicalize(accepted))
+    return accepted, results
+
+
+async def add_workout_batch(request, receive):
+    # Like web_app's, the body is inflated and parsed chunk by chunk as it is
+    # received, and iter_records bounds it after inflation.
+    stream = ReceiveStream(receive, asyncio.get_running_loop())
+    accepted, results = await asyncio.to_thread(
+        _ingest_batch, stream, request.content_type, request.headers.get("Content-Encoding"))
+    return json_response({
+        "accepted": len(accepted),
+        "rejected": len(results) - len(accepted),
+        "results": results,
+    })
+
+
+async def conditional(request, version, render, generation=0):
+    """The ``If-None-Match`` and cached compressed body checks of ``web_app.conditional``."""
+    etag = f"{web_app.store.epoch}.{generation}.{version}"
+    for variant in etag_variants(etag):
+        if variant in request.if_none_match:
+            return Response(status=304, headers=[("ETag", quote_etag(variant))])
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    entry = compression_cache.get((request.full_path, etag, encoding)) if encoding else None
+    if entry is not None:
+        body, headers = entry
+        response = Response(body, headers=headers)
+        response.headers["Content-Encoding"] = encoding
+        response.headers["ETag"] = quote_etag(f"{etag}-{encoding}")
+        return response
+    response = await render()
+    response.headers["ETag"] = quote_etag(etag)
+    return response
+
+
+async def listing(request, all_json, page_json):
+    # Without paging arguments a listing keeps returning the full list.
+    if "cursor" not in request.args and "limit" not in request.args:
+        return Response(await read(all_json))
+    after, limit = page_args(request.args)
+    body, next_cursor = page_body(await read(page_json, after, limit + 1), limit)
+    response = Response(body)
+    if next_cursor is not None:
+        response.headers["Link"] = next_link(request.base_url, request.args, next_cursor, limit)
+    return response
+
+
+async def view_workouts(request, receive):
+    view = await read(web_app.store.view)
+    sources = listing_sources(view, request.args)
+    return await conditional(request, view.version, lambda: listing(request, *sources), view.generation)
+
+
+async def add_member_workout(request, receive, regn_id):
+    return await add_once(request, receive, {MEMBER_FIELD: regn_id})
+
+
+async def view_member_workouts(request, receive, regn_id):
+    view = await read(web_app.store.view)
+    version = await read(view.member_version, regn_id)
+    sources = listing_sources(view, request.args, regn_id)
+    return await conditional(request, version, lambda: listing(request, *sources), view.generation)
+
+
+async def search_workouts(request, receive):
+    view = await read(web_app.store.view)
+    sources = search_sources(view, request.args)
+    return await conditional(request, view.version, lambda: listing(request, *sources), view.generation)
+
+
+async def search_member_workouts(request, receive, regn_id):
+    view = await read(web_app.store.view)
+    version = await read(view.member_version, regn_id)
+    sources = search_sources(view, request.args, regn_id)
+    return await conditional(request, version, lambda: listing(request, *sources), view.generation)
+
+
+async def stats_response(request, member):
+    view = await read(web_app.store.view)
+    stats = await read(view.stats, member)
+
+    async def render():
+        return json_response(stats.body(member, MET_VALUES))
+    return await conditional(request, stats.version, render)
+
+
+async def view_stats(request, receive):
+    return await stats_response(request, None)
+
+
+async def view_member_stats(request, receive, regn_id):
+    return await stats_response(request, regn_id)
+
+
+async def event_stream(store, since):
+    yield stream_head(store.epoch, since)
+    while True:
+        view = await wait_for(store, since, HEARTBEAT)
+        if view.version <= since:
+            yield HEARTBEAT_EVENT
+            continue
+        body, since = await read(events, view, since)
+        yield body
+
+
+async def view_changes(request, receive):
+    since, limit, wait = change_args(request.args, request.headers.get("Last-Event-ID"))
+    store = web_app.store
+    if wants_event_stream(request.accept_mimetypes):
+        return StreamingResponse(event_stream(store, since), content_type=EVENT_STREAM,
+                                 headers=[("Cache-Control", "no-cache")])
+    view = await wait_for(store, since, wait) if wait else await read(store.view)
+
+    async def render():
+        return Response(await read(changes_body, store.epoch, view, since, limit))
+    return await conditional(request, view.version, render, view.generation)
+
+
+async def view_metrics(request, receive):
+    gauges = await read(store_gauges, web_app.store) if web_app.store is not None else []
+    gauges += readiness.gauges()
+    if web_app.fitness_app.extensions["capture"] is not None:
+        gauges += web_app.fitness_app.extensions["capture"].gauges()
+    if web_app.compactor is not None:
+        gauges += web_app.compactor.gauges()
+    body = metrics.render(gauges)
+    return Response(body.encode(), content_type=METRICS_CONTENT_TYPE)
+
+
+async def healthz(request, receive):
+    return json_response({"status": "ok"})
+
+
+async def readyz(request, receive):
+    return json_response(readiness.body(), 200 if readiness.ready else 503)
+
+
+ROUTES = [
+    ("/", {"GET": home}),
+    ("/add", {"POST": add_workout}),
+    ("/add/batch", {"POST": add_workout_batch}),
+    ("/view", {"GET": view_workouts}),
+    ("/users/<regn_id>/workouts", {"POST": add_member_workout, "GET": view_member_workouts}),
+    ("/users/<regn_id>/search", {"GET": search_member_workouts}),
+    ("/users/<regn_id>/stats", {"GET": view_member_stats}),
+    ("/search", {"GET": search_workouts}),
+    ("/stats", {"GET": view_stats}),
+    ("/changes", {"GET": view_changes}),
+    ("/metrics", {"GET": view_metrics}),
+    ("/healthz", {"GET": healthz}),
+    ("/readyz", {"GET": readyz}),
+]
+
+
+def _compile(rule):
+    return re.compile("^" + re.sub(r"<(\w+)>", r"(?P<\1>[^/]+)", rule) + "$")
+
+
+_ROUTES = [(_compile(rule), rule, methods) for rule, methods in ROUTES]
+
+
+def dispatch(request):
+    """The handler and path parameters for ``request``; raises ``HTTPError`` on 404/405.
+
+    The matched rule is left in ``request.url_rule`` for metrics, as in Flask.
+    """
+    for pattern, rule, methods in _ROUTES:
+        match = pattern.match(request.path)
+        if match is None:
+            continue
+        request.url_rule = rule
+        method = "GET" if request.method == "HEAD" else request.method
+        if method not in methods:
+            raise HTTPError(405, "The method is not allowed for the requested URL.")
+        return methods[method], match.groupdict()
+    raise HTTPError(404, "The requested URL was not found on the server.")
+
+
+async def compress_response(request, response):
+    """The ``after_request`` hook of ``init_compression``, for ASGI responses."""
+    response.headers.add("Vary", "Accept-Encoding")
+    if (
+        isinstance(response, StreamingResponse)
+        or response.status != 200
+        or "Content-Encoding" in response.headers
+        or response.headers.get("Content-Type") != "application/json"
+        or request.method == "HEAD"
+        or len(response.body) < settings.compress_min_bytes
+    ):
+        return response
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is None:
+        return response
+    etag = response.headers.get("ETag", "").strip('"')
+    body = await asyncio.to_thread(compress, response.body, encoding, settings.compress_level)
+    if etag:
+        headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+        compression_cache.put((request.full_path, etag, encoding), body, headers)
+        response.headers["ETag"] = quote_etag(f"{etag}-{encoding}")
+    response.body = body
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+async def handle(request, receive):
+    try:
+        handler, params = dispatch(request)
+        if web_app.store is None and request.path not in LIVE_PATHS:
+            # The store phase of warm-up has not finished (see app.readiness).
+            return Response(LOADING.encode(), 503, [("Retry-After", RETRY_AFTER)])
+        wait = rate_limits.check(handler.__name__, client_key(request.headers, request.remote_addr, settings))
+        if wait:
+            response = json_response({"error": "rate limit exceeded"}, 429)
+            response.headers["Retry-After"] = retry_after(wait)
+            return response
+        return await handler(request, receive, **params)
+    except (MalformedBody, InvalidPageRequest, InvalidWorkout) as error:
+        return json_response({"error": str(error)}, 400)
+    except (TooManyRecords, BodyTooLarge) as error:
+        return json_response({"error": str(error)}, 413)
+    except UnsupportedContentType as error:
+        return json_response({"error": str(error)}, 415)
+    except (HTTPError, IdempotencyError) as error:
+        return json_response({"error": str(error)}, error.status)
+
+
+async def warm_route(path):
+    """Send one warm-up ``GET`` through the app; returns the response status."""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "method": "GET", "path": unquote(path), "query_string": query.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in WARM_UP_HEADERS.items()], WARM_UP: True,
+    }
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await fitness_app(scope, receive, send)
+    return sent[0]["status"]
+
+
+async def warm_routes():
+    for path in await read(warm_up_paths, web_app.store):
+        status = await warm_route(path)
+        if status != 200:
+            raise RuntimeError(f"GET {path} answered {status}")
+
+
+async def warm_up():
+    try:
+        with readiness.timed("store"):
+            await asyncio.to_thread(web_app.open_store)
+        with readiness.timed("indexes"):
+            await read(web_app.store.warm_up)
+        with readiness.timed("routes"):
+            await warm_routes()
+    except Exception:
+        return
+    readiness.finish()
+
+
+async def lifespan(receive, send):
+    global _warm_up
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            if _warm_up is None:
+                # In the background, so that /healthz answers meanwhile.
+                _warm_up = asyncio.ensure_future(warm_up())
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def capturing(receive, tee):
+    """``receive``, keeping the request body in ``tee`` as the app reads it."""
+    async def receive_and_keep():
+        message = await receive()
+        if message["type"] == "http.request":
+            tee.keep(message.get("body", b""))
+        return message
+    return receive_and_keep
+
+
+async def fitness_app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        raise RuntimeError(f"unsupported ASGI scope type {scope['type']!r}")
+    started = time.perf_counter()
+    # Captured like the Flask app's requests (see app.capture), into the same files.
+    capture = web_app.fitness_app.extensions["capture"]
+    tee = None
+    if capture is not None and not scope.get(WARM_UP) and scope["path"] not in UNCAPTURED:
+        tee = BodyTee(None, capture.body_bytes)
+        receive = capturing(receive, tee)
+        wall = time.time()
+    # Warm-up requests are counted in a shard of their own that nothing reads.
+    shard = Shard() if scope.get(WARM_UP) else metrics.shard()
+    shard.in_flight += 1
+    try:
+        request = make_request(scope)
+        request.url_rule = UNMATCHED
+        try:
+            response = await handle(request, receive)
+        except ConnectionResetError:
+            return
+        except Exception:
+            logger.exception("Exception on %s [%s]", request.path, request.method)
+            response = json_response({"error": "Internal Server Error"}, 500)
+        response = await compress_response(request, response)
+        seconds = time.perf_counter() - started
+        nbytes = 0 if isinstance(response, StreamingResponse) else len(response.body)
+        metrics.observe(request.url_rule, request.method, response.status, seconds, nbytes, shard)
+        if tee is not None:
+            body = tee.body()
+            capture.record(capture_entry(
+                wall, request.method, request.path, scope.get("query_string", b"").decode("latin-1"),
+                request.headers, client_key(request.headers, request.remote_addr, settings), response.status,
+                request.url_rule, seconds, nbytes, body, tee.truncated), body)
+        await response.send(send, receive, head=request.method == "HEAD")
+    finally:
+        shard.in_flight -= 1
+
+
+def main():
+    import uvicorn
+
+    uvicorn.run(fitness_app, host="0.0.0.0", port=5000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+"""Optional capture of incoming requests into rolling files, for ``app.replay``.
+
+With ``ACEEST_CAPTURE_DIR`` set, every request except the probes and
+``/metrics`` (``UNCAPTURED``) and warm-up (see ``app.readiness``) is
+recorded. The record holds its start time, method, path with query
+string, the headers that change a response (``HEADERS``) and the client
+key rate limits use. It also holds the request body as the handler read
+it, and the status, route, duration and response size the app answered
+with. Run it on the shadow deployment that ``k8s/ingress-shadow.yaml``
+mirrors traffic to, and the capture is production traffic that never
+reached a client.
+
+An entry is one compact JSON line, then the raw body and a newline; the
+JSON says how long the body is. Bodies stay binary-safe (gzip batches
+included) and unescaped, and ``grep`` still works on the JSON lines. Bodies
+longer than ``ACEEST_CAPTURE_BODY_BYTES`` are cut there and marked ``truncated``.
+
+Requests only queue their entry. A background thread writes the queue to
+``capture-<start µs>-<pid>.log`` files and rolls over to a new file past
+``capture_file_bytes``. When the queue is full, entries are dropped and
+counted rather than slowing requests down. Each process, a forked worker
+included, writes its own files. ``read_capture`` merges every process's
+files by start time, and it stops reading a file at a torn entry.
+
+Opening a file prunes the directory, whoever wrote it, to the newest
+``capture_files``, so the budget holds however many workers there are. A
+file removed while its writer still has it open takes disk space until the
+writer rolls over, so the directory holds at most ``capture_files`` plus
+one per process of ``capture_file_bytes`` each. Keep ``capture_files``
+above the number of workers, or they remove each other's current files.
+"""
+import functools
+import heapq
+import os
+import queue
+import threading
+import time
+import weakref
+from urllib.parse import quote
+
+from flask import request
+
+from app.codec import dumps, loads
+from app.metrics import UNMATCHED
+from app.ratelimit import client_key
+from app.readiness import WARM_UP
+
+PREFIX = "capture-"
+SUFFIX = ".log"
+# Request headers that can change the response, so replays send them again.
+HEADERS = ("Accept", "Accept-Encoding", "Content-Encoding", "Content-Type", "Idempotency-Key",
+           "If-None-Match", "Last-Event-ID", "X-Client-ID")
+# Probes and scrapes are not traffic worth replaying.
+UNCAPTURED = ("/healthz", "/readyz", "/metrics")
+# WSGI environ key holding a captured request's ``BodyTee`` and start times.
+CAPTURE = "aceest.capture"
+
+
+class BodyTee:
+    """A ``wsgi.input`` wrapper that keeps the first ``limit`` bytes the app reads.
+
+    Without a stream, ``keep`` collects the chunks an ASGI app receives.
+    """
+
+    def __init__(self, stream, limit):
+        self._stream = stream
+        self.limit = limit
+        self.chunks = []
+        self.size = 0
+        self.truncated = False
+
+    def keep(self, data):
+        room = self.limit - self.size
+        if len(data) > room:
+            self.truncated = True
+            data = data[:room]
+        if data:
+            self.chunks.append(data)
+            self.size += len(data)
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self.keep(data)
+        return data
+
+    def readline(self, size=-1):
+        data = self._stream.readline(size)
+        self.keep(data)
+        return data
+
+    def body(self):
+        return b"".join(self.chunks)
+
+
+def entry(started, method, path, query, headers, client, status, route, seconds, nbytes, body, truncated):
+    """One capture entry: the request as received and what the app answered, without the body.
+
+    ``path`` is decoded, as apps see it, and is quoted again; ``query`` is the raw query string.
+    """
+    return {
+        "t": started, "method": method, "path": quote(path, safe="/:@!$&'()*+,;=~") + ("?" + query if query else ""),
+        "headers": {name: headers[name] for name in HEADERS if name in headers}, "client": client,
+        "status": status, "route": route, "seconds": seconds, "bytes": nbytes,
+        "body": len(body), "truncated": truncated,
+    }
+
+
+def encode_entry(record, body):
+    return dumps(record) + b"\n" + body + b"\n"
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        while True:
+            line = f.readline()
+            if not line.endswith(b"\n"):
+                return
+            try:
+                record = loads(line)
+                body = f.read(record["body"] + 1)
+            except (ValueError, KeyError, TypeError):
+                return
+            if len(body) != record["body"] + 1 or body[-1:] != b"\n":
+                return
+            yield record, body[:-1]
+
+
+def capture_files(directory):
+    """Every capture file in ``directory``, oldest first."""
+    return sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                  if name.startswith(PREFIX) and name.endswith(SUFFIX))
+
+
+def read_capture(directory):
+    """Yield ``(entry, body)`` pairs from every capture file in ``directory``, by start time."""
+    return heapq.merge(*(_read_file(path) for path in capture_files(directory)), key=lambda pair: pair[0]["t"])
+
+
+def _after_fork(ref):
+    log = ref()
+    if log is not None:
+        log._after_fork()
+
+
+class CaptureLog:
+    """Entries queued by requests and appended to rolling files by a background thread."""
+
+    def __init__(self, directory, file_bytes=64 * 1024 * 1024, files=8, body_bytes=1024 * 1024, queue_size=10_000):
+        if files < 1:
+            raise ValueError("ACEEST_CAPTURE_FILES must be at least 1")
+        self.directory = directory
+        self.file_bytes = file_bytes
+        self.files = files
+        self.body_bytes = body_bytes
+        self.queue_size = queue_size
+        # Entries dropped because the queue was full.
+        self.dropped = 0
+        self._queue = queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._writer = None
+        self._closed = False
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+        os.register_at_fork(after_in_child=functools.partial(_after_fork, weakref.ref(self)))
+
+    def _after_fork(self):
+        # The writer thread did not survive the fork, and the queue may hold
+        # the parent's entries or a lock it held; the child starts afresh.
+        self._queue = queue.Queue(self.queue_size)
+        self._lock = threading.Lock()
+        self._writer = None
+
+    def record(self, entry, body):
+        """Queue one entry; never blocks."""
+        if self._writer is None:
+            with self._lock:
+                if self._writer is None and not self._closed:
+                    self._writer = threading.Thread(target=self._run, name="aceest-capture", daemon=True)
+                    self._writer.start()
+        try:
+            self._queue.put_nowait((entry, body))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def gauges(self):
+        return [("aceest_capture_dropped", "Captured requests dropped because the capture writer fell behind.",
+                 self.dropped)]
+
+    def _open(self):
+        name = f"{PREFIX}{time.time_ns() // 1000:016d}-{os.getpid()}{SUFFIX}"
+        fd = os.open(os.path.join(self.directory, name), os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o600)
+        for path in capture_files(self.directory)[:-self.files]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        return os.fdopen(fd, "wb")
+
+    def _run(self):
+        out, size = None, 0
+        try:
+            while True:
+                item = self._queue.get()
+                while item is not None:
+                    data = encode_entry(*item)
+                    if out is None or size >= self.file_bytes:
+                        if out is not None:
+                            out.close()
+                        out, size = self._open(), 0
+                    out.write(data)
+                    size += len(data)
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                if item is None:
+                    return
+                out.flush()
+        finally:
+            if out is not None:
+                out.close()
+
+    def close(self):
+        """Write out the queued entries and stop the writer."""
+        with self._lock:
+            self._closed = True
+            writer = self._writer
+        if writer is not None:
+            self._queue.put(None)
+            writer.join()
+
+
+def init_capture(app, settings):
+    """Capture ``app``'s requests into ``settings.capture_dir``, if set; returns the ``CaptureLog`` or ``None``.
+
+    Register it right after ``init_metrics``, so it records the final response.
+    """
+    log = None
+    if settings.capture_dir:
+        log = CaptureLog(settings.capture_dir, settings.capture_file_bytes, settings.capture_files,
+                         settings.capture_body_bytes)
+    app.extensions["capture"] = log
+    wsgi_app = app.wsgi_app
+
+    @functools.wraps(wsgi_app)
+    def capturing(environ, start_response):
+        current = app.extensions["capture"]
+        if current is not None and not environ.get(WARM_UP) and environ.get("PATH_INFO") not in UNCAPTURED:
+            tee = environ["wsgi.input"] = BodyTee(environ["wsgi.input"], current.body_bytes)
+            environ[CAPTURE] = (tee, time.time(), time.perf_counter())
+        return wsgi_app(environ, start_response)
+    app.wsgi_app = capturing
+
+    @app.after_request
+    def capture_request(response):
+        captured = request.environ.get(CAPTURE)
+        current = app.extensions["capture"]
+        if captured is not None and current is not None:
+            tee, started, start = captured
+            rule = request.url_rule
+            body = tee.body()
+            current.record(entry(
+                started, request.method, request.path, request.query_string.decode("latin-1"), request.headers,
+                client_key(request.headers, request.remote_addr, settings), response.status_code,
+                rule.rule if rule is not None else UNMATCHED, time.perf_counter() - start,
+                response.content_length or 0, body, tee.truncated), body)
+        return response
+
+    return log
@@ -0,0 +1,123 @@
+"""Change feed: workouts committed after a given sequence number.
+
+Every stored workout has a sequence number, and sequence numbers only ever
+increase. A mirror keeps the last one it saw and asks ``/changes?since=N`` for
+newer workouts instead of re-reading ``/view``. Sequence numbers are only
+comparable within one store ``epoch``. It is included in every response, and
+when it changes the mirror must resync from scratch.
+
+The same feed can be pushed. ``?wait=<seconds>`` long-polls until something
+newer than ``since`` is committed. A request sent with
+``Accept: text/event-stream`` gets Server-Sent Events: one ``workout`` event
+per record, with the sequence number as the event ``id``, so a reconnecting
+``EventSource`` resumes from ``Last-Event-ID``. Waiters are woken by the
+store's commit notification, so an idle subscriber costs nothing per write.
+
+Under WSGI each waiting request holds a server thread until it returns, so
+``stream_slots`` bounds how many a process holds at once, below its request
+threads. The others are answered ``503`` with ``Retry-After`` and the
+threads stay free for everything else. The ASGI app waits in coroutines and
+has no such bound.
+"""
+import threading
+
+from app.pagination import MAX_LIMIT, InvalidPageRequest
+
+# Longest ``wait`` a long-poll may ask for, in seconds.
+MAX_WAIT = 60.0
+
+# Seconds of silence after which an event stream sends a comment line, so
+# proxies and clients can tell an idle stream from a dead one.
+HEARTBEAT = 15.0
+HEARTBEAT_EVENT = b": keep-alive\n\n"
+
+EVENT_STREAM = "text/event-stream"
+
+# Seconds a long-poll or event stream turned away should wait before retrying.
+RETRY_AFTER = "5"
+
+
+def _int_arg(value, name):
+    try:
+        number = int(value)
+    except ValueError:
+        raise InvalidPageRequest(f"{name} must be an integer")
+    if number < 0:
+        raise InvalidPageRequest(f"{name} must not be negative")
+    return number
+
+
+def change_args(args, last_event_id=None):
+    """Parse ``since``, ``limit`` and ``wait`` query arguments.
+
+    ``since`` falls back to the SSE ``Last-Event-ID`` header, then to 0.
+    """
+    since = args.get("since", last_event_id)
+    since = _int_arg(since, "since") if since else 0
+    limit = _int_arg(args.get("limit", MAX_LIMIT), "limit")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidPageRequest(f"limit must be between 1 and {MAX_LIMIT}")
+    try:
+        wait = float(args.get("wait", 0))
+    except ValueError:
+        raise InvalidPageRequest("wait must be a number")
+    if not 0 <= wait <= MAX_WAIT:
+        raise InvalidPageRequest(f"wait must be between 0 and {MAX_WAIT:g}")
+    return since, limit, wait
+
+
+def stream_slots(settings):
+    """The semaphore of waiting requests: ``max_streams``, by default half of the request threads."""
+    return threading.BoundedSemaphore(settings.max_streams or max(1, settings.threads // 2))
+
+
+def wants_event_stream(accept_mimetypes):
+    return accept_mimetypes.best_match(["application/json", EVENT_STREAM]) == EVENT_STREAM
+
+
+def changes_body(epoch, view, since, limit):
+    """JSON bytes with up to ``limit`` workouts of ``view`` newer than ``since``.
+
+    ``last_seq`` is what to send as ``since`` next time; ``more`` says whether
+    that request would return anything right away.
+    """
+    entries = view.page_json(since, limit + 1)
+    entries, more = entries[:limit], len(entries) > limit
+    last_seq = entries[-1][0] if entries else since
+    changes = b",".join(b'{"seq":%d,"workout":%s}' % (seq, encoded) for seq, encoded in entries)
+    return b'{"epoch":"%s","changes":[%s],"last_seq":%d,"more":%s}' % (
+        epoch.encode(), changes, last_seq, b"true" if more else b"false")
+
+
+def events(view, since):
+    """SSE bytes for every workout of ``view`` newer than ``since``, and the new ``since``."""
+    parts = []
+    while True:
+        entries = view.page_json(since, MAX_LIMIT)
+        for seq, encoded in entries:
+            parts.append(b"id: %d\nevent: workout\ndata: %s\n\n" % (seq, encoded))
+        if entries:
+            since = entries[-1][0]
+        if len(entries) < MAX_LIMIT:
+            return b"".join(parts), since
+
+
+def stream_head(epoch, since):
+    """First bytes of an event stream: the reconnect delay and an ``epoch`` event."""
+    return b'retry: 1000\nevent: epoch\ndata: {"epoch":"%s","since":%d}\n\n' % (epoch.encode(), since)
+
+
+def event_stream(store, since):
+    """Blocking generator of SSE bytes for ``store``, for WSGI servers.
+
+    Each open stream holds a server thread; ``app.asgi_app`` serves the same
+    stream from a coroutine.
+    """
+    yield stream_head(store.epoch, since)
+    while True:
+        view = store.wait_for(since, HEARTBEAT)
+        if view.version <= since:
+            yield HEARTBEAT_EVENT
+            continue
+        body, since = events(view, since)
+        yield body
@@ -0,0 +1,134 @@
+"""JSON codec used for request parsing, responses, the log and listings.
+
+The fastest available backend is picked at import time: ``orjson`` when it is
+installed, otherwise the standard library with pre-built compact encoders.
+Whatever the backend, ``dumps`` returns compact UTF-8 bytes and ``loads``
+accepts ``str`` or ``bytes``.
+
+``encode_record`` is the hot path for storing workouts. With the stdlib
+backend it first tries a template compiled for the workout record shape
+(about twice as fast as ``json.dumps``) and falls back to the generic
+encoder for anything else. orjson beats the template, so it is used as is.
+"""
+import json
+import math
+from json.encoder import encode_basestring
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+# Field order and kinds of the canonical workout records produced by
+# app.schema.normalize; a trailing "?" allows null.
+WORKOUT_SHAPE = (
+    ("exercise", "str"),
+    ("duration", "int"),
+    ("category", "str"),
+    ("calories", "float"),
+    ("timestamp", "int"),
+    ("regn_id", "str?"),
+)
+
+_default = DefaultJSONProvider.default
+
+
+class RecordTemplate:
+    """Encoder for dicts with exactly ``fields`` in that order and of those kinds.
+
+    ``encode`` returns ``None`` when a record does not fit, so callers can fall
+    back to a generic encoder.
+    """
+
+    def __init__(self, shape):
+        self.keys = tuple(name for name, _ in shape)
+        self.kinds = tuple((kind.rstrip("?"), kind.endswith("?")) for _, kind in shape)
+        self.template = "{" + ",".join(f"{encode_basestring(name)}:%s" for name in self.keys) + "}"
+
+    def encode(self, record):
+        if tuple(record) != self.keys:
+            return None
+        values = []
+        for (kind, nullable), value in zip(self.kinds, record.values()):
+            if value is None and nullable:
+                values.append("null")
+            elif kind == "str":
+                if type(value) is not str:
+                    return None
+                values.append(encode_basestring(value))
+            elif kind == "int":
+                if type(value) is not int:
+                    return None
+                values.append(int.__repr__(value))
+            else:
+                if type(value) is not float or not math.isfinite(value):
+                    return None
+                values.append(float.__repr__(value))
+        return (self.template % tuple(values)).encode()
+
+
+_encoder = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=_default)
+_decoder = json.JSONDecoder()
+
+
+def stdlib_dumps(obj):
+    return _encoder.encode(obj).encode()
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+
+    def dumps(obj):
+        try:
+            return orjson.dumps(obj, default=_default)
+        except TypeError:
+            # orjson refuses what stdlib accepts, e.g. integers beyond 64 bits.
+            return stdlib_dumps(obj)
+
+    def loads(data):
+        return orjson.loads(data)
+
+    encode_record = dumps
+else:
+    BACKEND = "stdlib"
+    _workout = RecordTemplate(WORKOUT_SHAPE)
+    dumps = stdlib_dumps
+
+    def loads(data):
+        if isinstance(data, (bytes, bytearray)):
+            data = data.decode("utf-8")
+        return _decoder.decode(data)
+
+    def encode_record(record):
+        encoded = _workout.encode(record) if type(record) is dict else None
+        return encoded if encoded is not None else dumps(record)
+
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by this module's codec.
+
+    Keys are emitted in insertion order (not sorted), matching the stored
+    listings. Calls with extra ``json.dumps`` keyword arguments, such as debug
+    indentation, go through the default stdlib implementation.
+    """
+
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return dumps(obj).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if (self.compact is None and self._app.debug) or self.compact is False:
+            return super().response(obj)
+        return self._app.response_class(dumps(obj), mimetype=self.mimetype)
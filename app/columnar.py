@@ -0,0 +1,199 @@
+"""Columnar, array-backed storage of workouts.
+
+A workout dict costs hundreds of bytes in CPython: the dict itself, a boxed
+int or float per number, and its own copy of every string. Yet it carries
+about 30 bytes of data. ``WorkoutTable`` keeps each field of the canonical
+workout shape (``app.codec.WORKOUT_SHAPE``) in a typed ``array`` column
+instead:
+
+* ``int`` and ``float`` fields are 8-byte ``q`` and ``d`` columns.
+* ``str`` fields are 4-byte codes. Exercise and category codes are their
+  IDs in the process-wide ``app.vocabulary`` dictionaries, and only
+  canonical spellings are coded. Other fields, such as the member, get an
+  append-only ``Dictionary`` of their distinct values per table.
+
+The table also holds each workout's encoded JSON, exactly once. Every
+``JSON_CHUNK`` workouts are joined into one chunk, which full listings
+concatenate as is. A 4-byte end offset per workout lets any single
+workout's bytes be sliced back out of its chunk, and the short unsealed
+tail stays as separate ``bytes``. The encoded JSON is the one copy of a
+workout's serialized form, not a cache next to a dict.
+
+Dicts are only materialized at the edge, by ``record``, for callers that
+ask for decoded workouts. A record that does not have the canonical shape,
+such as a legacy log entry or a retention rollup, is kept whole in
+``extras``. Its columns hold placeholders, apart from its timestamp.
+
+Only the store's publishing thread appends. Readers bound every access by
+a count taken from a view, so they never lock. The tail is swapped out only
+after its chunk and offsets are in place, and readers look at the tail
+before the chunks (see ``encoded``).
+"""
+from array import array
+
+from app.codec import WORKOUT_SHAPE
+from app.vocabulary import CATEGORIES, EXERCISES
+
+# Workouts per pre-joined JSON chunk.
+JSON_CHUNK = 1024
+
+_TYPECODES = {"str": "I", "int": "q", "float": "d"}
+_KINDS = {"str": str, "int": int, "float": float}
+_VOCABULARIES = {"exercise": EXERCISES, "category": CATEGORIES}
+
+
+def fits(value):
+    """Whether the int ``value`` fits an 8-byte ``int`` column."""
+    return -2 ** 63 <= value < 2 ** 63
+
+
+class Dictionary:
+    """Append-only mapping between distinct values and small integer codes."""
+
+    def __init__(self, *reserved):
+        self.values = list(reserved)
+        self._codes = {value: code for code, value in enumerate(self.values)}
+
+    def code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = len(self.values)
+            # The value goes in before any column can hold its code.
+            self.values.append(value)
+            self._codes[value] = code
+        return code
+
+    def __len__(self):
+        return len(self.values)
+
+
+class WorkoutTable:
+    """Workouts in sequence order as typed columns plus their chunked JSON."""
+
+    def __init__(self):
+        self.seqs = array("q")
+        self.keys = tuple(name for name, _ in WORKOUT_SHAPE)
+        self.columns = {name: array(_TYPECODES[kind.rstrip("?")]) for name, kind in WORKOUT_SHAPE}
+        # Code 0 is null, which is also the placeholder of records kept in extras.
+        self.dictionaries = {name: _VOCABULARIES.get(name) or Dictionary(None)
+                             for name, kind in WORKOUT_SHAPE if kind.startswith("str")}
+        self.timestamps = self.columns["timestamp"]
+        # Field types a canonical record may have: one combination per way of
+        # leaving nullable fields null.
+        self._shapes = {()}
+        for _, kind in WORKOUT_SHAPE:
+            options = [_KINDS[kind.rstrip("?")]] + ([type(None)] if kind.endswith("?") else [])
+            self._shapes = {shape + (option,) for shape in self._shapes for option in options}
+        self._ints = [i for i, (_, kind) in enumerate(WORKOUT_SHAPE) if kind.startswith("int")]
+        self._codes = [(i, self.dictionaries[name].code) for i, name in enumerate(self.keys)
+                       if name in self.dictionaries]
+        self._appends = [column.append for column in self.columns.values()]
+        self._timestamp_field = self.keys.index("timestamp")
+        self.extras = {}
+        self.chunks = []
+        self.ends = array("I")
+        self.tail = []
+
+    def _values(self, record):
+        """Column values of a canonical ``record``, or ``None`` when it has to be kept whole."""
+        if type(record) is not dict or tuple(record) != self.keys:
+            return None
+        values = list(record.values())
+        if tuple(map(type, values)) not in self._shapes:
+            return None
+        for i in self._ints:
+            if not fits(values[i]):
+                return None
+        for i, code in self._codes:
+            # A spelling that is not canonical has no code of its own.
+            values[i] = code(values[i])
+            if values[i] is None:
+                return None
+        return values
+
+    def append(self, seq, record, encoded, timestamp):
+        """Store one workout and return its position.
+
+        ``timestamp`` is the record's whole epoch seconds, or ``None``; it is
+        kept for records held in ``extras`` too, for the time index.
+        """
+        position = len(self.seqs)
+        values = self._values(record)
+        if values is None:
+            self.extras[position] = record
+            values = [0] * len(self.keys)
+            values[self._timestamp_field] = timestamp or 0
+        for append, value in zip(self._appends, values):
+            append(value)
+        tail = self.tail
+        tail.append(encoded)
+        if len(tail) >= JSON_CHUNK:
+            end = -1
+            ends = []
+            for part in tail:
+                end += len(part) + 1
+                ends.append(end)
+            self.ends.extend(ends)
+            self.chunks.append(b",".join(tail))
+            self.tail = []
+        # Appended last: the position is complete once its seq is there.
+        self.seqs.append(seq)
+        return position
+
+    def records(self, positions):
+        """The workouts at ``positions`` as dicts, built from their columns."""
+        columns = []
+        for name, column in self.columns.items():
+            values = list(map(column.__getitem__, positions))
+            dictionary = self.dictionaries.get(name)
+            columns.append(values if dictionary is None else list(map(dictionary.values.__getitem__, values)))
+        keys, extras = self.keys, self.extras
+        return [extras[position] if position in extras else dict(zip(keys, row))
+                for position, row in zip(positions, zip(*columns))]
+
+    def record(self, position):
+        """The workout at ``position`` as a dict."""
+        return self.records((position,))[0]
+
+    def encoded(self, position):
+        """The workout's JSON, sliced out of its chunk or taken from the tail."""
+        return self.encoded_many((position,))[0]
+
+    def json(self, count):
+        """The first ``count`` workouts' JSON, comma-separated, without brackets."""
+        tail = self.tail
+        chunks = self.chunks
+        sealed = len(chunks)
+        full = min(count // JSON_CHUNK, sealed)
+        parts = chunks[:full]
+        if count > full * JSON_CHUNK:
+            if full < sealed:
+                parts.append(chunks[full][:self.ends[count - 1]])
+            else:
+                parts.append(b",".join(tail[:count - full * JSON_CHUNK]))
+        return b",".join(parts)
+
+    def encoded_many(self, positions):
+        """``encoded`` of each of ``positions``."""
+        # The tail first: if a chunk is sealed meanwhile, the chunk count read
+        # next already covers everything the old tail held.
+        tail, chunks, ends = self.tail, self.chunks, self.ends
+        sealed = len(chunks) * JSON_CHUNK
+        found = []
+        for position in positions:
+            if position >= sealed:
+                found.append(tail[position - sealed])
+                continue
+            chunk, offset = divmod(position, JSON_CHUNK)
+            found.append(chunks[chunk][ends[position - 1] + 1 if offset else 0:ends[position]])
+        return found
+
+    def entries(self, start, end, records=True):
+        """``(seq, record, encoded)`` of positions ``start`` to ``end``; ``record`` is ``None`` unless ``records``."""
+        for block in range(start, end, JSON_CHUNK):
+            positions = range(block, min(block + JSON_CHUNK, end))
+            found = self.records(positions) if records else [None] * len(positions)
+            yield from zip(self.seqs[positions.start:positions.stop], found, self.encoded_many(positions))
+
+    def __len__(self):
+        return len(self.seqs)
@@ -0,0 +1,125 @@
+"""Accept-Encoding driven gzip/deflate compression for JSON responses.
+
+Only successful JSON responses of at least ``compress_min_bytes`` are
+compressed. When a response carries a strong ETag (i.e. it was rendered from
+one store version), the compressed body is kept in a small LRU keyed by URL,
+ETag and encoding. ``cached_response`` lets a route serve those bytes before
+it renders anything, so an unchanged listing is neither re-serialized nor
+re-compressed.
+"""
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+ENCODINGS = ("gzip", "deflate")
+_WBITS = {"gzip": 16 + zlib.MAX_WBITS, "deflate": zlib.MAX_WBITS}
+
+
+def compress(data, encoding, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, _WBITS[encoding])
+    return compressor.compress(data) + compressor.flush()
+
+
+def etag_variants(etag):
+    """The ETag of every representation of one response, compressed or not."""
+    return [etag] + [f"{etag}-{encoding}" for encoding in ENCODINGS]
+
+
+# Response headers that belong to the body and must be replayed with it.
+CACHED_HEADERS = ("Link",)
+
+
+class CompressedCache:
+    """Byte-bounded LRU of ``(compressed body, headers)`` entries."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, headers):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (body, headers)
+            self._size += len(body)
+            while self._size > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def negotiated_encoding():
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def cached_response(app, etag):
+    """A ready compressed response for ``etag`` at this URL, or ``None``."""
+    cache = app.extensions.get("compression_cache")
+    encoding = negotiated_encoding()
+    if cache is None or encoding is None:
+        return None
+    entry = cache.get((request.full_path, etag, encoding))
+    if entry is None:
+        return None
+    body, headers = entry
+    response = app.response_class(body, mimetype="application/json", headers=headers)
+    response.headers["Content-Encoding"] = encoding
+    response.set_etag(f"{etag}-{encoding}")
+    return response
+
+
+def init_compression(app, settings):
+    """Register the compressing ``after_request`` hook on ``app``."""
+    cache = CompressedCache(settings.compress_cache_bytes)
+    app.extensions["compression_cache"] = cache
+
+    @app.after_request
+    def compress_response(response):
+        response.vary.add("Accept-Encoding")
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype != "application/json"
+            or request.method == "HEAD"
+        ):
+            return response
+        encoding = negotiated_encoding()
+        if encoding is None or response.content_length is None:
+            return response
+        if response.content_length < settings.compress_min_bytes:
+            return response
+
+        etag, weak = response.get_etag()
+        key = (request.full_path, etag, encoding) if etag and not weak else None
+        entry = cache.get(key) if key else None
+        if entry is None:
+            body = compress(response.get_data(), encoding, settings.compress_level)
+            if key:
+                headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+                cache.put(key, body, headers)
+        else:
+            body = entry[0]
+        response.set_data(body)
+        response.headers["Content-Encoding"] = encoding
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+        return response
+
+    return cache
@@ -0,0 +1,95 @@
+import os
+from dataclasses import dataclass, fields
+
+
+def _parse(kind, raw):
+    if kind is bool:
+        if raw.lower() in ("1", "true", "yes", "on"):
+            return True
+        if raw.lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(raw)
+    return kind(raw)
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Runtime settings for the web API, read from ``ACEEST_*`` env vars."""
+
+    # Storage backend: "memory" (optionally with the durable log) or "sqlite".
+    store: str = "memory"
+    # SQLite database file; defaults to workouts.db inside data_dir.
+    sqlite_path: str = ""
+    # Directory for the durable workout log; unset keeps workouts in memory only.
+    data_dir: str = ""
+    # Log fsync policy: "always", "batch" or "interval" (see app/workout_log.py).
+    fsync: str = "batch"
+    fsync_interval: float = 1.0
+    segment_bytes: int = 64 * 1024 * 1024
+    snapshot_every: int = 100_000
+    # Days of per-session detail kept before workouts are rolled up into daily
+    # totals (0 keeps everything), and seconds between compactions. See
+    # app/retention.py.
+    retention_days: float = 0.0
+    compact_interval: float = 3600.0
+    # Largest number of workouts accepted by one POST /add/batch.
+    batch_max_records: int = 10_000
+    # Body size limits in bytes: one workout, and a whole batch after inflation.
+    max_body_bytes: int = 16 * 1024
+    batch_max_bytes: int = 32 * 1024 * 1024
+    # Per-client write limits as "endpoint=rate:burst,..." (requests per second,
+    # bucket size); empty disables limiting. See app/ratelimit.py.
+    rate_limits: str = ""
+    rate_limit_max_clients: int = 100_000
+    # How clients are told apart, for rate limits, idempotency keys and
+    # capture: proxies in front of the app that append to X-Forwarded-For
+    # (0 keys on the connection's address), and whether a client's own
+    # X-Client-ID header is believed.
+    trusted_proxies: int = 0
+    trust_client_id: bool = False
+    # Retried writes (see app/idempotency.py): recent keys and responses kept,
+    # seconds a body hash dedupes requests sent without an Idempotency-Key
+    # (0, the default, disables it), and keys per Bloom filter generation for
+    # older keys.
+    idempotency_max_keys: int = 100_000
+    idempotency_window: float = 0.0
+    idempotency_bloom_keys: int = 1_000_000
+    # Response compression: smallest body worth compressing, zlib level 1-9,
+    # and memory for compressed bodies of unchanged store versions.
+    compress_min_bytes: int = 1024
+    compress_level: int = 6
+    compress_cache_bytes: int = 32 * 1024 * 1024
+    # Production server (app/server.py): listen address, worker processes
+    # (0 sizes them from the CPU quota and memory limit, at worker_memory
+    # bytes each), threads per worker, seconds a client may take to send its
+    # request, and seconds a stopping worker gets to finish its requests.
+    bind: str = "0.0.0.0:5000"
+    workers: int = 0
+    threads: int = 8
+    worker_memory: int = 256 * 1024 * 1024
+    request_timeout: float = 10.0
+    graceful_timeout: float = 30.0
+    # Long-polls and event streams the Flask app holds at once, each on a
+    # thread until its client leaves (0: half of threads). See app/changes.py.
+    max_streams: int = 0
+    # Traffic capture (app/capture.py): directory for the rolling capture
+    # files (unset disables capture), bytes per file, files kept in the
+    # directory across all processes, and request body bytes kept per entry.
+    capture_dir: str = ""
+    capture_file_bytes: int = 64 * 1024 * 1024
+    capture_files: int = 8
+    capture_body_bytes: int = 1024 * 1024
+
+    @classmethod
+    def from_env(cls, environ=None):
+        environ = os.environ if environ is None else environ
+        values = {}
+        for field in fields(cls):
+            raw = environ.get(f"ACEEST_{field.name.upper()}")
+            if raw is None or raw == "":
+                continue
+            try:
+                values[field.name] = _parse(field.type, raw)
+            except ValueError:
+                raise ValueError(f"Invalid value for ACEEST_{field.name.upper()}: {raw!r}")
+        return cls(**values)
@@ -0,0 +1,204 @@
+"""Duplicate suppression for retried writes.
+
+Clients on flaky networks retry ``POST /add`` when a response is lost, and
+without this every retry stores the workout again. A write is remembered
+under one of two keys, both scoped to the client, the store epoch and the
+path:
+
+* its ``Idempotency-Key`` header, when the client sends one. Reusing a key
+  with a different body is rejected with ``422``.
+* otherwise, if ``idempotency_window`` is set, a hash of its body for that
+  many seconds. A retry sends the same bytes, but so do two genuinely
+  identical workouts without a timestamp, such as a class logged from one
+  kiosk, so this fallback is off unless a deployment opts in.
+
+A repeat gets the original response back, marked ``Idempotent-Replayed``,
+and never reaches the store. A repeat that arrives while the original is
+still being stored gets ``409``.
+
+Recent keys and their responses live in an LRU of ``idempotency_max_keys``
+entries. Explicit keys that fall out of it go into a Bloom filter, so a
+late retry is still recognized without keeping its response. Such retries
+get the route's standard success response, which for these routes is the
+same. The filter has two generations of ``idempotency_bloom_keys`` keys
+each, and the older one is dropped when the newer fills up, so memory
+stays fixed and the false-positive rate stays at ``BLOOM_ERROR_RATE``.
+Every lookup is O(1).
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+MAX_KEY_LENGTH = 255
+
+# Chance that a new Idempotency-Key is mistaken for one seen long ago.
+BLOOM_ERROR_RATE = 1e-7
+
+
+class IdempotencyError(Exception):
+    status = 409
+
+
+class RequestInProgress(IdempotencyError):
+    status = 409
+
+
+class KeyReused(IdempotencyError):
+    status = 422
+
+
+class InvalidKey(IdempotencyError):
+    status = 400
+
+
+def _digest(*parts):
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        data = part if isinstance(part, bytes) else part.encode()
+        hasher.update(len(data).to_bytes(4, "big"))
+        hasher.update(data)
+    return hasher.digest()
+
+
+class BloomFilter:
+    """Fixed-size set of 16-byte digests with false positives and no false negatives."""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing: k positions from two 64-bit halves of one digest.
+        first = int.from_bytes(digest[:8], "big")
+        step = int.from_bytes(digest[8:16], "big") | 1
+        return ((first + i * step) % self.size for i in range(self.hashes))
+
+    def add(self, digest):
+        bits = self._bits
+        for position in self._positions(digest):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
+class RotatingBloomFilter:
+    """Two ``BloomFilter`` generations; the older is dropped once the newer holds ``capacity`` keys."""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = None
+        self._count = 0
+
+    def add(self, digest):
+        if self._count >= self.capacity:
+            self._previous, self._current = self._current, BloomFilter(self.capacity, self.error_rate)
+            self._count = 0
+        self._current.add(digest)
+        self._count += 1
+
+    def __contains__(self, digest):
+        return digest in self._current or (self._previous is not None and digest in self._previous)
+
+
+class Claim:
+    """One write's place in the cache: either a ``replay`` to return, or a write to ``complete``."""
+
+    __slots__ = ("replay", "_cache", "_key", "_fingerprint", "_explicit")
+
+    def __init__(self, cache=None, key=None, fingerprint=None, explicit=False, replay=None):
+        self.replay = replay
+        self._cache = cache
+        self._key = key
+        self._fingerprint = fingerprint
+        self._explicit = explicit
+
+    def complete(self, status, body):
+        """Remember the response of the write, for its retries."""
+        if self._cache is not None:
+            self._cache._complete(self, status, body)
+
+    def release(self):
+        """Forget a write that failed, so a retry runs it again."""
+        if self._cache is not None:
+            self._cache._release(self)
+
+
+class IdempotencyCache:
+    def __init__(self, max_keys=100_000, window=0.0, bloom_keys=1_000_000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.window = window
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._evicted = RotatingBloomFilter(bloom_keys)
+        self._lock = threading.Lock()
+
+    def claim(self, idempotency_key, client, scope, body, success):
+        """Claim a write of ``body`` by ``client`` to ``scope`` (store epoch and path).
+
+        ``success`` is the ``(status, body)`` replayed for a key only the
+        Bloom filter remembers.
+        """
+        if idempotency_key is not None:
+            if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+                raise InvalidKey(f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters")
+            key, explicit = _digest(b"key", client, scope, idempotency_key), True
+        elif self.window > 0:
+            key, explicit = _digest(b"body", client, scope, body), False
+        else:
+            return Claim()
+        fingerprint = _digest(body)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and not explicit and entry[3] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                if entry[0] != fingerprint:
+                    raise KeyReused(f"{IDEMPOTENCY_HEADER} was already used with a different body")
+                self._entries.move_to_end(key)
+                return Claim(replay=(entry[1], entry[2]))
+            pending = self._pending.get(key)
+            if pending is not None:
+                if pending != fingerprint:
+                    raise KeyReused(f"{IDEMPOTENCY_HEADER} was already used with a different body")
+                raise RequestInProgress("the original request is still being processed")
+            if explicit and key in self._evicted:
+                return Claim(replay=success)
+            self._pending[key] = fingerprint
+        return Claim(self, key, fingerprint, explicit)
+
+    def _complete(self, claim, status, body):
+        expires = self._clock() + self.window
+        with self._lock:
+            self._pending.pop(claim._key, None)
+            self._entries[claim._key] = (claim._fingerprint, status, body, expires, claim._explicit)
+            while len(self._entries) > self.max_keys:
+                key, entry = self._entries.popitem(last=False)
+                if entry[4]:
+                    self._evicted.add(key)
+
+    def _release(self, claim):
+        with self._lock:
+            self._pending.pop(claim._key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def init_idempotency(app, settings):
+    cache = IdempotencyCache(settings.idempotency_max_keys, settings.idempotency_window,
+                             settings.idempotency_bloom_keys)
+    app.extensions["idempotency"] = cache
+    return cache
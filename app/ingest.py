@@ -0,0 +1,272 @@
+"""Request body readers for workout uploads.
+
+Bodies are read from the request stream in ``CHUNK_SIZE`` pieces and, when
+gzip-compressed, inflated as they arrive, so a large upload never has to be
+held in memory as a whole. Two bulk formats are accepted: NDJSON (one workout
+per line) and a single JSON array of workouts. Every body has a byte limit,
+counted after inflation, and parsing stops as soon as it is crossed; each
+record in a bulk body is also held to the single-workout limit. Each
+parsed workout is normalized by ``app.schema`` before it is accepted.
+"""
+import json
+import zlib
+
+from app.codec import loads
+from app.schema import InvalidWorkout, normalize
+
+CHUNK_SIZE = 64 * 1024
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+_decoder = json.JSONDecoder()
+
+
+class MalformedBody(ValueError):
+    """The upload as a whole cannot be parsed any further."""
+
+
+class TooManyRecords(ValueError):
+    pass
+
+
+class BodyTooLarge(ValueError):
+    pass
+
+
+class UnsupportedContentType(ValueError):
+    pass
+
+
+def read_body(stream, content_length, max_bytes):
+    """Read a whole (small) body, refusing anything over ``max_bytes`` without reading it all."""
+    if content_length is not None and content_length > max_bytes:
+        raise BodyTooLarge(f"body exceeds {max_bytes} bytes")
+    body = stream.read(max_bytes + 1)
+    if len(body) > max_bytes:
+        raise BodyTooLarge(f"body exceeds {max_bytes} bytes")
+    return body
+
+
+def parse_workout(body, overrides=None):
+    """The canonical workout in a single-workout JSON body, with ``overrides`` applied first."""
+    try:
+        record = loads(body)
+    except ValueError as exc:
+        raise MalformedBody(f"invalid JSON: {exc}")
+    if overrides and isinstance(record, dict):
+        record = {**record, **overrides}
+    return normalize(record)
+
+
+def iter_chunks(stream, content_encoding=None, max_bytes=None):
+    """Yield raw body chunks, inflating gzip/deflate on the fly.
+
+    ``max_bytes`` bounds the inflated size, so a small compressed body cannot
+    expand without limit.
+    """
+    encoding = (content_encoding or "identity").lower()
+    if encoding == "identity":
+        inflate = None
+    elif encoding in ("gzip", "x-gzip"):
+        inflate = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+    elif encoding == "deflate":
+        inflate = zlib.decompressobj()
+    else:
+        raise MalformedBody(f"unsupported Content-Encoding: {content_encoding}")
+    total = 0
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        for data in ([chunk] if inflate is None else _inflate(inflate, chunk, encoding)):
+            total += len(data)
+            if max_bytes is not None and total > max_bytes:
+                raise BodyTooLarge(f"body exceeds {max_bytes} bytes")
+            if data:
+                yield data
+    if inflate is not None:
+        if not inflate.eof:
+            raise MalformedBody(f"truncated {encoding} body")
+        tail = inflate.flush()
+        if tail:
+            yield tail
+
+
+def _inflate(inflate, chunk, encoding):
+    # Inflate in bounded pieces, so the size limit trips before a highly
+    # compressed chunk is expanded in full.
+    try:
+        yield inflate.decompress(chunk, CHUNK_SIZE)
+        while inflate.unconsumed_tail:
+            yield inflate.decompress(inflate.unconsumed_tail, CHUNK_SIZE)
+    except zlib.error as exc:
+        raise MalformedBody(f"invalid {encoding} body: {exc}")
+
+
+def iter_ndjson(chunks, max_record_bytes=None):
+    """Yield each non-blank line's parsed value, or the ``ValueError`` it raised.
+
+    A line is kept as the list of its pieces until its newline arrives, so
+    each byte is scanned once however long the line is. A line longer than
+    ``max_record_bytes`` ends the upload with ``BodyTooLarge``.
+    """
+    pieces, size = [], 0
+    for chunk in chunks:
+        start = 0
+        while True:
+            newline = chunk.find(b"\n", start)
+            if newline < 0:
+                break
+            size += newline - start
+            _check_record_size(size, max_record_bytes)
+            pieces.append(chunk[start:newline])
+            line = b"".join(pieces)
+            pieces, size = [], 0
+            if line.strip():
+                yield _parse_line(line)
+            start = newline + 1
+        if start < len(chunk):
+            size += len(chunk) - start
+            _check_record_size(size, max_record_bytes)
+            pieces.append(chunk[start:])
+    line = b"".join(pieces)
+    if line.strip():
+        yield _parse_line(line)
+
+
+def _check_record_size(size, max_record_bytes):
+    if max_record_bytes is not None and size > max_record_bytes:
+        raise BodyTooLarge(f"workout exceeds {max_record_bytes} bytes")
+
+
+def _parse_line(line):
+    try:
+        return loads(line)
+    except ValueError as exc:
+        return exc
+
+
+def iter_json_array(chunks, max_record_bytes=None):
+    """Yield the elements of a top-level JSON array as they are completed.
+
+    Any syntax error in the array ends the upload, because the position of the
+    next element can no longer be trusted. An element cut off at the end of
+    the buffer is only decoded again once its buffered text has doubled, so a
+    long element costs a constant number of passes rather than one per chunk.
+    An element longer than ``max_record_bytes`` characters (never more than
+    its bytes) ends the upload with ``BodyTooLarge``.
+    """
+    chunks = iter(chunks)
+    text = ""
+    pending = b""
+    pos = 0
+    state = "start"
+
+    def more(least=1, limit=None):
+        # Read until ``least`` characters were added or more than ``limit`` are
+        # buffered after ``pos``; False at the end of the body.
+        nonlocal text, pending, pos
+        pieces, size = [], 0
+        for chunk in chunks:
+            pending += chunk
+            try:
+                decoded = pending.decode("utf-8")
+                pending = b""
+            except UnicodeDecodeError as exc:
+                # Keep an incomplete multi-byte sequence for the next chunk.
+                if exc.reason != "unexpected end of data":
+                    raise MalformedBody("body is not valid UTF-8")
+                decoded, pending = pending[:exc.start].decode("utf-8"), pending[exc.start:]
+            pieces.append(decoded)
+            size += len(decoded)
+            if size >= least or (limit is not None and len(text) - pos + size > limit):
+                break
+        else:
+            if pending:
+                raise MalformedBody("body is not valid UTF-8")
+            if not pieces:
+                return False
+        text = text[pos:] + "".join(pieces)
+        pos = 0
+        return True
+
+    while True:
+        while pos < len(text) and text[pos] in " \t\r\n":
+            pos += 1
+        if pos == len(text):
+            if not more():
+                if state != "done":
+                    raise MalformedBody("unexpected end of JSON array")
+                return
+            continue
+        char = text[pos]
+        if state == "done":
+            raise MalformedBody("unexpected data after JSON array")
+        if state == "start":
+            if char != "[":
+                raise MalformedBody("expected a JSON array")
+            pos += 1
+            state = "first"
+            continue
+        if state in ("first", "after_value"):
+            if char == "]":
+                pos += 1
+                state = "done"
+                continue
+            if state == "after_value":
+                if char != ",":
+                    raise MalformedBody(f"expected ',' or ']' at offset {pos}")
+                pos += 1
+                state = "value"
+                continue
+        try:
+            value, end = _decoder.raw_decode(text, pos)
+        except ValueError:
+            # More than the limit is buffered, so the element is too long (or broken).
+            _check_record_size(len(text) - pos, max_record_bytes)
+            # The element may simply be cut off at the chunk boundary.
+            if more(len(text) - pos, max_record_bytes):
+                continue
+            raise MalformedBody(f"invalid JSON array element at offset {pos}")
+        if end == len(text) and more(1, max_record_bytes):
+            # A number at the end of the buffer may continue in the next chunk.
+            continue
+        _check_record_size(end - pos, max_record_bytes)
+        pos = end
+        state = "after_value"
+        yield value
+
+
+def iter_records(stream, content_type, content_encoding=None, max_bytes=None, max_record_bytes=None):
+    """Parsed records of a batch body; ``max_bytes`` bounds the body, ``max_record_bytes`` each record."""
+    chunks = iter_chunks(stream, content_encoding, max_bytes)
+    mimetype = (content_type or "").split(";")[0].strip().lower()
+    if mimetype in NDJSON_TYPES:
+        return iter_ndjson(chunks, max_record_bytes)
+    if mimetype == "application/json":
+        return iter_json_array(chunks, max_record_bytes)
+    raise UnsupportedContentType(f"unsupported Content-Type: {content_type}")
+
+
+def check_record(record):
+    """Return ``(canonical workout, None)``, or ``(None, error message)`` for an unacceptable one."""
+    if isinstance(record, ValueError):
+        return None, f"invalid JSON: {record}"
+    try:
+        return normalize(record), None
+    except InvalidWorkout as exc:
+        return None, str(exc)
+
+
+def read_batch(records, max_records):
+    """Split parsed records into ``(accepted, results)`` for the batch response."""
+    accepted, results = [], []
+    for index, record in enumerate(records):
+        if index >= max_records:
+            raise TooManyRecords(f"batch exceeds {max_records} workouts")
+        workout, error = check_record(record)
+        if error is None:
+            results.append({"index": index, "status": "accepted"})
+            accepted.append(workout)
+        else:
+            results.append({"index": index, "status": "rejected", "error": error})
+    return accepted, results
@@ -0,0 +1,330 @@
+"""Request metrics in the Prometheus text exposition format.
+
+Counters are sharded per thread: a request only touches its own thread's
+``Shard`` (a dict lookup, a bisect into the latency buckets and a few
+integer adds), with no lock and no shared cache line between threads. The
+GIL makes each shard single-writer, so ``/metrics`` just sums the shards at
+scrape time. Shards of finished threads (the threaded WSGI server may use one
+thread per connection) are folded into one retired shard when new threads
+register, so memory stays proportional to the live threads.
+
+Exported series, labelled by route rule, method and status code:
+
+* ``aceest_http_requests_total``
+* ``aceest_http_request_duration_seconds`` (histogram)
+* ``aceest_http_response_bytes_total``
+
+plus ``aceest_http_requests_in_flight`` and whatever gauges the caller adds
+at scrape time (the store size and version).
+
+The workers of ``app.server`` are separate processes, and a scrape reaches
+whichever one accepts it. So that every worker reports the same totals,
+they share a directory (``Metrics.share``): each writes its counters there
+every ``SHARE_INTERVAL`` seconds and at exit, and adds the other workers'
+files to its own counters at scrape time. The launcher folds the files of workers that
+exit into ``retired.json`` (``retire_shared``), so their counts are kept and
+the directory does not grow with restarts.
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from app.readiness import WARM_UP
+
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+UNMATCHED = "<unmatched>"
+# WSGI environ key holding the route rule a request matched.
+URL_RULE = "aceest.url_rule"
+
+# Seconds between a worker's writes of its counters to the shared directory.
+SHARE_INTERVAL = 1.0
+# Counters of exited workers in the shared directory, and which pids they hold.
+RETIRED = "retired.json"
+
+
+class Shard:
+    """One thread's counters: ``cells[(route, method, status)]`` and its in-flight count.
+
+    A cell holds one count per latency bucket (the last one is ``+Inf``),
+    then the latency sum and the bytes served.
+    """
+
+    __slots__ = ("cells", "in_flight")
+
+    def __init__(self):
+        self.cells = {}
+        self.in_flight = 0
+
+    def merge(self, other):
+        for key, cell in list(other.cells.items()):
+            mine = self.cells.get(key)
+            if mine is None:
+                self.cells[key] = list(cell)
+            else:
+                for i, value in enumerate(cell):
+                    mine[i] += value
+        self.in_flight += other.in_flight
+
+
+def _read_shard(path):
+    with open(path) as f:
+        data = json.load(f)
+    shard = Shard()
+    shard.cells = {(route, method, status): cell for route, method, status, *cell in data["cells"]}
+    shard.in_flight = data["in_flight"]
+    return shard, data.get("folded", [])
+
+
+def _write_shard(path, shard, folded=None):
+    data = {"cells": [[*key, *cell] for key, cell in shard.cells.items()], "in_flight": shard.in_flight}
+    if folded is not None:
+        data["folded"] = folded
+    # Replaced in one step, so a reader never sees half a file.
+    temporary = f"{path}.{threading.get_ident()}.tmp"
+    with open(temporary, "w") as f:
+        json.dump(data, f)
+    os.replace(temporary, path)
+
+
+def _shared_files(directory):
+    # Each process writes "<pid>-<start ns>.json", unique even when pids are reused.
+    return [name for name in os.listdir(directory) if name.endswith(".json") and name != RETIRED]
+
+
+def read_shared(directory, own=None):
+    """The counters of every process sharing ``directory`` but the one writing file ``own``, summed."""
+    shards = {}
+    for name in _shared_files(directory):
+        if name != own:
+            try:
+                shards[name] = _read_shard(os.path.join(directory, name))[0]
+            except FileNotFoundError:
+                # Folded into RETIRED meanwhile, which is read last.
+                pass
+    try:
+        total, folded = _read_shard(os.path.join(directory, RETIRED))
+    except FileNotFoundError:
+        total, folded = Shard(), []
+    folded = set(folded)
+    for name, shard in shards.items():
+        if name not in folded:
+            total.merge(shard)
+    return total
+
+
+def retire_shared(directory, pid):
+    """Fold the counters the exited process ``pid`` left in ``directory`` into ``RETIRED``.
+
+    Only the launcher calls this. ``RETIRED`` lists the file before it is
+    removed, so a concurrent ``read_shared`` counts the worker exactly once.
+    """
+    for name in _shared_files(directory):
+        if name.startswith(f"{pid}-"):
+            path = os.path.join(directory, name)
+            shard = _read_shard(path)[0]
+            try:
+                retired, folded = _read_shard(os.path.join(directory, RETIRED))
+            except FileNotFoundError:
+                retired, folded = Shard(), []
+            shard.in_flight = 0
+            retired.merge(shard)
+            _write_shard(os.path.join(directory, RETIRED), retired, folded + [name])
+            os.remove(path)
+
+
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._width = len(buckets) + 3
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards = []
+        self._retired = Shard()
+        self.directory = None
+        self._name = None
+
+    def _register(self):
+        shard = self._local.shard = Shard()
+        with self._lock:
+            self._sweep()
+            self._shards.append((threading.current_thread(), shard))
+        return shard
+
+    def _sweep(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                self._retired.merge(shard)
+        self._shards = live
+
+    def shard(self):
+        """The calling thread's shard."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            return self._register()
+
+    def observe(self, route, method, status, seconds, nbytes, shard=None):
+        """Count one finished request."""
+        cells = (shard or self.shard()).cells
+        key = (route, method, status)
+        cell = cells.get(key)
+        if cell is None:
+            cell = cells[key] = [0] * self._width
+        cell[bisect_left(self.buckets, seconds)] += 1
+        cell[-2] += seconds
+        cell[-1] += nbytes
+
+    def _local_snapshot(self):
+        total = Shard()
+        with self._lock:
+            self._sweep()
+            total.merge(self._retired)
+            for _, shard in self._shards:
+                total.merge(shard)
+        return total
+
+    def snapshot(self):
+        """All shards summed into one ``Shard``, with the other processes' if shared."""
+        total = self._local_snapshot()
+        if self.directory is not None:
+            total.merge(read_shared(self.directory, self._name))
+        return total
+
+    def share(self, directory):
+        """Sum the counters of every process sharing ``directory`` (see the module docstring)."""
+        self.directory = directory
+        self._name = f"{os.getpid()}-{time.time_ns()}.json"
+        path = os.path.join(directory, self._name)
+
+        def write():
+            _write_shard(path, self._local_snapshot())
+
+        def keep_writing():
+            while True:
+                time.sleep(SHARE_INTERVAL)
+                write()
+
+        write()
+        threading.Thread(target=keep_writing, name="aceest-metrics", daemon=True).start()
+        atexit.register(write)
+
+    def render(self, gauges=()):
+        """The exposition text; ``gauges`` are extra ``(name, help, value)`` triples."""
+        total = self.snapshot()
+        cells = sorted(total.cells.items())
+        lines = [
+            "# HELP aceest_http_requests_total HTTP requests served.",
+            "# TYPE aceest_http_requests_total counter",
+        ]
+        for key, cell in cells:
+            lines.append(f"aceest_http_requests_total{{{_labels(key)}}} {sum(cell[:-2])}")
+        lines += [
+            "# HELP aceest_http_request_duration_seconds Time from request start to response.",
+            "# TYPE aceest_http_request_duration_seconds histogram",
+        ]
+        for key, cell in cells:
+            labels = _labels(key)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), cell):
+                cumulative += count
+                le = bound if isinstance(bound, str) else repr(float(bound))
+                lines.append(f'aceest_http_request_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+            lines.append(f"aceest_http_request_duration_seconds_sum{{{labels}}} {cell[-2]!r}")
+            lines.append(f"aceest_http_request_duration_seconds_count{{{labels}}} {cumulative}")
+        lines += [
+            "# HELP aceest_http_response_bytes_total Response body bytes sent, after compression.",
+            "# TYPE aceest_http_response_bytes_total counter",
+        ]
+        for key, cell in cells:
+            lines.append(f"aceest_http_response_bytes_total{{{_labels(key)}}} {cell[-1]}")
+        lines += [
+            "# HELP aceest_http_requests_in_flight Requests being processed.",
+            "# TYPE aceest_http_requests_in_flight gauge",
+            f"aceest_http_requests_in_flight {total.in_flight}",
+        ]
+        for name, help_text, value in gauges:
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(key):
+    route, method, status = key
+    return f'route="{_escape(route)}",method="{method}",status="{status}"'
+
+
+def store_gauges(store):
+    view = store.view()
+    return [
+        ("aceest_store_workouts", "Workouts in the store.", len(view)),
+        ("aceest_store_version", "Highest committed sequence number.", view.version),
+    ]
+
+
+def init_metrics(app):
+    """Instrument every request of ``app``.
+
+    The counting wraps ``app.wsgi_app`` rather than adding request hooks:
+    Flask dispatches every hook through ``ensure_sync`` and the ``g`` and
+    ``request`` proxies, which cost far more than the counting itself. The
+    wrapper sees the final response, compressed or not. Flask has dropped
+    the request by then, so the app's request class also keeps the matched
+    rule in the environ (``URL_RULE``). Warm-up requests (see
+    ``app.readiness``) are not counted.
+    """
+    metrics = Metrics()
+    app.extensions["metrics"] = metrics
+    wsgi_app = app.wsgi_app
+
+    class Request(app.request_class):
+        @property
+        def url_rule(self):
+            return self.environ.get(URL_RULE)
+
+        @url_rule.setter
+        def url_rule(self, rule):
+            self.environ[URL_RULE] = rule
+
+    app.request_class = Request
+
+    @functools.wraps(wsgi_app)
+    def counting(environ, start_response):
+        if environ.get(WARM_UP):
+            return wsgi_app(environ, start_response)
+        current = app.extensions["metrics"]
+        shard = current.shard()
+        shard.in_flight += 1
+        started = time.perf_counter()
+        response = []
+
+        def recording(status, headers, exc_info=None):
+            response.append((status, headers))
+            return start_response(status, headers) if exc_info is None else start_response(status, headers, exc_info)
+
+        try:
+            body = wsgi_app(environ, recording)
+            status, headers = response[-1]
+            rule = environ.get(URL_RULE)
+            nbytes = next((int(value) for name, value in headers if name.lower() == "content-length"), 0)
+            current.observe(rule.rule if rule is not None else UNMATCHED, environ["REQUEST_METHOD"],
+                            int(status[:3]), time.perf_counter() - started, nbytes, shard)
+            return body
+        finally:
+            shard.in_flight -= 1
+
+    app.wsgi_app = counting
+    return metrics
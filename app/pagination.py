@@ -0,0 +1,143 @@
+import base64
+import json
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+
+from flask import current_app, request
+
+from app.search import fold
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Longest search query accepted, in characters.
+MAX_QUERY_LENGTH = 100
+# Bound on ``from``/``to`` in epoch seconds, far beyond any real workout.
+MAX_TIMESTAMP = 2 ** 40
+
+
+class InvalidPageRequest(ValueError):
+    pass
+
+
+def encode_cursor(seq):
+    raw = json.dumps({"after": seq}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        after = json.loads(raw)["after"]
+    except (ValueError, TypeError, KeyError):
+        raise InvalidPageRequest("invalid cursor")
+    if not isinstance(after, int) or isinstance(after, bool) or after < 0:
+        raise InvalidPageRequest("invalid cursor")
+    return after
+
+
+def page_args(args):
+    """Parse ``cursor`` and ``limit`` query arguments into ``(after_seq, limit)``."""
+    cursor = args.get("cursor")
+    after = decode_cursor(cursor) if cursor else 0
+    try:
+        limit = int(args.get("limit", DEFAULT_LIMIT))
+    except ValueError:
+        raise InvalidPageRequest("limit must be an integer")
+    if not 1 <= limit <= MAX_LIMIT:
+        raise InvalidPageRequest(f"limit must be between 1 and {MAX_LIMIT}")
+    return after, limit
+
+
+def _time_arg(value, name):
+    message = f"{name} must be epoch seconds or an ISO 8601 date or time"
+    try:
+        seconds = float(value)
+    except ValueError:
+        pass
+    else:
+        if not abs(seconds) < MAX_TIMESTAMP:
+            raise InvalidPageRequest(message)
+        return int(seconds)
+    try:
+        moment = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidPageRequest(message)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def range_args(args):
+    """Parse ``from`` and ``to`` into ``(start, end)``, or ``None`` when neither is given.
+
+    Both take epoch seconds or ISO 8601 (naive times are UTC); ``from`` is
+    inclusive and ``to`` exclusive, so consecutive weeks never overlap.
+    """
+    if "from" not in args and "to" not in args:
+        return None
+    start = _time_arg(args["from"], "from") if "from" in args else 0
+    end = _time_arg(args["to"], "to") if "to" in args else None
+    return start, end
+
+
+def search_args(args):
+    """Parse the ``q`` search argument into its folded words."""
+    query = args.get("q", "")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise InvalidPageRequest(f"q must be at most {MAX_QUERY_LENGTH} characters")
+    words = [word for word in (fold(part) for part in query.split()) if word]
+    if not words:
+        raise InvalidPageRequest("q must contain a letter or digit")
+    return words
+
+
+def listing_sources(view, args, member=None):
+    """``(all_json, page_json)`` of the listing ``args`` select from ``view``.
+
+    With ``from``/``to`` that is the time range, ordered by timestamp;
+    otherwise all workouts (or ``member``'s) in insertion order.
+    """
+    span = range_args(args)
+    if span is not None:
+        return (lambda: view.range_json(*span, member),
+                lambda after, limit: view.range_page_json(*span, after, limit, member))
+    if member is None:
+        return view.all_json, view.page_json
+    return (lambda: view.member_all_json(member),
+            lambda after, limit: view.member_page_json(member, after, limit))
+
+
+def search_sources(view, args, member=None):
+    """``(all_json, page_json)`` of the workouts matching the ``q`` search argument, in insertion order."""
+    words = search_args(args)
+    return (lambda: view.search_json(words, member),
+            lambda after, limit: view.search_page_json(words, after, limit, member))
+
+
+def page_body(entries, limit, key="workouts"):
+    """Render a JSON page and return ``(body, next_cursor)``.
+
+    ``entries`` should hold up to ``limit + 1`` ``(seq, encoded record)``
+    pairs; the extra one only tells us whether another page exists.
+    """
+    entries, more = entries[:limit], len(entries) > limit
+    next_cursor = encode_cursor(entries[-1][0]) if more else None
+    body = b'{"%s":[%s],"next_cursor":%s}' % (
+        key.encode(), b",".join(encoded for _, encoded in entries), json.dumps(next_cursor).encode())
+    return body, next_cursor
+
+
+def next_link(base_url, args, next_cursor, limit):
+    """``Link`` header value pointing at the page after ``next_cursor``."""
+    query = args.to_dict()
+    query.update(cursor=next_cursor, limit=str(limit))
+    return f'<{base_url}?{urlencode(query)}>; rel="next"'
+
+
+def paginated_response(entries, limit, key="workouts"):
+    """Build a JSON page with the next cursor in the body and a ``Link`` header."""
+    body, next_cursor = page_body(entries, limit, key)
+    response = current_app.response_class(body, mimetype="application/json")
+    if next_cursor is not None:
+        response.headers["Link"] = next_link(request.base_url, request.args, next_cursor, limit)
+    return response
@@ -0,0 +1,137 @@
+"""Per-client token-bucket rate limiting for write endpoints.
+
+Each limited route has its own refill rate (requests per second) and burst.
+A client gets one bucket per route, keyed by ``client_key``. A request takes
+one token; with none left it is answered ``429 Too Many Requests`` and a
+``Retry-After`` of the seconds until the next token.
+
+``client_key`` is the connection's address unless settings say otherwise.
+Behind an ingress or a NAT that address is the proxy's, shared by every
+client, so ``trusted_proxies`` names how many proxies append to
+``X-Forwarded-For`` and the address the outermost of them saw is used. A
+client's own ``X-Client-ID`` is believed only with ``trust_client_id``,
+since a client that picks its own key can pick a new one for every request.
+
+Buckets live in an ``OrderedDict`` in least-recently-used order, so every
+request is O(1): one lookup, one refill computed from the elapsed time, one
+move to the end. A bucket idle for ``burst / rate`` seconds has refilled
+completely and is indistinguishable from a new one, so it is dropped from
+the front on the way; ``max_clients`` caps the table even under a flood of
+distinct clients.
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from flask import jsonify, request
+
+CLIENT_HEADER = "X-Client-ID"
+FORWARDED_HEADER = "X-Forwarded-For"
+
+
+class RateLimiter:
+    """Token buckets of one route, keyed by client."""
+
+    def __init__(self, rate, burst, max_clients=100_000, clock=time.monotonic):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._clock = clock
+        self._idle = burst / rate
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        """Take a token for ``key``; return 0 if allowed, else the seconds to wait."""
+        now = self._clock()
+        with self._lock:
+            buckets = self._buckets
+            bucket = buckets.get(key)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                buckets.move_to_end(key)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / self.rate
+            buckets[key] = (tokens, now)
+            while len(buckets) > self.max_clients or now - next(iter(buckets.values()))[1] >= self._idle:
+                buckets.popitem(last=False)
+        return wait
+
+    def __len__(self):
+        return len(self._buckets)
+
+
+def parse_rate_limits(spec):
+    """Parse ``"endpoint=rate:burst,..."`` into ``{endpoint: (rate, burst)}``; ``"none"`` disables limits."""
+    limits = {}
+    if spec.strip().lower() == "none":
+        return limits
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        try:
+            endpoint, values = item.split("=")
+            rate, burst = values.split(":")
+            limits[endpoint.strip()] = (float(rate), int(burst))
+        except ValueError:
+            raise ValueError(f"Invalid rate limit {item!r}; expected endpoint=rate:burst")
+    return limits
+
+
+class RateLimits:
+    """The limiters of every limited endpoint, built from ``Settings``."""
+
+    def __init__(self, settings, clock=time.monotonic):
+        self.limiters = {
+            endpoint: RateLimiter(rate, burst, settings.rate_limit_max_clients, clock)
+            for endpoint, (rate, burst) in parse_rate_limits(settings.rate_limits).items()
+        }
+
+    def check(self, endpoint, client):
+        """Seconds ``client`` must wait before calling ``endpoint`` (0 when allowed)."""
+        limiter = self.limiters.get(endpoint)
+        return limiter.acquire(client) if limiter is not None else 0.0
+
+
+def client_key(headers, remote_addr, settings):
+    """The key a request's client is known by (see the module docstring)."""
+    if settings.trust_client_id:
+        client = headers.get(CLIENT_HEADER)
+        if client:
+            return client
+    if settings.trusted_proxies:
+        hops = [hop.strip() for hop in headers.get(FORWARDED_HEADER, "").split(",")]
+        # Entries left of the ones our proxies appended are the client's to make up.
+        if len(hops) >= settings.trusted_proxies and hops[-settings.trusted_proxies]:
+            return hops[-settings.trusted_proxies]
+    return remote_addr or ""
+
+
+def retry_after(wait):
+    """``Retry-After`` header value: whole seconds, rounded up."""
+    return str(max(1, math.ceil(wait)))
+
+
+def init_rate_limits(app, settings):
+    """Register a ``before_request`` hook answering 429 for clients over their limit."""
+    limits = RateLimits(settings)
+    app.extensions["rate_limits"] = limits
+
+    @app.before_request
+    def limit_rate():
+        client = client_key(request.headers, request.remote_addr, settings)
+        wait = app.extensions["rate_limits"].check(request.endpoint, client)
+        if wait:
+            response = jsonify({"error": "rate limit exceeded"})
+            response.status_code = 429
+            response.headers["Retry-After"] = retry_after(wait)
+            return response
+        return None
+
+    return limits
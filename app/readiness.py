@@ -0,0 +1,198 @@
+"""Liveness, readiness and the warm-up that readiness waits for.
+
+``/healthz`` answers as soon as the process serves HTTP: it only says the
+process is alive. ``/readyz`` answers ``503`` until warm-up has finished,
+so a load balancer or Kubernetes readiness probe holds traffic back from a
+new replica until its first requests are as fast as the rest. Warm-up runs
+on a background thread, in timed phases:
+
+* ``store``: loading the store (replaying its snapshot and log, or opening
+  the database). Until it is done, every route but ``LIVE_PATHS`` answers
+  ``503`` with ``Retry-After`` (``init_store_gate``), so the probes answer
+  while a large log replays.
+* ``indexes``: ``BaseStore.warm_up``, which builds whatever the backend
+  builds on first use (SQLite's page cache) and reads a view.
+* ``routes``: one paged request to each hot route (``WARM_UP_PATHS`` and
+  a member's routes), with the response compressed. That runs the codec,
+  fills the compressed-response cache and loads lazily imported modules.
+
+Warm-up requests carry ``WARM_UP`` in their environ and are left out of
+the request metrics. ``/readyz`` reports the seconds each phase took and
+``/metrics`` the total, so cold-start regressions show up across deploys.
+
+A worker forked before warm-up finished warms itself up again. The
+launcher in ``app.server`` waits for warm-up before it forks preloaded
+workers, so they start ready.
+"""
+import contextlib
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from urllib.parse import quote
+
+logger = logging.getLogger(__name__)
+
+# WSGI environ key (ASGI scope key) marking a warm-up request.
+WARM_UP = "aceest.warm_up"
+# Paths answered before the store is open, and the answer to the others.
+LIVE_PATHS = ("/healthz", "/readyz", "/metrics")
+RETRY_AFTER = "1"
+LOADING = json.dumps({"error": "the store is still loading"})
+# Hot routes requested once during warm-up, besides a member's routes. Only
+# bounded requests: an unpaged listing reads the whole store, and would make
+# warm-up, and so readiness, take longer the more workouts there are.
+WARM_UP_PATHS = ("/", "/view?limit=100", "/stats", "/search?q=push&limit=100", "/changes?limit=100", "/metrics")
+# Member routes requested for the first member in the store.
+MEMBER_PATHS = ("/users/{}/workouts?limit=100", "/users/{}/stats")
+# Compressed, as a browser or API gateway would ask.
+WARM_UP_HEADERS = {"Accept-Encoding": "gzip"}
+
+
+def warm_up_paths(store):
+    """The paths warm-up requests, with ``MEMBER_PATHS`` for the store's first member, if any."""
+    members = store.view().members()
+    member = next((m for m in members if m is not None and "/" not in m), None)
+    if member is None:
+        return list(WARM_UP_PATHS)
+    return list(WARM_UP_PATHS) + [path.format(quote(member, safe="")) for path in MEMBER_PATHS]
+
+
+class Readiness:
+    """Warm-up progress of one process: the seconds of each finished phase, then ready.
+
+    ``phase`` is the running phase. ``error`` is set if a phase failed,
+    and the process then stays unready.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.phase = None
+        self.error = None
+        self._done = threading.Event()
+
+    def record(self, phase, seconds):
+        self.phases[phase] = seconds
+
+    @contextlib.contextmanager
+    def timed(self, phase):
+        """Time the ``with`` block as ``phase``; an exception from it fails warm-up."""
+        self.phase = phase
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception as exc:
+            logger.exception("warm-up phase %s failed", phase)
+            self.error = f"{phase}: {exc}"
+            self._done.set()
+            raise
+        self.record(phase, time.perf_counter() - started)
+
+    def run(self, phases):
+        """Run ``(name, fn)`` phases in order, timing each; ready once all of them succeed."""
+        try:
+            for name, fn in phases:
+                with self.timed(name):
+                    fn()
+        except Exception:
+            return
+        self.finish()
+
+    def finish(self):
+        self.phase = None
+        self._done.set()
+        logger.info("ready after %.3f s of warm-up (%s)", self.seconds,
+                    ", ".join(f"{name} {seconds:.3f} s" for name, seconds in self.phases.items()))
+
+    @property
+    def ready(self):
+        return self._done.is_set() and self.error is None
+
+    @property
+    def seconds(self):
+        """Total warm-up seconds so far, including the store load."""
+        return sum(self.phases.values())
+
+    def wait(self, timeout=None):
+        """Block until warm-up ends or ``timeout`` passes; returns whether the process is ready."""
+        self._done.wait(timeout)
+        return self.ready
+
+    def body(self):
+        """The ``/readyz`` response body."""
+        phases = {name: round(seconds, 6) for name, seconds in self.phases.items()}
+        if self.ready:
+            return {"status": "ready", "warm_up_seconds": round(self.seconds, 6), "phases": phases}
+        body = {"status": "warming up", "phase": self.phase, "phases": phases,
+                "elapsed_seconds": round(time.perf_counter() - self.started, 6)}
+        if self.error is not None:
+            body["status"] = "failed"
+            body["error"] = self.error
+        return body
+
+    def gauges(self):
+        """``/metrics`` gauges: whether the process is ready and how long warm-up took."""
+        return [
+            ("aceest_ready", "1 once warm-up has finished, else 0.", int(self.ready)),
+            ("aceest_warm_up_seconds", "Seconds from loading the store to ready.", self.seconds),
+        ]
+
+
+def warm_routes(app, store):
+    """Request each warm-up path once through ``app``'s test client."""
+    client = app.test_client()
+    for path in warm_up_paths(store):
+        response = client.get(path, headers=WARM_UP_HEADERS, environ_overrides={WARM_UP: True})
+        response.close()
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {path} answered {response.status_code}")
+
+
+def start_warm_up(readiness, app, open_store):
+    opened = []
+    thread = threading.Thread(target=readiness.run, name="aceest-warm-up", daemon=True, args=([
+        ("store", lambda: opened.append(open_store())),
+        ("indexes", lambda: opened[0].warm_up()),
+        ("routes", lambda: warm_routes(app, opened[0])),
+    ],))
+    thread.start()
+    return thread
+
+
+def _after_fork(ref, app, open_store):
+    readiness = ref()
+    if readiness is not None and not readiness.ready and readiness.error is None:
+        # The warm-up thread did not survive the fork.
+        readiness.started = time.perf_counter()
+        start_warm_up(readiness, app, open_store)
+
+
+def init_store_gate(app, is_open):
+    """Answer requests outside ``LIVE_PATHS`` with ``503`` and ``Retry-After`` until ``is_open()``.
+
+    It wraps ``app.wsgi_app``, so call it before ``init_metrics`` for the
+    turned-away requests to be counted.
+    """
+    wsgi_app = app.wsgi_app
+
+    @functools.wraps(wsgi_app)
+    def gated(environ, start_response):
+        if is_open() or environ.get("PATH_INFO") in LIVE_PATHS:
+            return wsgi_app(environ, start_response)
+        response = app.response_class(LOADING, 503, {"Retry-After": RETRY_AFTER}, mimetype="application/json")
+        return response(environ, start_response)
+
+    app.wsgi_app = gated
+
+
+def init_readiness(app, open_store):
+    """Open the store with ``open_store()`` and warm it and ``app`` up, in the background."""
+    readiness = Readiness()
+    app.extensions["readiness"] = readiness
+    start_warm_up(readiness, app, open_store)
+    os.register_at_fork(after_in_child=functools.partial(_after_fork, weakref.ref(readiness), app, open_store))
+    return readiness
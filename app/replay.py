@@ -0,0 +1,199 @@
+"""Replay captured traffic (``app.capture``) against one or two running builds.
+
+    python -m app.replay CAPTURE_DIR http://127.0.0.1:5001 http://127.0.0.1:5002 --speed 10
+
+Requests are sent in capture order, at their recorded pace divided by
+``--speed``. ``--speed 0`` sends them as fast as ``--concurrency``
+allows. Each target gets every request on its own schedule, so a slow build
+does not hold the other back. Requests keep their captured headers and
+client key, sent as ``X-Client-ID``. Start the targets with
+``ACEEST_TRUST_CLIENT_ID=1`` and rate limits and idempotency keys behave
+as they did live.
+Event streams never end and are skipped, as are bodies the capture cut
+short. Point both targets at stores loaded with the same data, or the
+listings will differ from the first request.
+
+The report gives, per route, the latency percentiles of each target next
+to the ones the capture recorded. It then lists the responses that differ
+between the two targets. Compressed bodies are decompressed and JSON
+bodies parsed, and keys named by ``--ignore`` are left out, the store
+epoch by default. Each difference is shown as its first differing JSON
+path with both values side by side.
+
+To compare two commits locally::
+
+    git worktree add /tmp/old <commit>
+    (cd /tmp/old && ACEEST_BIND=127.0.0.1:5001 python -m app.server) &
+    ACEEST_BIND=127.0.0.1:5002 python -m app.server &
+    python -m app.replay capture/ http://127.0.0.1:5001 http://127.0.0.1:5002 --speed 0
+"""
+import argparse
+import http.client
+import time
+import zlib
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from app.capture import read_capture
+from app.codec import loads
+from app.ratelimit import CLIENT_HEADER
+
+Result = namedtuple("Result", "status body seconds")
+# What a request that never got a response answers with.
+FAILED = 0
+
+
+def skipped(entry):
+    return entry["truncated"] or "text/event-stream" in entry["headers"].get("Accept", "")
+
+
+def send(target, entry, body, timeout=30.0):
+    """Send one captured request to ``target`` (``http://host:port``); returns a ``Result``."""
+    url = urlsplit(target)
+    headers = dict(entry["headers"])
+    if entry.get("client") and CLIENT_HEADER not in headers:
+        headers[CLIENT_HEADER] = entry["client"]
+    started = time.perf_counter()
+    conn = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=timeout)
+    try:
+        conn.request(entry["method"], url.path.rstrip("/") + entry["path"], body or None, headers)
+        response = conn.getresponse()
+        payload = response.read()
+        if response.getheader("Content-Encoding") in ("gzip", "deflate"):
+            # 32 + MAX_WBITS reads either a gzip or a zlib header.
+            payload = zlib.decompress(payload, 32 + zlib.MAX_WBITS)
+        return Result(response.status, payload, time.perf_counter() - started)
+    except OSError as exc:
+        return Result(FAILED, str(exc).encode(), time.perf_counter() - started)
+    finally:
+        conn.close()
+
+
+def replay(captured, targets, speed=1.0, concurrency=16, limit=None):
+    """Send ``(entry, body)`` pairs to every target; returns ``(entry, [Result per target])`` pairs and skips."""
+    pools = [ThreadPoolExecutor(concurrency, thread_name_prefix="aceest-replay") for _ in targets]
+    sent, skips = [], 0
+    started = first = None
+    try:
+        for entry, body in captured:
+            if limit is not None and len(sent) >= limit:
+                break
+            if skipped(entry):
+                skips += 1
+                continue
+            if first is None:
+                started, first = time.perf_counter(), entry["t"]
+            elif speed:
+                delay = started + (entry["t"] - first) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            sent.append((entry, [pool.submit(send, target, entry, body) for pool, target in zip(pools, targets)]))
+    finally:
+        for pool in pools:
+            pool.shutdown(wait=True)
+    return [(entry, [future.result() for future in futures]) for entry, futures in sent], skips
+
+
+def _without(value, ignore):
+    if isinstance(value, dict):
+        return {key: _without(item, ignore) for key, item in value.items() if key not in ignore}
+    if isinstance(value, list):
+        return [_without(item, ignore) for item in value]
+    return value
+
+
+def _first_difference(left, right, path="$"):
+    if type(left) is not type(right):
+        return path, left, right
+    if isinstance(left, dict):
+        for key in list(left) + [key for key in right if key not in left]:
+            if key not in left or key not in right:
+                return f"{path}.{key}", left.get(key), right.get(key)
+            found = _first_difference(left[key], right[key], f"{path}.{key}")
+            if found is not None:
+                return found
+        return None
+    if isinstance(left, list):
+        for i, (a, b) in enumerate(zip(left, right)):
+            found = _first_difference(a, b, f"{path}[{i}]")
+            if found is not None:
+                return found
+        if len(left) != len(right):
+            return f"{path}.length", len(left), len(right)
+        return None
+    return None if left == right else (path, left, right)
+
+
+def difference(left, right, ignore=("epoch",)):
+    """Where two ``Result``\\ s differ, as ``(where, left value, right value)``, or ``None``."""
+    if left.status != right.status:
+        return "status", left.status, right.status
+    if left.body == right.body:
+        return None
+    try:
+        a, b = loads(left.body), loads(right.body)
+    except ValueError:
+        return "body", left.body[:60], right.body[:60]
+    return _first_difference(_without(a, set(ignore)), _without(b, set(ignore)))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else float("nan")
+
+
+def _clip(value, width):
+    text = value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+    return text if len(text) <= width else text[:width - 3] + "..."
+
+
+def report(results, targets, skips=0, ignore=("epoch",), show=10):
+    """The side-by-side report of ``replay``'s results, as text."""
+    labels = ["captured"] + [urlsplit(target).netloc or target for target in targets]
+    latencies = defaultdict(lambda: [[] for _ in labels])
+    for entry, responses in results:
+        route = latencies[f"{entry['method']} {entry['route']}"]
+        route[0].append(entry["seconds"])
+        for i, result in enumerate(responses, 1):
+            route[i].append(result.seconds)
+    lines = [f"{'route':<36} {'source':<22} {'count':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}"]
+    for route in sorted(latencies):
+        for label, values in zip(labels, latencies[route]):
+            lines.append(f"{_clip(route, 36):<36} {_clip(label, 22):<22} {len(values):6} "
+                         + " ".join(f"{percentile(values, pct) * 1e3:8.2f}" for pct in (50, 90, 99, 100)))
+            route = ""
+    failed = sum(result.status == FAILED for _, responses in results for result in responses)
+    lines.append(f"\n{len(results)} requests replayed, {skips} skipped, {failed} without a response")
+    if len(targets) == 2:
+        diffs = [(entry, found) for entry, (a, b) in results
+                 for found in [difference(a, b, ignore)] if found is not None]
+        statuses = sum(where == "status" for _, (where, _, _) in diffs)
+        lines.append(f"{len(diffs)} responses differ: {statuses} in status, {len(diffs) - statuses} in body")
+        if diffs:
+            lines.append(f"\n{'request':<40} {'where':<28} {_clip(labels[1], 30):<30} | {_clip(labels[2], 30)}")
+        for entry, (where, a, b) in diffs[:show]:
+            lines.append(f"{_clip(entry['method'] + ' ' + entry['path'], 40):<40} {_clip(where, 28):<28} "
+                         f"{_clip(a, 30):<30} | {_clip(b, 30)}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture", help="directory of capture files (ACEEST_CAPTURE_DIR)")
+    parser.add_argument("targets", nargs="+", help="one or two base URLs, such as http://127.0.0.1:5001")
+    parser.add_argument("--speed", type=float, default=1.0, help="pace multiplier; 0 sends as fast as possible")
+    parser.add_argument("--concurrency", type=int, default=16, help="requests in flight per target")
+    parser.add_argument("--limit", type=int, help="replay at most this many requests")
+    parser.add_argument("--ignore", default="epoch", help="comma-separated JSON keys left out of comparisons")
+    parser.add_argument("--show", type=int, default=20, help="differences listed")
+    args = parser.parse_args()
+    if len(args.targets) > 2:
+        parser.error("give one or two targets")
+    results, skips = replay(read_capture(args.capture), args.targets, args.speed, args.concurrency, args.limit)
+    ignore = tuple(key for key in args.ignore.split(",") if key)
+    print(report(results, args.targets, skips, ignore, args.show))
+
+
+if __name__ == "__main__":
+    main()
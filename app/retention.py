@@ -0,0 +1,155 @@
+"""Retention: old workouts rolled up into daily totals.
+
+Nobody needs every session from years ago, but without a policy the store,
+and the cost of a full listing, grow with all of history. With
+``retention_days`` set, a background ``Compactor`` replaces every workout
+older than that with one rollup per member, UTC day and category::
+
+    {"rollup": "day", "date": "2024-01-05", "category": "Workout",
+     "sessions": 3, "duration": 95, "calories": 812.5,
+     "timestamp": 1704412800, "regn_id": "M1"}
+
+``duration`` and ``calories`` are the day's totals and ``timestamp`` is
+the start of the day. A rollup takes the sequence number of the newest
+workout it replaces, so it sits where that workout was: listings, paging
+cursors, time ranges and per-member reads keep working and simply return
+rollups in place of old detail. ``/stats`` counts a rollup as its
+``sessions``, so totals do not change. Search only covers detail, since
+rollups keep no exercise names.
+
+Only whole days are compacted, and a workout that arrives for an already
+compacted day is folded into that day's rollup on the next pass. Each
+compaction bumps the store's ``generation``, which is part of every ETag,
+because a listing can change without any new write.
+
+A failed pass is logged and retried on the next one. ``/metrics`` shows
+the passes failed in a row and when the last one succeeded.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from app.stats import contribution
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+ROLLUP_KIND = "day"
+
+
+def is_rollup(record):
+    return isinstance(record, dict) and "rollup" in record
+
+
+def retention_cutoff(now, retention_days):
+    """Start of the oldest UTC day kept in detail: workouts before it are compacted."""
+    return int(now - retention_days * DAY) // DAY * DAY
+
+
+class Rollups:
+    """Daily rollups being built: ``(member, day, category)`` to ``[sessions, minutes, calories, seq]``."""
+
+    def __init__(self):
+        self._days = {}
+
+    def add(self, seq, record, member, timestamp):
+        """Fold ``record`` (a workout or an earlier rollup) into its day."""
+        category, sessions, minutes, calories = contribution(record)
+        key = (member, timestamp // DAY * DAY, category)
+        sums = self._days.get(key)
+        if sums is None:
+            self._days[key] = [sessions, minutes, calories, seq]
+        else:
+            sums[0] += sessions
+            sums[1] += minutes
+            sums[2] += calories
+            sums[3] = max(sums[3], seq)
+
+    def keys(self):
+        return list(self._days)
+
+    def records(self):
+        """``(seq, rollup)`` pairs in sequence order."""
+        rollups = []
+        for (member, day, category), (sessions, minutes, calories, seq) in self._days.items():
+            rollups.append((seq, {
+                "rollup": ROLLUP_KIND,
+                "date": datetime.fromtimestamp(day, timezone.utc).strftime("%Y-%m-%d"),
+                "category": category,
+                "sessions": sessions,
+                "duration": minutes,
+                "calories": calories,
+                "timestamp": day,
+                "regn_id": member,
+            }))
+        rollups.sort(key=lambda pair: pair[0])
+        return rollups
+
+    def __len__(self):
+        return len(self._days)
+
+
+class Compactor:
+    """Background thread compacting ``store`` on start and then every ``interval`` seconds.
+
+    Each pass calls ``store.compact(before)``; backends do the work without
+    holding up readers or writers for more than a short swap or batch.
+    """
+
+    def __init__(self, store, retention_days, interval=3600.0, clock=time.time):
+        self.store = store
+        self.retention_days = retention_days
+        self.interval = interval
+        self._clock = clock
+        self._stopped = threading.Event()
+        self._thread = None
+        # Passes failed since the last one that succeeded, and when that was.
+        self.failures = 0
+        self.last_success = 0.0
+
+    def run_once(self):
+        """Compact everything past retention now; returns the number of workouts rolled up."""
+        return self.store.compact(retention_cutoff(self._clock(), self.retention_days))
+
+    def _pass(self):
+        try:
+            self.run_once()
+        except Exception:
+            # A failed pass leaves the data as it was; the next one retries.
+            self.failures += 1
+            logger.exception("compaction failed (%d in a row)", self.failures)
+        else:
+            self.failures = 0
+            self.last_success = time.time()
+
+    def _run(self):
+        while True:
+            self._pass()
+            if self._stopped.wait(self.interval):
+                return
+
+    def gauges(self):
+        return [
+            ("aceest_compaction_failures", "Compaction passes failed since the last one that succeeded.",
+             self.failures),
+            ("aceest_compaction_last_success_seconds", "Unix time the last compaction pass succeeded.",
+             self.last_success),
+        ]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="workout-compactor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def init_retention(store, settings):
+    """Start a ``Compactor`` for ``store`` when ``settings.retention_days`` is set, else return ``None``."""
+    if settings.retention_days <= 0:
+        return None
+    return Compactor(store, settings.retention_days, settings.compact_interval).start()
@@ -0,0 +1,182 @@
+"""Validation and normalization of workouts at ingest.
+
+Every write path runs records through ``normalize`` before they reach the
+store, so the store, the log and every listing only ever hold one compact
+shape, in this key order::
+
+    {"exercise": str, "duration": int, "category": str, "calories": float,
+     "timestamp": int, "regn_id": str | null}
+
+Exercise and category names are rewritten to their canonical spelling in
+``app.vocabulary`` (new exercise names by ``canonicalize``, once the whole
+request is valid), so ``"push ups"`` and ``"PUSH-UPS"`` are both stored as
+``"Push-ups"`` and ``"warmup"`` as ``"Warm-up"``. ``timestamp`` is in epoch
+seconds. The desktop app's
+``"%Y-%m-%d %H:%M:%S"`` strings (read as UTC) and epoch numbers are both
+accepted, and it defaults to the time of ingest. ``workout`` is accepted
+as an alias of ``exercise``, since older clients send it. A missing
+``category`` means ``Workout``. Missing ``calories`` are estimated with
+the desktop app's MET formula for a 70 kg member. Unknown fields are
+rejected rather than silently stored.
+
+``compile_schema`` turns the ``FIELDS`` table into one validator function
+up front: the alias map, the allowed keys and the per-field coercers are
+looked up once, not per record.
+"""
+import math
+import time
+from datetime import datetime, timezone
+
+from app.store import MEMBER_FIELD, TIMESTAMP_FORMAT
+from app.vocabulary import CATEGORIES, EXERCISES
+
+
+class InvalidWorkout(ValueError):
+    pass
+
+
+# Categories and MET values of the desktop app (ACEest_Fitness-V1.3).
+MET_VALUES = {"Warm-up": 3, "Workout": 6, "Cool-down": 2.5}
+DEFAULT_CATEGORY = "Workout"
+DEFAULT_WEIGHT_KG = 70
+
+MAX_EXERCISE_LENGTH = 100
+MAX_MEMBER_LENGTH = 64
+# A day, in minutes.
+MAX_DURATION = 24 * 60
+MAX_CALORIES = 100_000.0
+# Far enough in the future for clock skew, not for typos in the year.
+MAX_FUTURE_SECONDS = 24 * 60 * 60
+
+
+def _number(value, name):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise InvalidWorkout(f"{name} must be a number")
+    if not math.isfinite(value):
+        raise InvalidWorkout(f"{name} must be finite")
+    return value
+
+
+def _exercise(value):
+    if not isinstance(value, str):
+        raise InvalidWorkout("exercise must be a string")
+    value = " ".join(value.split())
+    if not value:
+        raise InvalidWorkout("exercise must not be empty")
+    if len(value) > MAX_EXERCISE_LENGTH:
+        raise InvalidWorkout(f"exercise must be at most {MAX_EXERCISE_LENGTH} characters")
+    # A name without letters or digits has no canonical spelling and is kept.
+    # New names are only learned by canonicalize, once the record is valid.
+    return EXERCISES.canonical(value, learn=False) or value
+
+
+def _duration(value):
+    value = _number(value, "duration")
+    if value != int(value):
+        raise InvalidWorkout("duration must be a whole number of minutes")
+    if not 1 <= value <= MAX_DURATION:
+        raise InvalidWorkout(f"duration must be between 1 and {MAX_DURATION} minutes")
+    return int(value)
+
+
+def _category(value):
+    name = CATEGORIES.canonical(value) if isinstance(value, str) else None
+    if name is None:
+        raise InvalidWorkout(f"category must be one of {', '.join(MET_VALUES)}")
+    return name
+
+
+def _calories(value):
+    value = _number(value, "calories")
+    if not 0 <= value <= MAX_CALORIES:
+        raise InvalidWorkout(f"calories must be between 0 and {MAX_CALORIES:g}")
+    return float(value)
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        try:
+            parsed = datetime.strptime(value, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc)
+        except ValueError:
+            raise InvalidWorkout(f"timestamp must be epoch seconds or {TIMESTAMP_FORMAT!r}")
+        value = parsed.timestamp()
+    value = _number(value, "timestamp")
+    if not 0 <= value <= time.time() + MAX_FUTURE_SECONDS:
+        raise InvalidWorkout("timestamp is out of range")
+    return int(value)
+
+
+def _member(value):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise InvalidWorkout(f"{MEMBER_FIELD} must be a string")
+    value = str(value).strip()
+    if len(value) > MAX_MEMBER_LENGTH:
+        raise InvalidWorkout(f"{MEMBER_FIELD} must be at most {MAX_MEMBER_LENGTH} characters")
+    return value or None
+
+
+def _estimated_calories(fields):
+    weight = DEFAULT_WEIGHT_KG
+    return float(MET_VALUES[fields["category"]] * 3.5 * weight / 200 * fields["duration"])
+
+
+# (name, coercer, aliases, default); a default of None makes the field
+# required, a callable default is computed from the fields before it.
+FIELDS = (
+    ("exercise", _exercise, ("workout",), None),
+    ("duration", _duration, (), None),
+    ("category", _category, (), lambda fields: DEFAULT_CATEGORY),
+    ("calories", _calories, (), _estimated_calories),
+    ("timestamp", _timestamp, (), lambda fields: int(time.time())),
+    (MEMBER_FIELD, _member, (), lambda fields: None),
+)
+
+
+def compile_schema(spec):
+    """Build ``validate(record) -> canonical dict`` for a ``FIELDS``-style table."""
+    names = tuple(name for name, _, _, _ in spec)
+    slots = {}
+    for name, coerce, aliases, _ in spec:
+        for key in (name,) + aliases:
+            slots[key] = (name, coerce)
+    defaults = tuple((name, default) for name, _, _, default in spec)
+
+    def validate(record):
+        if not isinstance(record, dict) or not record:
+            raise InvalidWorkout("workout must be a non-empty JSON object")
+        fields = {}
+        for key, value in record.items():
+            slot = slots.get(key)
+            if slot is None:
+                raise InvalidWorkout(f"unknown field {key!r}")
+            name, coerce = slot
+            value = coerce(value)
+            if fields.setdefault(name, value) != value:
+                raise InvalidWorkout(f"conflicting values for {name}")
+        if len(fields) < len(names):
+            for name, default in defaults:
+                if name not in fields:
+                    if default is None:
+                        raise InvalidWorkout(f"{name} is required")
+                    fields[name] = default(fields)
+        return {name: fields[name] for name in names}
+
+    return validate
+
+
+normalize = compile_schema(FIELDS)
+
+
+def canonicalize(workouts):
+    """Learn the new exercise names of normalized ``workouts`` and respell them canonically.
+
+    The write paths call this once the whole request has validated, right
+    before it is stored, so a rejected record never sets a spelling or uses
+    up ``EXERCISES.max_learned``. Two new spellings of one name in a batch
+    end up stored as the first.
+    """
+    for workout in workouts:
+        workout["exercise"] = EXERCISES.canonical(workout["exercise"]) or workout["exercise"]
+    return workouts
@@ -0,0 +1,117 @@
+"""Exercise-name search: folded terms, a prefix trie and an inverted index.
+
+Names are folded to lowercase letters and digits, so ``"Push-ups"``,
+``"pushups"`` and ``"PUSH UPS"`` all index the term ``pushups``. Every
+word of a name is a term, and so is the whole name folded into one word.
+A query matches a name when each of its words is a prefix of one of the
+name's terms, or when the whole query, folded into one word, is. So
+``push`` finds ``Push-ups`` and ``Push Press``, and ``push-up`` finds
+``Push ups``.
+
+``NameIndex`` holds the vocabulary: a trie over terms to expand a prefix
+into the terms under it, and an inverted index from each term to the names
+that contain it. It grows by one name at a time on ingest and only ever
+sees distinct names, which are far fewer than workouts. Backends then list
+the workouts of the matched names from their own per-name postings.
+
+Only the store's publishing thread adds names. Trie nodes only gain
+children and the inverted index maps terms to immutable ``frozenset``s, so
+readers walk both without locking.
+"""
+_END = ""
+
+
+def fold(text):
+    """``text`` in lowercase with everything but letters and digits removed."""
+    return "".join(char for char in text.casefold() if char.isalnum())
+
+
+def terms(name):
+    """Folded terms a name is indexed under: each word, and the whole name."""
+    found = {fold(word) for word in name.split()}
+    found.add(fold(name))
+    found.discard("")
+    return found
+
+
+def exercise_of(record):
+    """The exercise name of a stored record, or ``None``."""
+    if not isinstance(record, dict):
+        return None
+    name = record.get("exercise", record.get("workout"))
+    return name if isinstance(name, str) else None
+
+
+class PrefixTrie:
+    """Terms keyed one character per level; ``_END`` marks a node that ends a term."""
+
+    def __init__(self):
+        self._root = {}
+
+    def add(self, term):
+        node = self._root
+        for char in term:
+            child = node.get(char)
+            if child is None:
+                child = node[char] = {}
+            node = child
+        node[_END] = term
+
+    def complete(self, prefix):
+        """Every term starting with ``prefix``."""
+        node = self._root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+        found = []
+        stack = [node]
+        while stack:
+            for key, value in list(stack.pop().items()):
+                if key == _END:
+                    found.append(value)
+                else:
+                    stack.append(value)
+        return found
+
+
+class NameIndex:
+    """The searchable vocabulary of exercise names."""
+
+    def __init__(self):
+        self._trie = PrefixTrie()
+        self._terms = {}
+        self._known = set()
+
+    def add(self, name):
+        """Index ``name`` unless it already is; O(1) for a known name."""
+        if name is None or name in self._known:
+            return
+        for term in terms(name):
+            # The postings go in before the trie can lead a reader to them.
+            self._terms[term] = self._terms.get(term, frozenset()) | {name}
+            self._trie.add(term)
+        self._known.add(name)
+
+    def _prefixed(self, prefix):
+        names = set()
+        for term in self._trie.complete(prefix):
+            names |= self._terms[term]
+        return names
+
+    def match(self, words):
+        """Names matching the folded query ``words`` (see the module docstring)."""
+        matched = self._prefixed(words[0])
+        for word in words[1:]:
+            if not matched:
+                break
+            matched &= self._prefixed(word)
+        if len(words) > 1:
+            matched |= self._prefixed("".join(words))
+        return matched
+
+    def __contains__(self, name):
+        return name in self._known
+
+    def __len__(self):
+        return len(self._known)
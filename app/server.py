@@ -0,0 +1,368 @@
+"""Pre-fork production server for the web API.
+
+    python -m app.server
+
+``fitness_app.run`` is Flask's development server. It is one process that
+starts a thread per connection and logs every request. Werkzeug closes every
+connection after its response, there and here. This launcher binds
+the listening socket once in a master process and forks worker processes
+that all accept from it. Each worker serves connections from a fixed pool
+of ``ACEEST_THREADS`` threads, and only accepts a connection while one of
+those threads is free. A busy worker therefore leaves new connections in
+the shared backlog for an idle one.
+
+Sizing (``plan``): with ``ACEEST_WORKERS=0`` the launcher runs one worker
+per CPU of the container's quota. It reads the quota from cgroup v2
+``cpu.max`` or v1 ``cpu.cfs_quota_us``, falling back to the CPUs the
+process may run on. The worker count is capped so that ``worker_memory``
+bytes per worker fit the cgroup memory limit. Threads overlap I/O, but
+only one of them runs Python at a time in a process. The memory store
+lives inside a single process, so it always gets exactly one worker. Use
+``ACEEST_STORE=sqlite`` to scale out.
+
+Preloading: with SQLite, the master loads ``app.web_app`` and its store
+and waits for its warm-up (``app.readiness``) before forking. Workers then
+start at once and ready, the imported code and warmed caches are shared
+copy-on-write, and background work such as the retention compactor runs
+once, in the master. The memory store is loaded by its worker instead. A
+copy in the master would be stale by the next restart, and the log's
+threads do not survive a fork.
+
+Signals to the master (Linux):
+
+* ``HUP`` restarts the workers gracefully. With SQLite, the new workers
+  start before the old ones stop. They are forked from the preloaded app,
+  so new code needs a full restart. The single memory-store worker stops
+  first, so two processes never append to one log. The socket stays open
+  meanwhile, and connections wait in its backlog.
+* ``TERM`` and ``INT`` stop the launcher. Each worker stops accepting and
+  finishes the requests it has. It then runs its exit handlers, which close
+  the store. A worker still busy after
+  ``ACEEST_GRACEFUL_TIMEOUT`` seconds is killed.
+
+A worker that dies is replaced. One that cannot load the app stops the
+launcher, rather than being respawned in a loop.
+
+Request metrics: every worker shares its ``/metrics`` counters through a
+temporary directory of the master (``Metrics.share``), so a scrape answered
+by any worker reports the totals of all of them, exited ones included.
+"""
+import atexit
+import logging
+import math
+import os
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from app.config import Settings
+from app.metrics import retire_shared
+
+logger = logging.getLogger(__name__)
+
+CGROUP_ROOT = "/sys/fs/cgroup"
+# cgroup v1 reports "no limit" as a huge number rather than "max".
+UNLIMITED = 2 ** 60
+# Exit status of a worker that could not load the app.
+BOOT_ERROR = 3
+# Seconds to wait before replacing a worker that died, so a crash loop does not spin.
+RESPAWN_DELAY = 1.0
+MASTER_SIGNALS = (signal.SIGCHLD, signal.SIGHUP, signal.SIGINT, signal.SIGTERM)
+
+Plan = namedtuple("Plan", "workers threads preload")
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return f.read().split()
+    except OSError:
+        return None
+
+
+def cgroup_cpus(root=CGROUP_ROOT):
+    """The cgroup's CPU quota in CPUs, or ``None`` without one."""
+    fields = _read(os.path.join(root, "cpu.max"))
+    if fields:
+        return None if fields[0] == "max" else int(fields[0]) / int(fields[1])
+    quota = _read(os.path.join(root, "cpu", "cpu.cfs_quota_us"))
+    period = _read(os.path.join(root, "cpu", "cpu.cfs_period_us"))
+    if quota and period and int(quota[0]) > 0:
+        return int(quota[0]) / int(period[0])
+    return None
+
+
+def cgroup_memory(root=CGROUP_ROOT):
+    """The cgroup's memory limit in bytes, or ``None`` without one."""
+    for path in (os.path.join(root, "memory.max"), os.path.join(root, "memory", "memory.limit_in_bytes")):
+        fields = _read(path)
+        if fields:
+            return None if fields[0] == "max" or int(fields[0]) >= UNLIMITED else int(fields[0])
+    return None
+
+
+def available_cpus(root=CGROUP_ROOT):
+    """CPUs this process may use: the cgroup quota, else its CPU affinity."""
+    quota = cgroup_cpus(root)
+    if quota is not None:
+        return quota
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def plan(settings, cpus, memory):
+    """Workers, threads per worker and whether to preload, given ``cpus`` and ``memory`` bytes or ``None``."""
+    if settings.store == "memory":
+        if settings.workers > 1:
+            raise ValueError("ACEEST_WORKERS above 1 needs ACEEST_STORE=sqlite: "
+                             "the memory store lives in one process")
+        return Plan(1, settings.threads, False)
+    workers = settings.workers
+    if not workers:
+        workers = max(1, math.ceil(cpus))
+        if memory is not None:
+            workers = max(1, min(workers, memory // settings.worker_memory))
+    return Plan(workers, settings.threads, True)
+
+
+def listen(bind):
+    """A listening socket for ``host:port``; ``[::]:5000`` for IPv6."""
+    host, _, port = bind.rpartition(":")
+    host = host.strip("[]") or "0.0.0.0"
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    return socket.create_server((host, int(port)), family=family, backlog=socket.SOMAXCONN)
+
+
+class Handler(WSGIRequestHandler):
+    # Seconds a client may take to send its request while holding a thread.
+    timeout = 10.0
+
+    def log_request(self, code="-", size="-"):
+        # No access log: /metrics counts requests per route and status.
+        pass
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """A WSGI server on an inherited socket, serving connections from a fixed thread pool."""
+
+    multithread = True
+
+    def __init__(self, sock, app, threads, timeout=Handler.timeout):
+        self._slots = threading.Semaphore(threads)
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="aceest-request")
+        handler = type("Handler", (Handler,), {"timeout": timeout})
+        host, port = sock.getsockname()[:2]
+        super().__init__(host, port, app, handler, fd=sock.fileno())
+        # Every worker is woken for each connection; the ones that lose the
+        # race to accept it must not block.
+        self.socket.setblocking(False)
+
+    def get_request(self):
+        # Wait for a free thread before taking the connection off the backlog.
+        self._slots.acquire()
+        try:
+            return super().get_request()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def serve_forever(self, poll_interval=0.5):
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self._pool.shutdown(wait=True)
+
+
+def serve(sock, app, threads, timeout=Handler.timeout):
+    """Serve ``app`` on ``sock`` until ``SIGTERM``, then finish the requests in progress."""
+    server = PooledWSGIServer(sock, app, threads, timeout)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever, which is running in this thread.
+        threading.Thread(target=server.shutdown, daemon=True).start()
+    signal.signal(signal.SIGTERM, stop)
+    server.serve_forever()
+
+
+class Launcher:
+    """The master process: forks workers, replaces dead ones and restarts or stops them on signals.
+
+    ``load(wait=False)`` returns the WSGI app. The master preloads it with
+    ``wait=True``, which also waits for the app to warm up. With
+    ``metrics_dir``, workers share their request metrics there.
+    """
+
+    def __init__(self, load, plan, sock, timeout=Handler.timeout, graceful_timeout=30.0, metrics_dir=None):
+        self.load = load
+        self.plan = plan
+        self.sock = sock
+        self.timeout = timeout
+        self.graceful_timeout = graceful_timeout
+        self.metrics_dir = metrics_dir
+        self.app = None
+        # pid -> monotonic deadline to exit by once told to stop, else None.
+        self.workers = {}
+        self.stopping = False
+
+    def run(self):
+        """Serve until ``TERM`` or ``INT`` and return the exit status."""
+        signal.pthread_sigmask(signal.SIG_BLOCK, MASTER_SIGNALS)
+        if self.plan.preload:
+            self.app = self.load(wait=True)
+        for _ in range(self.plan.workers):
+            self.spawn()
+        status = 0
+        while self.workers or not self.stopping:
+            info = signal.sigtimedwait(MASTER_SIGNALS, 1.0)
+            signum = info.si_signo if info is not None else None
+            if signum in (signal.SIGTERM, signal.SIGINT) and not self.stopping:
+                logger.info("stopping %d worker(s)", len(self.workers))
+                self.stop()
+            elif signum == signal.SIGHUP and not self.stopping:
+                logger.info("restarting %d worker(s)", len(self.workers))
+                self.restart()
+            status = max(status, self.reap())
+            self.kill_overdue()
+        return status
+
+    def spawn(self):
+        pid = os.fork()
+        if pid:
+            self.workers[pid] = None
+            logger.info("started worker %d", pid)
+            return
+        status = 1
+        try:
+            # The master stops the whole group on ^C and restarts it on HUP.
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, MASTER_SIGNALS)
+            try:
+                app = self.app if self.app is not None else self.load()
+            except Exception:
+                logger.exception("worker %d could not load the app", os.getpid())
+                status = BOOT_ERROR
+            else:
+                if self.metrics_dir is not None:
+                    app.extensions["metrics"].share(self.metrics_dir)
+                serve(self.sock, app, self.plan.threads, self.timeout)
+                status = 0
+        except BaseException:
+            logger.exception("worker %d failed", os.getpid())
+        finally:
+            # Close the store and the like, then leave without unwinding
+            # into the master's code.
+            atexit._run_exitfuncs()
+            os._exit(status)
+
+    def retire(self, pids):
+        deadline = time.monotonic() + self.graceful_timeout
+        for pid in pids:
+            self.workers[pid] = deadline
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def restart(self):
+        serving = [pid for pid, deadline in self.workers.items() if deadline is None]
+        if self.plan.preload:
+            for _ in serving:
+                self.spawn()
+        # Without preloading, replacements start as the old workers exit (see reap).
+        self.retire(serving)
+
+    def stop(self):
+        self.stopping = True
+        self.retire([pid for pid, deadline in self.workers.items() if deadline is None])
+
+    def reap(self):
+        """Collect exited workers and replace them; returns ``BOOT_ERROR`` if one could not load the app."""
+        status = 0
+        while self.workers:
+            try:
+                pid, wait_status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            retired = self.workers.pop(pid, None) is not None
+            if self.metrics_dir is not None:
+                retire_shared(self.metrics_dir, pid)
+            code = os.waitstatus_to_exitcode(wait_status)
+            if code == BOOT_ERROR:
+                status = BOOT_ERROR
+                if not self.stopping:
+                    logger.error("worker %d could not load the app; stopping", pid)
+                    self.stop()
+            elif self.stopping:
+                continue
+            elif not retired:
+                logger.warning("worker %d exited with status %d; starting another", pid, code)
+                time.sleep(RESPAWN_DELAY)
+                self.spawn()
+            elif not self.plan.preload:
+                self.spawn()
+        return status
+
+    def kill_overdue(self):
+        now = time.monotonic()
+        for pid, deadline in self.workers.items():
+            if deadline is not None and now > deadline:
+                logger.warning("worker %d did not stop in %g s; killing it", pid, self.graceful_timeout)
+                self.workers[pid] = math.inf
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+
+def load_app(wait=False):
+    from app.web_app import fitness_app, readiness
+    if wait and not readiness.wait():
+        logger.warning("warm-up failed: %s", readiness.error)
+    return fitness_app
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(process)d] %(levelname)s %(message)s")
+    settings = Settings.from_env()
+    cpus, memory = available_cpus(), cgroup_memory()
+    sized = plan(settings, cpus, memory)
+    logger.info("%g CPU(s), memory limit %s: %d worker(s) x %d thread(s)%s", cpus,
+                "none" if memory is None else f"{memory / 2**20:.0f} MiB", sized.workers, sized.threads,
+                ", preloaded" if sized.preload else "")
+    sock = listen(settings.bind)
+    logger.info("listening on %s", settings.bind)
+    metrics_dir = tempfile.mkdtemp(prefix="aceest-metrics-")
+    try:
+        sys.exit(Launcher(load_app, sized, sock, settings.request_timeout, settings.graceful_timeout,
+                          metrics_dir).run())
+    finally:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
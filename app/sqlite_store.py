@@ -0,0 +1,464 @@
+"""SQLite storage backend for the web API.
+
+The database runs in WAL mode, so any number of readers (threads here, or
+other processes, "replicas" below) query while a writer commits. WAL
+coordinates them through a memory-mapped ``-shm`` file, which only works
+between processes on one host: the pre-forked workers of ``app.server``,
+or containers of one pod or node sharing a local volume. On a network
+filesystem (``NETWORK_FILESYSTEMS``) the store refuses to open, since
+replicas on other hosts sharing the file would corrupt it. Each thread
+gets its own connection from a small pool; the SQL text is constant, so
+sqlite3's per-connection statement cache keeps every statement prepared.
+Workout bodies are stored as compact JSON next to indexed member, category
+and timestamp columns; nothing is loaded into RAM up front.
+
+Per-category totals live in a ``stats`` table, one row per member and
+category plus the store-wide rows under the empty member. Every insert
+updates them in the same transaction, so ``/stats`` reads a handful of rows
+however many workouts there are.
+
+Exercise search keeps each workout's name in an indexed ``exercise``
+column. The distinct names are also kept in an ``exercises`` table, which
+every process reads incrementally into its own ``NameIndex``. A query
+matches names in memory and then reads only the matching rows.
+
+Compaction (see ``app.retention``) replaces old rows with rollup rows in
+batches of ``COMPACT_BATCH``, each its own short write transaction. Rollups
+keep the per-category totals, so the ``stats`` table is left as it is. The
+``generation`` meta row counts compactions and is read with every view.
+
+A store opened before ``os.fork`` (see ``app.server``) is usable in the
+child: the child drops the connections it inherited, without closing them,
+and opens its own, since SQLite connections must not cross a fork.
+"""
+import functools
+import os
+import re
+import sqlite3
+import threading
+import uuid
+import weakref
+
+from app.codec import encode_record, loads
+from app.retention import Rollups
+from app.stats import RunningStats, WorkoutStats
+from app.search import NameIndex, exercise_of
+from app.store import BaseStore, json_array, member_of, timestamp_of
+from app.timeindex import ORDINAL_BITS, ORDINAL_MASK, range_key
+from app.vocabulary import EXERCISES
+
+# Filesystem types (as in /proc/self/mounts) a database must not live on.
+NETWORK_FILESYSTEMS = frozenset((
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "9p", "ceph", "fuse.ceph", "glusterfs", "fuse.glusterfs",
+    "lustre", "gpfs", "afs", "fuse.sshfs", "fuse.s3fs", "fuse.gcsfuse", "fuse.blobfuse",
+))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workouts (
+    seq INTEGER PRIMARY KEY,
+    member TEXT,
+    category TEXT,
+    ts REAL,
+    body TEXT NOT NULL,
+    exercise TEXT
+);
+CREATE INDEX IF NOT EXISTS workouts_member ON workouts (member, seq);
+CREATE INDEX IF NOT EXISTS workouts_category ON workouts (category, seq);
+CREATE INDEX IF NOT EXISTS workouts_ts ON workouts (ts, seq);
+CREATE INDEX IF NOT EXISTS workouts_member_ts ON workouts (member, ts, seq);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS stats (
+    member TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    minutes REAL NOT NULL,
+    calories REAL NOT NULL,
+    PRIMARY KEY (member, category)
+);
+CREATE TABLE IF NOT EXISTS exercises (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);
+"""
+
+# Member key of the store-wide totals in the stats table.
+ALL_MEMBERS = ""
+
+INSERT = "INSERT INTO workouts (seq, member, category, ts, body, exercise) VALUES (?, ?, ?, ?, ?, ?)"
+ADD_EXERCISE = "INSERT OR IGNORE INTO exercises (name) VALUES (?)"
+SELECT_EXERCISES = "SELECT id, name FROM exercises WHERE id > ? ORDER BY id"
+MAX_SEQ = "SELECT COALESCE(MAX(seq), 0) FROM workouts"
+SELECT_VIEW = ("SELECT (SELECT COALESCE(MAX(seq), 0) FROM workouts), "
+               "(SELECT COALESCE(MAX(value), 0) FROM meta WHERE key = 'generation')")
+SELECT_ALL = "SELECT body FROM workouts WHERE seq <= ? ORDER BY seq"
+SELECT_PAGE = "SELECT seq, body FROM workouts WHERE seq > ? AND seq <= ? ORDER BY seq LIMIT ?"
+SELECT_MEMBER = "SELECT body FROM workouts WHERE member = ? AND seq <= ? ORDER BY seq"
+SELECT_MEMBER_PAGE = ("SELECT seq, body FROM workouts WHERE member = ? AND seq > ? AND seq <= ? "
+                      "ORDER BY seq LIMIT ?")
+SELECT_MEMBERS = "SELECT DISTINCT member FROM workouts WHERE member IS NOT NULL AND seq <= ?"
+COUNT = "SELECT COUNT(*) FROM workouts WHERE seq <= ?"
+MEMBER_VERSION = "SELECT COALESCE(MAX(seq), 0) FROM workouts WHERE member = ? AND seq <= ?"
+# Time ranges page by the same (timestamp, ordinal) keys as the memory
+# store's TimeIndex, with the sequence number as the ordinal.
+SELECT_RANGE = ("SELECT seq, ts, body FROM workouts WHERE ts >= ? AND ts < ? AND (ts, seq) > (?, ?) "
+                "AND seq <= ? ORDER BY ts, seq LIMIT ?")
+SELECT_MEMBER_RANGE = ("SELECT seq, ts, body FROM workouts WHERE member = ? AND ts >= ? AND ts < ? "
+                       "AND (ts, seq) > (?, ?) AND seq <= ? ORDER BY ts, seq LIMIT ?")
+# Search statements take one placeholder per matched name.
+SELECT_SEARCH = ("SELECT seq, body FROM workouts WHERE exercise IN ({names}) AND seq > ? AND seq <= ? "
+                 "ORDER BY seq LIMIT ?")
+SELECT_MEMBER_SEARCH = ("SELECT seq, body FROM workouts WHERE member = ? AND exercise IN ({names}) "
+                        "AND seq > ? AND seq <= ? ORDER BY seq LIMIT ?")
+ADD_STATS = ("INSERT INTO stats (member, category, sessions, minutes, calories) VALUES (?, ?, ?, ?, ?) "
+             "ON CONFLICT (member, category) DO UPDATE SET sessions = sessions + excluded.sessions, "
+             "minutes = minutes + excluded.minutes, calories = calories + excluded.calories")
+# Each statement reads the totals together with the version they are current
+# to, from one consistent snapshot of the database.
+SELECT_STATS = ("SELECT v.version, s.category, s.sessions, s.minutes, s.calories "
+                "FROM (SELECT COALESCE(MAX(seq), 0) AS version FROM workouts) v "
+                "LEFT JOIN stats s ON s.member = ''")
+SELECT_MEMBER_STATS = ("SELECT v.version, s.category, s.sessions, s.minutes, s.calories "
+                       "FROM (SELECT COALESCE(MAX(seq), 0) AS version FROM workouts WHERE member = ?) v "
+                       "LEFT JOIN stats s ON s.member = ?")
+# Detail rows older than a cutoff, oldest first, and the rollup rows of one
+# member, day and category.
+SELECT_EXPIRED = ("SELECT seq, member, ts, body FROM workouts WHERE ts < ? "
+                  "AND json_extract(body, '$.rollup') IS NULL ORDER BY ts, seq LIMIT ?")
+SELECT_ROLLUPS = ("SELECT seq, body FROM workouts WHERE member IS ? AND ts = ? AND category = ? "
+                  "AND json_extract(body, '$.rollup') IS NOT NULL")
+DELETE = "DELETE FROM workouts WHERE seq = ?"
+ADD_GENERATION = ("INSERT INTO meta (key, value) VALUES ('generation', 1) "
+                  "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+# Rows rolled up per compaction transaction.
+COMPACT_BATCH = 10_000
+
+
+def _loads(rows):
+    return [loads(body) for (body,) in rows]
+
+
+def _stats(rows):
+    categories = {}
+    for _, category, sessions, minutes, calories in rows:
+        if category is not None:
+            categories[category] = (sessions, int(minutes) if minutes == int(minutes) else minutes, calories)
+    return WorkoutStats(rows[0][0], categories)
+
+
+def _stats_rows(records):
+    """``ADD_STATS`` parameters adding ``records`` to the store-wide and per-member totals."""
+    totals = {}
+    for record in records:
+        for member in (ALL_MEMBERS, member_of(record)):
+            if member is not None:
+                running = totals.get(member)
+                if running is None:
+                    running = totals[member] = RunningStats()
+                running.add(record)
+    return [(member, category, *sums)
+            for member, running in totals.items()
+            for category, sums in running.snapshot(0).categories.items()]
+
+
+def _row(seq, record):
+    """``INSERT`` parameters of one workout."""
+    category = record.get("category") if isinstance(record, dict) else None
+    return (seq, member_of(record), category if isinstance(category, str) else None, timestamp_of(record),
+            encode_record(record).decode(), exercise_of(record))
+
+
+def _array(rows):
+    # Bodies are stored as encoded JSON, so listings are served without decoding them.
+    return json_array([body.encode() for (body,) in rows])
+
+
+class SqliteView:
+    """Read view bounded by the highest sequence number committed when it was taken.
+
+    The version of a SQLite view is that sequence number, which every replica
+    sharing the database file agrees on.
+    """
+
+    __slots__ = ("version", "high_seq", "generation", "_store")
+
+    def __init__(self, store, high_seq, generation=0):
+        self.version = high_seq
+        self.high_seq = high_seq
+        self.generation = generation
+        self._store = store
+
+    def all(self):
+        return _loads(self._store.execute(SELECT_ALL, (self.high_seq,)))
+
+    def page(self, after_seq=0, limit=100):
+        rows = self._store.execute(SELECT_PAGE, (after_seq, self.high_seq, limit))
+        return [(seq, loads(body)) for seq, body in rows]
+
+    def member_all(self, member):
+        return _loads(self._store.execute(SELECT_MEMBER, (member, self.high_seq)))
+
+    def member_page(self, member, after_seq=0, limit=100):
+        rows = self._store.execute(SELECT_MEMBER_PAGE, (member, after_seq, self.high_seq, limit))
+        return [(seq, loads(body)) for seq, body in rows]
+
+    def all_json(self):
+        return _array(self._store.execute(SELECT_ALL, (self.high_seq,)))
+
+    def page_json(self, after_seq=0, limit=100):
+        rows = self._store.execute(SELECT_PAGE, (after_seq, self.high_seq, limit))
+        return [(seq, body.encode()) for seq, body in rows]
+
+    def member_all_json(self, member):
+        return _array(self._store.execute(SELECT_MEMBER, (member, self.high_seq)))
+
+    def member_page_json(self, member, after_seq=0, limit=100):
+        rows = self._store.execute(SELECT_MEMBER_PAGE, (member, after_seq, self.high_seq, limit))
+        return [(seq, body.encode()) for seq, body in rows]
+
+    def member_version(self, member):
+        return self._store.execute(MEMBER_VERSION, (member, self.high_seq))[0][0]
+
+    def members(self):
+        return [member for (member,) in self._store.execute(SELECT_MEMBERS, (self.high_seq,))]
+
+    def _range(self, start, end, after, limit, member):
+        bounds = (start, float("inf") if end is None else end, after >> ORDINAL_BITS, after & ORDINAL_MASK,
+                  self.high_seq, -1 if limit is None else limit)
+        if member is None:
+            return self._store.execute(SELECT_RANGE, bounds)
+        return self._store.execute(SELECT_MEMBER_RANGE, (member,) + bounds)
+
+    def range_json(self, start, end, member=None):
+        return json_array([body.encode() for _, _, body in self._range(start, end, 0, None, member)])
+
+    def range_page_json(self, start, end, after=0, limit=100, member=None):
+        rows = self._range(start, end, after, limit, member)
+        return [(range_key(ts, seq), body.encode()) for seq, ts, body in rows]
+
+    def search_json(self, words, member=None):
+        return json_array([body for _, body in self.search_page_json(words, 0, None, member)])
+
+    def search_page_json(self, words, after_seq=0, limit=100, member=None):
+        names = sorted(self._store.names().match(words))
+        if not names:
+            return []
+        marks = ",".join("?" * len(names))
+        bounds = (after_seq, self.high_seq, -1 if limit is None else limit)
+        if member is None:
+            rows = self._store.execute(SELECT_SEARCH.format(names=marks), (*names, *bounds))
+        else:
+            rows = self._store.execute(SELECT_MEMBER_SEARCH.format(names=marks), (member, *names, *bounds))
+        return [(seq, body.encode()) for seq, body in rows]
+
+    def stats(self, member=None):
+        """Totals as of the latest commit, which may be newer than this view.
+
+        The table only holds current sums, so the returned ``version`` says
+        which commit they include.
+        """
+        if member is None:
+            return _stats(self._store.execute(SELECT_STATS))
+        return _stats(self._store.execute(SELECT_MEMBER_STATS, (member, member)))
+
+    def __len__(self):
+        return self._store.execute(COUNT, (self.high_seq,))[0][0]
+
+
+def _after_fork(ref):
+    store = ref()
+    if store is not None:
+        store._after_fork()
+
+
+def filesystem_type(path, mounts="/proc/self/mounts"):
+    """The type of the filesystem ``path`` is on, or ``None`` where the mount table cannot be read."""
+    path = os.path.realpath(path)
+    found, longest = None, -1
+    try:
+        with open(mounts) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Mount points escape spaces and the like as octal, e.g. "\040".
+                point = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1])
+                inside = path == point or path.startswith(point.rstrip("/") + "/")
+                if inside and len(point) > longest:
+                    found, longest = fields[2], len(point)
+    except OSError:
+        return None
+    return found
+
+
+class SqliteStore(BaseStore):
+    blocking_reads = True
+    # Seconds between checks for commits made by other replicas while
+    # someone is waiting on the change feed.
+    poll_interval = 0.5
+
+    def __init__(self, path, synchronous="FULL", busy_timeout=5.0):
+        super().__init__()
+        kind = filesystem_type(os.path.dirname(os.path.abspath(path)))
+        if kind in NETWORK_FILESYSTEMS:
+            raise ValueError(f"SQLite database {path} is on a {kind} filesystem; WAL mode needs a local one "
+                             "shared only by processes on one host")
+        self.path = path
+        self.synchronous = synchronous
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._connections = []
+        self._watcher = None
+        self._closed = threading.Event()
+        self._names = NameIndex()
+        self._names_seen = 0
+        self._names_lock = threading.Lock()
+        os.register_at_fork(after_in_child=functools.partial(_after_fork, weakref.ref(self)))
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:12],))
+        self.epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        self._migrate(conn)
+        # Reading the stored names seeds EXERCISES with their spellings.
+        self.names()
+
+    def _migrate(self, conn):
+        # Databases written before the stats and search columns existed get
+        # them filled in once, here; from then on every insert keeps them current.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'stats'").fetchone() is None:
+                records = (loads(body) for (body,) in conn.execute("SELECT body FROM workouts"))
+                conn.executemany(ADD_STATS, _stats_rows(records))
+                conn.execute("INSERT INTO meta (key, value) VALUES ('stats', '1')")
+            if "exercise" not in {column[1] for column in conn.execute("PRAGMA table_info(workouts)")}:
+                conn.execute("ALTER TABLE workouts ADD COLUMN exercise TEXT")
+                rows = conn.execute("SELECT seq, body FROM workouts").fetchall()
+                names = [(exercise_of(loads(body)), seq) for seq, body in rows]
+                conn.executemany("UPDATE workouts SET exercise = ? WHERE seq = ?", names)
+                conn.executemany(ADD_EXERCISE, {(name,) for name, _ in names if name is not None})
+            conn.execute("CREATE INDEX IF NOT EXISTS workouts_exercise ON workouts (exercise, seq)")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def names(self):
+        """This process's ``NameIndex``, caught up with names other replicas added."""
+        with self._names_lock:
+            for seen, name in self.execute(SELECT_EXERCISES, (self._names_seen,)):
+                EXERCISES.seed((name,))
+                self._names.add(name)
+                self._names_seen = seen
+        return self._names
+
+    def warm_up(self):
+        # Catches the NameIndex up and reads the table into SQLite's page cache.
+        super().warm_up()
+        self.names()
+        self.execute(COUNT, (self.view().high_seq,))
+
+    def _after_fork(self):
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._connections = []
+        self._watcher = None
+        self._names_lock = threading.Lock()
+        self._changed = threading.Condition()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.path,
+                timeout=self.busy_timeout,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=64,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.conn = conn
+            with self._pool_lock:
+                self._connections.append(conn)
+        return conn
+
+    def execute(self, sql, params=()):
+        return self._connection().execute(sql, params).fetchall()
+
+    def add_many(self, records):
+        if not records:
+            return []
+        rows = []
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, so sequence numbers
+        # stay unique even with several replicas writing to the same file.
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            first = conn.execute(MAX_SEQ).fetchone()[0] + 1
+            rows = [_row(seq, record) for seq, record in enumerate(records, first)]
+            conn.executemany(INSERT, rows)
+            conn.executemany(ADD_EXERCISE, {(row[5],) for row in rows if row[5] is not None})
+            conn.executemany(ADD_STATS, _stats_rows(records))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._committed()
+        return [row[0] for row in rows]
+
+    def view(self):
+        high_seq, generation = self.execute(SELECT_VIEW)[0]
+        return SqliteView(self, high_seq, int(generation))
+
+    def compact(self, before, batch=COMPACT_BATCH):
+        compacted = 0
+        conn = self._connection()
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                expired = conn.execute(SELECT_EXPIRED, (before, batch)).fetchall()
+                rollups = Rollups()
+                for seq, member, ts, body in expired:
+                    rollups.add(seq, loads(body), member, int(ts))
+                # Fold in the rollups of days compacted before.
+                folded = [(seq, loads(body), member)
+                          for member, day, category in rollups.keys()
+                          for seq, body in conn.execute(SELECT_ROLLUPS, (member, day, category))]
+                for seq, record, member in folded:
+                    rollups.add(seq, record, member, record["timestamp"])
+                conn.executemany(DELETE, [(row[0],) for row in expired] + [(row[0],) for row in folded])
+                conn.executemany(INSERT, [_row(seq, record) for seq, record in rollups.records()])
+                if expired:
+                    conn.execute(ADD_GENERATION)
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            compacted += len(expired)
+            if len(expired) < batch:
+                return compacted
+
+    def watch(self):
+        # One thread per process notices other replicas' commits for every
+        # waiter, instead of each waiter polling the database.
+        with self._pool_lock:
+            if self._watcher is None and not self._closed.is_set():
+                self._watcher = threading.Thread(target=self._poll, name="sqlite-change-watcher", daemon=True)
+                self._watcher.start()
+
+    def _poll(self):
+        seen = self.view().version
+        while not self._closed.wait(self.poll_interval):
+            try:
+                version = self.view().version
+            except sqlite3.Error:
+                continue
+            if version != seen:
+                seen = version
+                self._committed()
+
+    def close(self):
+        self._closed.set()
+        with self._pool_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
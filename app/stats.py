@@ -0,0 +1,90 @@
+"""Running workout totals per category: sessions, minutes and calories.
+
+The desktop app's progress charts sum every session's duration per category
+each time they are drawn. The web API keeps those sums up to date instead.
+Each write adds its workout to the running totals of the whole store and of
+its member, an O(1) update, so ``/stats`` never scans any workouts.
+
+Backends hand out immutable ``WorkoutStats`` snapshots; ``RunningStats`` is
+the mutable accumulator behind them. A daily rollup left by compaction (see
+``app.retention``) counts as the sessions it stands for, so the totals are
+the same before and after old workouts are compacted.
+"""
+
+# What a workout without a usable category is counted as; the same default
+# as ``app.schema``, which normalizes every record written through the API.
+DEFAULT_CATEGORY = "Workout"
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def contribution(record):
+    """``(category, sessions, minutes, calories)`` that ``record`` adds to the totals."""
+    if not isinstance(record, dict):
+        return DEFAULT_CATEGORY, 1, 0, 0.0
+    category = record.get("category")
+    if not isinstance(category, str) or not category:
+        category = DEFAULT_CATEGORY
+    sessions = _number(record.get("sessions")) if "rollup" in record else 1
+    return category, sessions, _number(record.get("duration")), float(_number(record.get("calories")))
+
+
+class WorkoutStats:
+    """Totals as of one ``version``: ``categories[name] = (sessions, minutes, calories)``.
+
+    Never mutated once built, so readers share it without locking.
+    """
+
+    __slots__ = ("version", "categories")
+
+    def __init__(self, version=0, categories=None):
+        self.version = version
+        self.categories = categories or {}
+
+    def without(self, records, version):
+        """These totals with ``records`` taken back out, as of ``version``."""
+        categories = dict(self.categories)
+        for record in records:
+            category, sessions, minutes, calories = contribution(record)
+            total_sessions, total_minutes, total_calories = categories[category]
+            categories[category] = (total_sessions - sessions, total_minutes - minutes, total_calories - calories)
+        return WorkoutStats(version, {name: sums for name, sums in categories.items() if sums[0]})
+
+    def body(self, member=None, categories=()):
+        """JSON-ready totals, listing ``categories`` first even when they have no sessions."""
+        names = list(categories) + sorted(set(self.categories) - set(categories))
+        per_category = {}
+        for name in names:
+            sessions, minutes, calories = self.categories.get(name, (0, 0, 0.0))
+            per_category[name] = {"sessions": sessions, "minutes": minutes, "calories": round(calories, 2)}
+        return {
+            "regn_id": member,
+            "sessions": sum(sums["sessions"] for sums in per_category.values()),
+            "minutes": sum(sums["minutes"] for sums in per_category.values()),
+            "calories": round(sum(sums[2] for sums in self.categories.values()), 2),
+            "categories": per_category,
+        }
+
+
+class RunningStats:
+    """Mutable totals of one partition; ``snapshot`` freezes them into a ``WorkoutStats``."""
+
+    __slots__ = ("_categories",)
+
+    def __init__(self):
+        self._categories = {}
+
+    def add(self, record):
+        category, sessions, minutes, calories = contribution(record)
+        sums = self._categories.get(category)
+        if sums is None:
+            self._categories[category] = [sessions, minutes, calories]
+        else:
+            sums[0] += sessions
+            sums[1] += minutes
+            sums[2] += calories
+
+    def snapshot(self, version):
+        return WorkoutStats(version, {name: tuple(sums) for name, sums in self._categories.items()})
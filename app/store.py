@@ -0,0 +1,630 @@
+import abc
+import bisect
+import heapq
+import math
+import os
+import threading
+import time
+import uuid
+from array import array
+from itertools import islice
+from datetime import datetime, timezone
+
+from app.codec import encode_record
+from app.columnar import WorkoutTable, fits
+from app.retention import Rollups, is_rollup
+from app.search import NameIndex, exercise_of
+from app.stats import RunningStats, WorkoutStats
+from app.timeindex import ORDINAL_MASK, TimeIndex
+from app.vocabulary import EXERCISES
+from app.workout_log import WorkoutLog
+
+# Records carry their member the way the desktop app's save_user_info does.
+MEMBER_FIELD = "regn_id"
+
+
+# Timestamp format written by the desktop app's add_workout.
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def json_array(parts):
+    return b"[" + b",".join(parts) + b"]"
+
+
+def member_of(record):
+    member = record.get(MEMBER_FIELD) if isinstance(record, dict) else None
+    return None if member is None or member == "" else str(member)
+
+
+def timestamp_of(record):
+    """Whole epoch seconds of a record's ``timestamp`` (naive strings are read as UTC), or ``None``."""
+    value = record.get("timestamp") if isinstance(record, dict) else None
+    if type(value) is int:
+        return value
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value) if math.isfinite(value) else None
+    if isinstance(value, str):
+        try:
+            return int(datetime.strptime(value, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+        except ValueError:
+            return None
+    return None
+
+
+class Partition:
+    """The store's workouts in sequence order, with their indexes.
+
+    The workouts themselves live in a columnar ``WorkoutTable`` (see
+    ``app.columnar``), which also holds their encoded JSON in chunks, so a
+    full listing is a join of cached chunks plus the short tail instead of a
+    fresh walk over every workout. ``MemberPartition`` indexes one member's
+    workouts by their positions in the same table, so nothing is stored
+    twice.
+
+    Only the store's single publishing thread appends. Readers never lock: they
+    bound every access by a count taken from a ``StoreView``, so entries
+    appended after that view was published are invisible to them.
+
+    Running per-category totals are updated on every append, and ``stats``
+    holds their snapshot as of the last commit that touched the partition.
+    Records with a timestamp are also indexed by time in ``times``, and
+    ``by_name`` holds the ordinals (1-based positions) of each exercise
+    name's records, for search.
+    """
+
+    def __init__(self, table=None):
+        self.table = WorkoutTable() if table is None else table
+        self.totals = RunningStats()
+        self.stats = WorkoutStats()
+        self.times = TimeIndex(self._timestamp_at)
+        self.by_name = {}
+
+    def _at(self, i):
+        """Table position of the partition's ``i``-th (0-based) workout."""
+        return i
+
+    def _span(self, start, end):
+        return range(start, end)
+
+    def _timestamp_at(self, ordinal):
+        return self.table.timestamps[self._at(ordinal - 1)]
+
+    def _grow(self, position):
+        return position + 1
+
+    def add(self, position, record, timestamp):
+        """Index the table's workout at ``position``; ``timestamp`` is its whole epoch seconds or ``None``."""
+        ordinal = self._grow(position)
+        self.totals.add(record)
+        if timestamp is not None:
+            self.times.add(timestamp, ordinal)
+        name = exercise_of(record)
+        if name is not None:
+            postings = self.by_name.get(name)
+            if postings is None:
+                postings = self.by_name[name] = array("q")
+            postings.append(ordinal)
+
+    def publish_stats(self):
+        self.stats = self.totals.snapshot(self.seq(len(self) - 1))
+
+    def seq(self, i):
+        return self.table.seqs[self._at(i)]
+
+    def count_upto(self, seq):
+        """Number of entries with sequence number ``<= seq``."""
+        return bisect.bisect_right(self.table.seqs, seq, 0, len(self.table))
+
+    def records(self, start, end):
+        return self.table.records(self._span(start, end))
+
+    def _bounds(self, after_seq, limit, count):
+        start = min(self.count_upto(after_seq), count)
+        return start, min(start + limit, count)
+
+    def page(self, after_seq, limit, count):
+        """Return up to ``limit`` of the first ``count`` entries with ``seq > after_seq``."""
+        start, end = self._bounds(after_seq, limit, count)
+        positions = self._span(start, end)
+        return list(zip(map(self.table.seqs.__getitem__, positions), self.table.records(positions)))
+
+    def page_json(self, after_seq, limit, count):
+        """Like ``page`` but with each record's encoded JSON instead of the dict."""
+        start, end = self._bounds(after_seq, limit, count)
+        positions = self._span(start, end)
+        return list(zip(map(self.table.seqs.__getitem__, positions), self.table.encoded_many(positions)))
+
+    def range_json(self, start, end, count, after=0, limit=None):
+        """``(key, encoded)`` of the first ``count`` entries with ``start <= timestamp < end``, by time.
+
+        Keys are ``TimeIndex`` keys; pass the last one as ``after`` to continue.
+        """
+        keys = self.times.scan(start, end, count, after, limit)
+        return list(zip(keys, self.table.encoded_many([self._at((key & ORDINAL_MASK) - 1) for key in keys])))
+
+    def search_json(self, names, after_seq, limit, count):
+        """``(seq, encoded)`` of the first ``count`` entries named in ``names``, after ``after_seq``.
+
+        Each name's postings are already in order, so they are merged lazily
+        and only the returned entries are touched.
+        """
+        start = self.count_upto(after_seq)
+        streams = []
+        for name in names:
+            postings = self.by_name.get(name)
+            if postings is not None:
+                first = bisect.bisect_right(postings, start)
+                last = bisect.bisect_right(postings, count)
+                streams.append(map(postings.__getitem__, range(first, last)))
+        positions = [self._at(ordinal - 1) for ordinal in islice(heapq.merge(*streams), limit)]
+        return list(zip(map(self.table.seqs.__getitem__, positions), self.table.encoded_many(positions)))
+
+    def json(self, count):
+        """The first ``count`` records as one JSON array."""
+        return b"[" + self.table.json(count) + b"]"
+
+    def __len__(self):
+        return len(self.table)
+
+
+class MemberPartition(Partition):
+    """One member's workouts: their positions in the store-wide table, and their indexes."""
+
+    def __init__(self, table):
+        self.positions = array("q")
+        super().__init__(table)
+
+    def _at(self, i):
+        return self.positions[i]
+
+    def _span(self, start, end):
+        return self.positions[start:end]
+
+    def _grow(self, position):
+        self.positions.append(position)
+        return len(self.positions)
+
+    def count_upto(self, seq):
+        return bisect.bisect_left(self.positions, super().count_upto(seq), 0, len(self.positions))
+
+    def json(self, count):
+        return json_array(self.table.encoded_many(self.positions[:count]))
+
+    def __len__(self):
+        return len(self.positions)
+
+
+class StoreView:
+    """Immutable read view of the store as of one committed version.
+
+    A view is published as a single attribute assignment after a commit has
+    been fully applied, so readers see either all of a commit or none of it,
+    and a long serialization never holds anything a writer needs.
+    """
+
+    __slots__ = ("version", "high_seq", "generation", "_all", "_count", "_members", "_stats", "_names")
+
+    def __init__(self, high_seq, all_partition, count, members, names, generation=0):
+        # Every commit takes new sequence numbers, so the highest one doubles
+        # as a monotonically increasing write version.
+        self.version = high_seq
+        self.high_seq = high_seq
+        # Compactions so far: they change listings without a new version.
+        self.generation = generation
+        self._all = all_partition
+        self._count = count
+        self._members = members
+        self._stats = all_partition.stats
+        self._names = names
+
+    def all(self):
+        return self._all.records(0, self._count)
+
+    def page(self, after_seq=0, limit=100):
+        return self._all.page(after_seq, limit, self._count)
+
+    def member_all(self, member):
+        partition = self._members.get(member)
+        if partition is None:
+            return []
+        return partition.records(0, partition.count_upto(self.high_seq))
+
+    def member_page(self, member, after_seq=0, limit=100):
+        partition = self._members.get(member)
+        if partition is None:
+            return []
+        return partition.page(after_seq, limit, partition.count_upto(self.high_seq))
+
+    def all_json(self):
+        return self._all.json(self._count)
+
+    def page_json(self, after_seq=0, limit=100):
+        return self._all.page_json(after_seq, limit, self._count)
+
+    def member_all_json(self, member):
+        partition = self._members.get(member)
+        if partition is None:
+            return b"[]"
+        return partition.json(partition.count_upto(self.high_seq))
+
+    def member_page_json(self, member, after_seq=0, limit=100):
+        partition = self._members.get(member)
+        if partition is None:
+            return []
+        return partition.page_json(after_seq, limit, partition.count_upto(self.high_seq))
+
+    def member_version(self, member):
+        """Sequence number of the member's latest workout in this view (0 if none)."""
+        partition = self._members.get(member)
+        count = partition.count_upto(self.high_seq) if partition is not None else 0
+        return partition.seq(count - 1) if count else 0
+
+    def members(self):
+        return [m for m, p in list(self._members.items()) if p.count_upto(self.high_seq)]
+
+    def _bounded(self, member):
+        if member is None:
+            return self._all, self._count
+        partition = self._members.get(member)
+        if partition is None:
+            return None, 0
+        return partition, partition.count_upto(self.high_seq)
+
+    def range_json(self, start, end, member=None):
+        """Workouts with ``start <= timestamp < end`` (``end`` may be ``None``) as a JSON array, by time."""
+        partition, count = self._bounded(member)
+        if partition is None:
+            return b"[]"
+        return json_array([encoded for _, encoded in partition.range_json(start, end, count)])
+
+    def range_page_json(self, start, end, after=0, limit=100, member=None):
+        """Like ``range_json`` but ``(key, encoded)`` pairs, up to ``limit`` after key ``after``."""
+        partition, count = self._bounded(member)
+        if partition is None:
+            return []
+        return partition.range_json(start, end, count, after, limit)
+
+    def search_json(self, words, member=None):
+        """Workouts whose exercise matches the folded query ``words``, as a JSON array in sequence order."""
+        return json_array([encoded for _, encoded in self.search_page_json(words, 0, None, member)])
+
+    def search_page_json(self, words, after_seq=0, limit=100, member=None):
+        """Like ``search_json`` but ``(seq, encoded)`` pairs, up to ``limit`` after ``after_seq``."""
+        partition, count = self._bounded(member)
+        if partition is None:
+            return []
+        return partition.search_json(self._names.match(words), after_seq, limit, count)
+
+    def stats(self, member=None):
+        """Running totals of the whole view, or of one member, as a ``WorkoutStats``."""
+        if member is None:
+            return self._stats
+        partition = self._members.get(member)
+        if partition is None:
+            return WorkoutStats()
+        stats = partition.stats
+        if stats.version <= self.high_seq:
+            return stats
+        count = partition.count_upto(self.high_seq)
+        # A later commit already updated this member's totals: take its
+        # workouts back out rather than rescanning the ones in this view.
+        newer = partition.records(count, partition.count_upto(stats.version))
+        return stats.without(newer, partition.seq(count - 1) if count else 0)
+
+    def entries(self, records=True):
+        """``(seq, record, encoded)`` of every workout in the view; ``record`` is ``None`` unless ``records``."""
+        return self._all.table.entries(0, self._count, records)
+
+    def __len__(self):
+        return self._count
+
+
+class BaseStore(abc.ABC):
+    """Storage interface behind the web API.
+
+    A backend implements ``add_many`` and ``view``. A view is a consistent,
+    read-only picture of the store at one ``version`` and offers ``all``,
+    ``page``, ``member_all``, ``member_page``, ``member_version`` and
+    ``members``; ``page`` returns ``(seq, record)`` pairs. ``stats`` returns
+    the running ``WorkoutStats`` of the view or of one member, and
+    ``range_json``/``range_page_json`` list workouts in a time range ordered
+    by timestamp, paging by an opaque integer key instead of a sequence
+    number. ``search_json``/``search_page_json`` list the workouts whose
+    exercise name matches a query folded by ``app.search``. The ``*_json``
+    variants of the listing methods return the same data already encoded:
+    ``all_json`` a JSON array as bytes, ``page_json`` ``(seq, bytes)`` pairs.
+    Versions only ever increase. ``epoch`` identifies the data set the versions count in: two
+    stores with the same epoch, ``generation`` and version hold the same workouts.
+    ``compact(before)`` replaces workouts timestamped before ``before`` with
+    daily rollups (see ``app.retention``) and bumps the generation.
+    ``blocking_reads`` tells async callers whether views wait on I/O and
+    should be read from a worker thread. ``warm_up`` builds what a backend
+    would otherwise build on its first read (see ``app.readiness``).
+
+    Backends call ``_committed`` after publishing each commit; that wakes
+    ``wait_for`` callers and runs ``subscribe``d listeners, which is how the
+    change feed pushes new workouts without polling.
+    """
+
+    epoch = ""
+    blocking_reads = False
+
+    def __init__(self):
+        self._changed = threading.Condition()
+        self._listeners = []
+
+    def subscribe(self, listener):
+        """Call ``listener()`` after every commit and return a function that unsubscribes it.
+
+        Listeners run on the committing thread, so they must be quick and must not raise.
+        """
+        with self._changed:
+            self._listeners = self._listeners + [listener]
+
+        def unsubscribe():
+            with self._changed:
+                self._listeners = [other for other in self._listeners if other is not listener]
+        return unsubscribe
+
+    def _committed(self):
+        with self._changed:
+            self._changed.notify_all()
+        for listener in self._listeners:
+            listener()
+
+    def watch(self):
+        """Start noticing commits made by other processes (a no-op unless the backend is shared)."""
+
+    def wait_for(self, after_seq, timeout):
+        """Block until the store holds a write newer than ``after_seq`` or ``timeout`` passes.
+
+        Returns the current view either way.
+        """
+        self.watch()
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                view = self.view()
+                remaining = deadline - time.monotonic()
+                if view.version > after_seq or remaining <= 0:
+                    return view
+                self._changed.wait(remaining)
+
+    def add(self, record):
+        return self.add_many([record])[0]
+
+    @abc.abstractmethod
+    def add_many(self, records):
+        """Store ``records`` as one commit and return their sequence numbers."""
+
+    @abc.abstractmethod
+    def view(self):
+        """Current committed read view; safe to use from any thread without locking."""
+
+    @abc.abstractmethod
+    def compact(self, before):
+        """Roll workouts timestamped before ``before`` up into daily rollups; return how many."""
+
+    @property
+    def version(self):
+        return self.view().version
+
+    def all(self):
+        return self.view().all()
+
+    def page(self, after_seq=0, limit=100):
+        return self.view().page(after_seq, limit)
+
+    def member_all(self, member):
+        return self.view().member_all(member)
+
+    def member_page(self, member, after_seq=0, limit=100):
+        return self.view().member_page(member, after_seq, limit)
+
+    def members(self):
+        return self.view().members()
+
+    def stats(self, member=None):
+        return self.view().stats(member)
+
+    def __len__(self):
+        return len(self.view())
+
+    def warm_up(self):
+        """Build lazily built indexes and touch the data, so the first requests do not pay for it."""
+        view = self.view()
+        view.stats()
+        view.members()
+
+    def close(self):
+        pass
+
+
+class WorkoutStore(BaseStore):
+    """Workouts held in memory in sequence order, optionally backed by a WorkoutLog.
+
+    Without a log, ``add_many`` publishes records immediately. With one, records
+    become visible only after the log reports them durable, so a reader never
+    sees a workout that a restart would lose.
+
+    Besides the global sequence, every record with a ``regn_id`` is also kept in
+    that member's partition so per-member reads never scan other members.
+
+    Concurrency: writers hold ``_lock`` only to take sequence numbers and hand
+    the entries to the log (or publish them, without a log); the fsync happens
+    outside it. Exactly one thread publishes at a time, under
+    ``_publish_lock``, and each commit ends by swapping in a new
+    ``StoreView``. Readers just grab the current view and never take a lock.
+
+    ``compact`` rebuilds the partitions from a view without any lock, then
+    takes ``_publish_lock`` only to add the commits made meanwhile and swap
+    the new partitions in.
+    """
+
+    def __init__(self, log=None, snapshot_every=100_000):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._all = Partition()
+        self._members = {}
+        self._next_seq = 1
+        self._names = NameIndex()
+        self._generation = 0
+        self._view = StoreView(0, self._all, 0, self._members, self._names)
+        self._publish_lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._log = log
+        self._snapshot_every = snapshot_every
+        self._snapshot_seq = 0
+        self._snapshotting = False
+        if log is not None:
+            entries = log.recover()
+            EXERCISES.seed(exercise_of(record) for _, record, _ in entries)
+            self._publish(entries)
+            if entries:
+                self._next_seq = entries[-1][0] + 1
+            self._snapshot_seq = log.snapshot_seq
+            log.on_commit = self._publish
+            self.epoch = log.epoch
+        else:
+            self.epoch = uuid.uuid4().hex[:12]
+
+    @staticmethod
+    def _index(entries, all_partition, members, names):
+        """Append ``entries`` to the table, index them and publish their stats."""
+        touched = set()
+        table = all_partition.table
+        for seq, record, encoded in entries:
+            timestamp = timestamp_of(record)
+            if timestamp is not None and not fits(timestamp):
+                timestamp = None
+            position = table.append(seq, record, encoded, timestamp)
+            all_partition.add(position, record, timestamp)
+            names.add(exercise_of(record))
+            member = member_of(record)
+            if member is not None:
+                partition = members.get(member)
+                if partition is None:
+                    partition = members[member] = MemberPartition(table)
+                partition.add(position, record, timestamp)
+                touched.add(member)
+        if len(all_partition):
+            all_partition.publish_stats()
+        for member in touched:
+            members[member].publish_stats()
+
+    def _publish(self, entries):
+        if not entries:
+            return
+        with self._publish_lock:
+            self._index(entries, self._all, self._members, self._names)
+            self._view = StoreView(entries[-1][0], self._all, len(self._all), self._members, self._names,
+                                   self._generation)
+        self._committed()
+
+    def add_many(self, records):
+        if not records:
+            return []
+        encoded = [encode_record(record) for record in records]
+        with self._lock:
+            first = self._next_seq
+            self._next_seq += len(records)
+            seqs = range(first, self._next_seq)
+            entries = list(zip(seqs, records, encoded))
+            if self._log is None:
+                self._publish(entries)
+                return list(seqs)
+            ticket = self._log.submit(entries)
+        self._log.wait(ticket)
+        self._maybe_snapshot()
+        return list(seqs)
+
+    def view(self):
+        return self._view
+
+    def compact(self, before):
+        with self._compact_lock:
+            view = self._view
+            rollups = Rollups()
+            kept = []
+            compacted = 0
+            for seq, record, encoded in view.entries():
+                timestamp = timestamp_of(record)
+                if timestamp is None or timestamp >= before:
+                    kept.append((seq, record, encoded))
+                    continue
+                rollups.add(seq, record, member_of(record), timestamp)
+                if not is_rollup(record):
+                    compacted += 1
+            if not compacted:
+                return 0
+            entries = heapq.merge(kept, ((seq, record, encode_record(record)) for seq, record in rollups.records()))
+            all_partition, members, names = Partition(), {}, NameIndex()
+            self._index(entries, all_partition, members, names)
+            with self._publish_lock:
+                old = self._all.table
+                self._index(old.entries(len(view), len(old)), all_partition, members, names)
+                self._all, self._members, self._names = all_partition, members, names
+                self._generation += 1
+                self._view = StoreView(self._view.high_seq, all_partition, len(all_partition), members, names,
+                                       self._generation)
+        if self._log is not None:
+            # Rewrite the log so a restart loads the rollups, not the old detail.
+            # If a snapshot is already being written, the compactor's first
+            # pass after a restart rolls up whatever detail it left behind.
+            with self._lock:
+                if self._snapshotting:
+                    return compacted
+                self._snapshotting = True
+            self.snapshot()
+        return compacted
+
+    def _maybe_snapshot(self):
+        with self._lock:
+            view = self._view
+            if self._snapshotting or view.high_seq - self._snapshot_seq < self._snapshot_every:
+                return
+            self._snapshotting = True
+        threading.Thread(target=self.snapshot, args=(view,), name="workout-snapshot", daemon=True).start()
+
+    def snapshot(self, view=None):
+        """Write a log snapshot of ``view`` (default: the current view)."""
+        if self._log is None:
+            return
+        view = self._view if view is None else view
+        try:
+            if len(view):
+                self._log.write_snapshot(view.entries(records=False), view.high_seq)
+                self._snapshot_seq = view.high_seq
+        finally:
+            with self._lock:
+                self._snapshotting = False
+
+    def close(self):
+        if self._log is not None:
+            self._log.close()
+
+
+def create_store(settings):
+    """Build the store described by ``settings``.
+
+    ``store="sqlite"`` selects the SQLite backend; otherwise workouts are kept in
+    memory, made durable by a WorkoutLog when ``data_dir`` is set.
+    """
+    if settings.store == "sqlite":
+        from app.sqlite_store import SqliteStore
+
+        path = settings.sqlite_path or os.path.join(settings.data_dir, "workouts.db")
+        return SqliteStore(path, synchronous="NORMAL" if settings.fsync == "interval" else "FULL")
+    if settings.store != "memory":
+        raise ValueError(f"Unknown ACEEST_STORE backend: {settings.store!r}")
+    if not settings.data_dir:
+        return WorkoutStore()
+    log = WorkoutLog(
+        settings.data_dir,
+        fsync=settings.fsync,
+        fsync_interval=settings.fsync_interval,
+        segment_bytes=settings.segment_bytes,
+    )
+    return WorkoutStore(log, snapshot_every=settings.snapshot_every)
@@ -0,0 +1,89 @@
+"""Sorted timestamp index for time-range queries.
+
+Each indexed record is one integer key, ``timestamp << ORDINAL_BITS |
+ordinal``, where ``ordinal`` is the record's 1-based position in its
+partition. Keys sort by time and then by arrival, and the ordinal both
+locates the record and tells a reader whether its view includes it.
+
+Blocks only hold ordinals, as an ``array`` of 8 bytes each; their keys are
+rebuilt from the partition's timestamp column when compared. The ordinals
+live in a list of sorted blocks of at most ``2 * BLOCK``, with the largest
+key of every block in ``maxes``. A range scan bisects ``maxes``
+and then one block, and walks forward: O(log n + k). In-order writes append
+to the last block. Out-of-order ones, such as an offline client syncing old
+sessions, are inserted into the block they belong to, which costs O(B)
+rather than O(n).
+
+Only the store's publishing thread writes. A block that splits is replaced,
+not modified, and ``(maxes, blocks)`` is swapped in as one tuple, so readers
+never lock. They copy each block they walk, because an insert may still
+shift it under them, and skip ordinals beyond their view.
+"""
+from array import array
+from bisect import bisect_left, insort
+
+ORDINAL_BITS = 40
+ORDINAL_MASK = (1 << ORDINAL_BITS) - 1
+
+# Keys per block after a split; blocks split when they reach twice this.
+BLOCK = 512
+
+
+def range_key(timestamp, ordinal=0):
+    return int(timestamp) << ORDINAL_BITS | ordinal
+
+
+class TimeIndex:
+    """Ordinals sorted by ``(timestamp_at(ordinal), ordinal)``."""
+
+    def __init__(self, timestamp_at):
+        self._timestamp_at = timestamp_at
+        self._state = ([], [])
+
+    def _key(self, ordinal):
+        return self._timestamp_at(ordinal) << ORDINAL_BITS | ordinal
+
+    def add(self, timestamp, ordinal):
+        """Index the record at ``ordinal`` (1-based), whose timestamp is ``timestamp`` (whole epoch seconds)."""
+        key = timestamp << ORDINAL_BITS | ordinal
+        maxes, blocks = self._state
+        if not blocks:
+            self._state = ([key], [array("q", [ordinal])])
+            return
+        if key > maxes[-1]:
+            i = len(blocks) - 1
+            blocks[i].append(ordinal)
+            maxes[i] = key
+        else:
+            i = bisect_left(maxes, key)
+            insort(blocks[i], ordinal, key=self._key)
+        block = blocks[i]
+        if len(block) >= 2 * BLOCK:
+            self._state = (maxes[:i] + [self._key(block[BLOCK - 1]), maxes[i]] + maxes[i + 1:],
+                           blocks[:i] + [block[:BLOCK], block[BLOCK:]] + blocks[i + 1:])
+
+    def scan(self, start, end, count, after=0, limit=None):
+        """Keys with ``start <= timestamp < end`` and ordinal ``<= count``, in time order.
+
+        ``end`` may be ``None`` for no upper bound. Scanning resumes after key
+        ``after``, and stops after ``limit`` keys when one is given.
+        """
+        low = max(range_key(start), after + 1)
+        high = range_key(end) if end is not None else None
+        maxes, blocks = self._state
+        key_of = self._key
+        keys = []
+        for i in range(bisect_left(maxes, low), len(blocks)):
+            block = blocks[i][:]
+            for ordinal in block[bisect_left(block, low, key=key_of):]:
+                key = key_of(ordinal)
+                if high is not None and key >= high:
+                    return keys
+                if ordinal <= count:
+                    keys.append(key)
+                    if len(keys) == limit:
+                        return keys
+        return keys
+
+    def __len__(self):
+        return sum(len(block) for block in self._state[1])
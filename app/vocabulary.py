@@ -0,0 +1,117 @@
+"""Canonical exercise and category names, each with a small integer ID.
+
+Clients spell the same exercise many ways: ``"Push-ups"``, ``"push ups"``,
+``"PUSHUPS"``. ``Vocabulary`` folds a name the way search does
+(``app.search.fold``: lowercase, letters and digits only) and maps every
+spelling with the same fold to one ID and one canonical spelling. The
+canonical spelling is the seeded name, or else the first spelling seen.
+
+``EXERCISES`` and ``CATEGORIES`` are shared by the whole process:
+
+* ``app.schema.normalize`` rewrites known names to their canonical
+  spelling while it validates, and ``app.schema.canonicalize`` learns the
+  new ones once a whole request has validated, right before it is stored.
+  Every stored workout therefore references one shared ``str`` per
+  exercise, and a listing never shows two spellings of one exercise.
+* ``app.columnar.WorkoutTable`` stores the IDs as its exercise and
+  category codes, so no per-store copy of the names is needed.
+
+``CATEGORIES`` is closed: it only knows the desktop app's three categories
+(see ``app.schema.MET_VALUES``). ``EXERCISES`` learns the new names of
+stored workouts; a rejected request teaches it nothing. Its seed keeps the common names spelled the same in every process,
+whatever spelling a process happens to see first, and every store seeds it
+with the names it holds when it is opened (``seed``). A restarted process,
+or a worker forked from it, so keeps the spelling already stored.
+
+IDs are never reused, since columnar tables hold them, so names learned
+from requests are capped at ``MAX_LEARNED``. Past it, a new name has no ID:
+``canonical`` is ``None`` and the name is stored as sent, as for a closed
+vocabulary. Seeded names do not count against the cap.
+
+Folding walks every character, so exact spellings already seen are looked
+up directly, up to ``MAX_SPELLINGS`` of them. ID 0 is null, as in
+``app.columnar.Dictionary``. Lookups do not lock.
+Learning a name takes a lock, and the name goes into ``values`` before its
+ID is published.
+"""
+import threading
+
+from app.search import fold
+
+COMMON_EXERCISES = (
+    "Push-ups", "Pull-ups", "Sit-ups", "Squats", "Lunges", "Plank", "Burpees", "Deadlift",
+    "Bench Press", "Jumping Jacks", "Running", "Cycling", "Rowing", "Swimming", "Yoga", "Stretching",
+)
+MAX_SPELLINGS = 65536
+MAX_LEARNED = 65536
+
+
+class Vocabulary:
+    """Folded names mapped to IDs and canonical spellings."""
+
+    def __init__(self, names=(), grow=True, max_learned=MAX_LEARNED):
+        self.values = [None]
+        self.max_learned = max_learned
+        self._ids = {}
+        self._spellings = {}
+        self._grow = grow
+        self._learned = 0
+        self._lock = threading.Lock()
+        self.seed(names)
+
+    def seed(self, names):
+        """Make each of ``names`` canonical unless its fold already has a spelling."""
+        for name in names:
+            folded = fold(name) if name else ""
+            if folded and folded not in self._ids:
+                self._learn(folded, name, seeded=True)
+
+    def _learn(self, folded, name, seeded=False):
+        with self._lock:
+            found = self._ids.get(folded)
+            if found is None:
+                if not seeded:
+                    if self._learned >= self.max_learned:
+                        return None
+                    self._learned += 1
+                found = len(self.values)
+                self.values.append(name)
+                self._ids[folded] = found
+            return found
+
+    def id(self, name, learn=True):
+        """The ID of ``name``, or ``None`` if it folds to nothing or the vocabulary is closed or full.
+
+        With ``learn=False`` an unknown name is ``None`` too and is not learned.
+        """
+        found = self._spellings.get(name)
+        if found is not None:
+            return found
+        folded = fold(name)
+        found = self._ids.get(folded)
+        if found is None and folded and self._grow and learn:
+            found = self._learn(folded, name)
+        if found is not None and len(self._spellings) < MAX_SPELLINGS:
+            self._spellings[name] = found
+        return found
+
+    def name(self, id):
+        """The canonical spelling of ``id``."""
+        return self.values[id]
+
+    def canonical(self, name, learn=True):
+        """The canonical spelling of ``name``, or ``None`` as for ``id``."""
+        found = self.id(name, learn)
+        return None if found is None else self.values[found]
+
+    def code(self, value):
+        """The ID of ``value`` if it is spelled canonically, else ``None``."""
+        found = self.id(value)
+        return found if found is not None and self.values[found] == value else None
+
+    def __len__(self):
+        return len(self.values)
+
+
+EXERCISES = Vocabulary(COMMON_EXERCISES)
+CATEGORIES = Vocabulary(("Warm-up", "Workout", "Cool-down"), grow=False)
@@ -1,21 +1,239 @@
+import atexit
+import threading
+
 from flask import Flask, jsonify, request
 
+from app.capture import init_capture
+from app.changes import (EVENT_STREAM, RETRY_AFTER as STREAM_RETRY_AFTER, change_args, changes_body, event_stream,
+                         stream_slots, wants_event_stream)
+from app.codec import CodecJSONProvider, dumps
+from app.compression import cached_response, etag_variants, init_compression
+from app.config import Settings
+from app.idempotency import IDEMPOTENCY_HEADER, REPLAYED_HEADER, IdempotencyError, init_idempotency
+from app.ingest import (BodyTooLarge, MalformedBody, TooManyRecords, UnsupportedContentType, iter_records,
+                        parse_workout, read_batch, read_body)
+from app.metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, init_metrics, store_gauges
+from app.pagination import InvalidPageRequest, listing_sources, page_args, paginated_response, search_sources
+from app.ratelimit import client_key, init_rate_limits
+from app.readiness import init_readiness, init_store_gate
+from app.retention import init_retention
+from app.schema import MET_VALUES, InvalidWorkout, canonicalize
+from app.store import MEMBER_FIELD, create_store
+
 fitness_app = Flask(__name__)
-workouts = []
+fitness_app.json = CodecJSONProvider(fitness_app)
+settings = Settings.from_env()
+# Opened by open_store on the warm-up thread, so /healthz answers while the
+# log replays; until then the other routes answer 503 (see app.readiness).
+store = None
+compactor = None
+_opening = threading.Lock()
+streams = stream_slots(settings)
+init_store_gate(fitness_app, lambda: store is not None)
+init_metrics(fitness_app)
+capture = init_capture(fitness_app, settings)
+if capture is not None:
+    atexit.register(capture.close)
+init_compression(fitness_app, settings)
+init_rate_limits(fitness_app, settings)
+init_idempotency(fitness_app, settings)
+
+def open_store():
+    """Open the store and start its compactor, once per process; returns the store.
+
+    This is the ``store`` phase of warm-up. The ASGI app calls it too.
+    """
+    global store, compactor
+    with _opening:
+        if store is None:
+            opened = create_store(settings)
+            atexit.register(opened.close)
+            compactor = init_retention(opened, settings)
+            if compactor is not None:
+                # Registered after store.close, so it stops first.
+                atexit.register(compactor.stop)
+            store = opened
+    return store
+
+# Response to a stored workout, and to every retry of it.
+ADDED = (201, dumps({"message": "Workout added successfully"}))
 
 @fitness_app.route("/")
 def home():
     return jsonify({"message": "Welcome to ACEest Fitness Web API"})
 
+def add_once(overrides=None):
+    """Size-check, normalize and store the request's workout, unless it is a retry.
+
+    A retry gets the original response back without touching the store
+    (see ``app.idempotency``).
+    """
+    if not request.is_json:
+        raise UnsupportedContentType("Content-Type must be application/json")
+    body = read_body(request.stream, request.content_length, settings.max_body_bytes)
+    workout = parse_workout(body, overrides)
+    claim = fitness_app.extensions["idempotency"].claim(
+        request.headers.get(IDEMPOTENCY_HEADER), client_key(request.headers, request.remote_addr, settings),
+        f"{store.epoch}:{request.path}", body, ADDED)
+    if claim.replay is not None:
+        status, payload = claim.replay
+        return fitness_app.response_class(payload, status, {REPLAYED_HEADER: "true"}, mimetype="application/json")
+    try:
+        store.add(canonicalize([workout])[0])
+    except BaseException:
+        claim.release()
+        raise
+    claim.complete(*ADDED)
+    return fitness_app.response_class(ADDED[1], ADDED[0], mimetype="application/json")
+
 @fitness_app.route("/add", methods=["POST"])
 def add_workout():
-    data = request.json
-    workouts.append(data)
-    return jsonify({"message": "Workout added successfully"}), 201
+    return add_once()
+
+@fitness_app.route("/add/batch", methods=["POST"])
+def add_workout_batch():
+    records = iter_records(request.stream, request.content_type, request.headers.get("Content-Encoding"),
+                           settings.batch_max_bytes, settings.max_body_bytes)
+    accepted, results = read_batch(records, settings.batch_max_records)
+    store.add_many(canonicalize(accepted))
+    return jsonify({
+        "accepted": len(accepted),
+        "rejected": len(results) - len(accepted),
+        "results": results,
+    })
+
+@fitness_app.errorhandler(MalformedBody)
+@fitness_app.errorhandler(InvalidPageRequest)
+@fitness_app.errorhandler(InvalidWorkout)
+def bad_request(error):
+    return jsonify({"error": str(error)}), 400
+
+@fitness_app.errorhandler(TooManyRecords)
+@fitness_app.errorhandler(BodyTooLarge)
+def too_many_records(error):
+    return jsonify({"error": str(error)}), 413
+
+@fitness_app.errorhandler(UnsupportedContentType)
+def unsupported_media_type(error):
+    return jsonify({"error": str(error)}), 415
+
+@fitness_app.errorhandler(IdempotencyError)
+def idempotency_error(error):
+    return jsonify({"error": str(error)}), error.status
+
+def conditional(version, render, generation=0):
+    """Answer ``If-None-Match`` with a 304 before ``render`` serializes anything.
+
+    The strong ETag is the store epoch, the compaction ``generation`` of
+    listings and the write version the response was rendered from; the URL
+    (query string included) scopes it to one listing. Compressed
+    representations carry the same tag with an encoding suffix.
+    """
+    etag = f"{store.epoch}.{generation}.{version}"
+    for variant in etag_variants(etag):
+        if variant in request.if_none_match:
+            response = fitness_app.response_class(status=304)
+            response.set_etag(variant)
+            return response
+    cached = cached_response(fitness_app, etag)
+    if cached is not None:
+        return cached
+    response = render()
+    response.set_etag(etag)
+    return response
+
+def listing(all_json, page_json):
+    # Without paging arguments a listing keeps returning the full list.
+    if "cursor" not in request.args and "limit" not in request.args:
+        return fitness_app.response_class(all_json(), mimetype="application/json")
+    after, limit = page_args(request.args)
+    return paginated_response(page_json(after, limit + 1), limit)
 
 @fitness_app.route("/view", methods=["GET"])
 def view_workouts():
-    return jsonify(workouts)
+    view = store.view()
+    sources = listing_sources(view, request.args)
+    return conditional(view.version, lambda: listing(*sources), view.generation)
+
+@fitness_app.route("/users/<regn_id>/workouts", methods=["POST"])
+def add_member_workout(regn_id):
+    return add_once({MEMBER_FIELD: regn_id})
+
+@fitness_app.route("/users/<regn_id>/workouts", methods=["GET"])
+def view_member_workouts(regn_id):
+    view = store.view()
+    sources = listing_sources(view, request.args, regn_id)
+    return conditional(view.member_version(regn_id), lambda: listing(*sources), view.generation)
+
+@fitness_app.route("/search", methods=["GET"])
+def search_workouts():
+    view = store.view()
+    sources = search_sources(view, request.args)
+    return conditional(view.version, lambda: listing(*sources), view.generation)
+
+@fitness_app.route("/users/<regn_id>/search", methods=["GET"])
+def search_member_workouts(regn_id):
+    view = store.view()
+    sources = search_sources(view, request.args, regn_id)
+    return conditional(view.member_version(regn_id), lambda: listing(*sources), view.generation)
+
+@fitness_app.route("/stats", methods=["GET"])
+def view_stats():
+    stats = store.view().stats()
+    return conditional(stats.version, lambda: jsonify(stats.body(None, MET_VALUES)))
+
+@fitness_app.route("/users/<regn_id>/stats", methods=["GET"])
+def view_member_stats(regn_id):
+    stats = store.view().stats(regn_id)
+    return conditional(stats.version, lambda: jsonify(stats.body(regn_id, MET_VALUES)))
+
+@fitness_app.route("/changes", methods=["GET"])
+def view_changes():
+    since, limit, wait = change_args(request.args, request.headers.get("Last-Event-ID"))
+    stream = wants_event_stream(request.accept_mimetypes)
+    if (stream or wait) and not streams.acquire(blocking=False):
+        # Every slot holds a thread; leave the rest of them to other requests.
+        response = jsonify({"error": "too many open long-polls and event streams"})
+        response.status_code = 503
+        response.headers["Retry-After"] = STREAM_RETRY_AFTER
+        return response
+    if stream:
+        response = fitness_app.response_class(
+            event_stream(store, since), mimetype=EVENT_STREAM, headers={"Cache-Control": "no-cache"})
+        response.call_on_close(streams.release)
+        return response
+    if wait:
+        try:
+            view = store.wait_for(since, wait)
+        finally:
+            streams.release()
+    else:
+        view = store.view()
+    return conditional(view.version, lambda: fitness_app.response_class(
+        changes_body(store.epoch, view, since, limit), mimetype="application/json"), view.generation)
+
+@fitness_app.route("/metrics", methods=["GET"])
+def metrics():
+    gauges = store_gauges(store) if store is not None else []
+    gauges += fitness_app.extensions["readiness"].gauges()
+    if fitness_app.extensions["capture"] is not None:
+        gauges += fitness_app.extensions["capture"].gauges()
+    if compactor is not None:
+        gauges += compactor.gauges()
+    body = fitness_app.extensions["metrics"].render(gauges)
+    return fitness_app.response_class(body, content_type=METRICS_CONTENT_TYPE)
+
+@fitness_app.route("/healthz", methods=["GET"])
+def healthz():
+    return jsonify({"status": "ok"})
+
+@fitness_app.route("/readyz", methods=["GET"])
+def readyz():
+    readiness = fitness_app.extensions["readiness"]
+    return jsonify(readiness.body()), 200 if readiness.ready else 503
+
+# After every route and hook is registered: warm-up sends requests at once.
+readiness = init_readiness(fitness_app, open_store)
 
 if __name__ == '__main__':
     fitness_app.run(host='0.0.0.0', port=5000)
@@ -0,0 +1,330 @@
+"""Append-only, segmented on-disk log for web API workouts.
+
+Every entry is a ``(seq, record, encoded)`` triple, where ``encoded`` is the
+record's compact JSON as produced by the store. It is written as one
+CRC-checked ``[seq,record]`` JSON line, reusing those bytes, into a segment
+file named after the first sequence number it holds. Segments roll over
+once they pass ``segment_bytes``. A snapshot file holds every entry up to a
+sequence number; once it is on disk the segments it covers are deleted, so
+startup loads the snapshot and replays only the tail.
+
+fsync policy
+------------
+``always``    every append call is written and fsynced on its own.
+``batch``     (default) group commit. Appends that arrive while a flush is in
+              progress queue up and the next flushing thread writes and
+              fsyncs them all at once. An acknowledged append is on disk.
+``interval``  appends are written to the OS straight away but fsynced at most
+              once every ``fsync_interval`` seconds, by a background thread.
+              A machine crash can lose up to that window of acknowledged
+              appends; a process crash loses nothing.
+"""
+import os
+import threading
+import time
+import uuid
+import zlib
+
+from app.codec import loads
+
+FSYNC_POLICIES = ("always", "batch", "interval")
+SEGMENT_SUFFIX = ".log"
+SNAPSHOT_PREFIX = "snapshot-"
+SNAPSHOT_SUFFIX = ".jsonl"
+EPOCH_FILE = "EPOCH"
+# Lines are parsed in blocks as one JSON array, which is several times
+# faster than a loads call per line.
+REPLAY_BLOCK = 4096
+
+
+class LogCorruptionError(Exception):
+    """A sealed segment or snapshot failed its integrity check."""
+
+
+def encode_entry(seq, encoded):
+    payload = b"[%d,%s]" % (seq, encoded)
+    return b"%08x %s\n" % (zlib.crc32(payload), payload)
+
+
+def decode_entry(line):
+    """Return ``(seq, record)`` for a log line, or ``None`` if it is torn or corrupt."""
+    if not line.endswith(b"\n"):
+        return None
+    crc, _, payload = line[:-1].partition(b" ")
+    try:
+        if int(crc, 16) != zlib.crc32(payload):
+            return None
+        seq, record = loads(payload)
+    except ValueError:
+        return None
+    return seq, record
+
+
+def _parse_block(payloads):
+    """Decode ``[seq,record]`` payloads into ``(seq, record, encoded)`` triples.
+
+    The record's JSON is sliced out of the payload rather than re-encoded.
+    """
+    parsed = loads(b"[" + b",".join(payloads) + b"]")
+    return [(seq, record, payload[payload.index(b",") + 1:-1])
+            for (seq, record), payload in zip(parsed, payloads)]
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WorkoutLog:
+    def __init__(self, directory, fsync="batch", fsync_interval=1.0, segment_bytes=64 * 1024 * 1024):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {FSYNC_POLICIES}, got {fsync!r}")
+        self.directory = directory
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        # Called by the flushing thread with each durable batch, in log order.
+        self.on_commit = None
+        # Sequence number covered by the newest snapshot on disk.
+        self.snapshot_seq = 0
+        # Random ID of this log directory, fixed when it is first created.
+        self.epoch = ""
+
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()
+        self._pending = []
+        self._open_batch = 1
+        self._durable_batch = 0
+        self._flushing = False
+        self._error = None
+        self._segment = None
+        self._segment_size = 0
+        self._dirty = False
+        self._closed = False
+        self._syncer = None
+        os.makedirs(directory, exist_ok=True)
+
+    # ---------- Recovery ----------
+    def _segments(self):
+        names = [n for n in os.listdir(self.directory) if n.endswith(SEGMENT_SUFFIX)]
+        return sorted((int(n[:-len(SEGMENT_SUFFIX)]), n) for n in names)
+
+    def _snapshots(self):
+        names = [n for n in os.listdir(self.directory)
+                 if n.startswith(SNAPSHOT_PREFIX) and n.endswith(SNAPSHOT_SUFFIX)]
+        return sorted((int(n[len(SNAPSHOT_PREFIX):-len(SNAPSHOT_SUFFIX)]), n) for n in names)
+
+    def recover(self):
+        """Load the latest snapshot plus the log tail and open the log for appends.
+
+        Returns the recovered ``(seq, record, encoded)`` entries in sequence order. A torn
+        write at the end of the newest segment is truncated away.
+        """
+        self.epoch = self._load_epoch()
+        entries = []
+        snapshot_seq = 0
+        snapshots = self._snapshots()
+        if snapshots:
+            snapshot_seq, name = snapshots[-1]
+            block = []
+            with open(os.path.join(self.directory, name), "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        raise LogCorruptionError(f"{name} is truncated")
+                    block.append(line[:-1])
+                    if len(block) == REPLAY_BLOCK:
+                        entries.extend(_parse_block(block))
+                        block = []
+            entries.extend(_parse_block(block))
+
+        segments = self._segments()
+        for i, (_, name) in enumerate(segments):
+            path = os.path.join(self.directory, name)
+            last = i == len(segments) - 1
+            good_bytes = 0
+            block = []
+            with open(path, "rb") as f:
+                for line in f:
+                    crc, _, payload = line[:-1].partition(b" ")
+                    try:
+                        valid = line.endswith(b"\n") and int(crc, 16) == zlib.crc32(payload)
+                    except ValueError:
+                        valid = False
+                    if not valid:
+                        if not last:
+                            raise LogCorruptionError(f"corrupt entry in sealed segment {name}")
+                        break
+                    good_bytes += len(line)
+                    block.append(payload)
+                    if len(block) == REPLAY_BLOCK:
+                        entries.extend(e for e in _parse_block(block) if e[0] > snapshot_seq)
+                        block = []
+            entries.extend(e for e in _parse_block(block) if e[0] > snapshot_seq)
+            if last and good_bytes != os.path.getsize(path):
+                with open(path, "r+b") as f:
+                    f.truncate(good_bytes)
+                    os.fsync(f.fileno())
+
+        self.snapshot_seq = snapshot_seq
+        if segments:
+            self._open_segment(segments[-1][1])
+        if self.fsync == "interval":
+            self._syncer = threading.Thread(target=self._sync_loop, name="workout-log-fsync", daemon=True)
+            self._syncer.start()
+        return entries
+
+    def _load_epoch(self):
+        path = os.path.join(self.directory, EPOCH_FILE)
+        try:
+            with open(path) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            epoch = uuid.uuid4().hex[:12]
+            with open(path, "w") as f:
+                f.write(epoch)
+                f.flush()
+                os.fsync(f.fileno())
+            _fsync_dir(self.directory)
+            return epoch
+
+    # ---------- Appends ----------
+    def submit(self, entries):
+        """Queue entries for the next commit and return a ticket to pass to ``wait``."""
+        lines = [encode_entry(seq, encoded) for seq, _, encoded in entries]
+        with self._cond:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise ValueError("workout log is closed")
+            ticket = self._open_batch
+            if self.fsync == "always":
+                # Every append call is a batch of its own.
+                self._open_batch += 1
+            self._pending.append((ticket, entries, lines))
+            return ticket
+
+    def wait(self, ticket):
+        """Block until the batch holding ``ticket`` is durable, flushing it if nobody else is."""
+        with self._cond:
+            while self._durable_batch < ticket:
+                if self._flushing:
+                    self._cond.wait()
+                    continue
+                self._flush_locked()
+            if self._error is not None:
+                raise self._error
+
+    def append(self, entries):
+        self.wait(self.submit(entries))
+
+    def _flush_locked(self):
+        if self.fsync == "always":
+            batch, self._pending = self._pending[:1], self._pending[1:]
+            batch_no = batch[0][0]
+        else:
+            batch, self._pending = self._pending, []
+            batch_no = self._open_batch
+            self._open_batch += 1
+        self._flushing = True
+        self._cond.release()
+        try:
+            error = None
+            try:
+                self._write(batch)
+            except OSError as exc:
+                error = exc
+        finally:
+            self._cond.acquire()
+        if error is not None:
+            # Fail-stop: after a failed write nothing later may be acknowledged.
+            self._error = error
+        elif self.on_commit is not None:
+            self.on_commit([entry for _, entries, _ in batch for entry in entries])
+        self._durable_batch = batch_no
+        self._flushing = False
+        self._cond.notify_all()
+
+    def _write(self, batch):
+        if not batch:
+            return
+        with self._io_lock:
+            if self._segment is None or self._segment_size >= self.segment_bytes:
+                self._roll_segment(batch[0][1][0][0])
+            data = b"".join(line for _, _, lines in batch for line in lines)
+            self._segment.write(data)
+            self._segment.flush()
+            self._segment_size += len(data)
+            if self.fsync == "interval":
+                self._dirty = True
+            else:
+                os.fsync(self._segment.fileno())
+
+    def _open_segment(self, name):
+        path = os.path.join(self.directory, name)
+        self._segment = open(path, "ab")
+        self._segment_size = os.path.getsize(path)
+
+    def _roll_segment(self, first_seq):
+        if self._segment is not None:
+            os.fsync(self._segment.fileno())
+            self._segment.close()
+        self._open_segment(f"{first_seq:020d}{SEGMENT_SUFFIX}")
+        _fsync_dir(self.directory)
+
+    def _sync_loop(self):
+        while not self._closed:
+            time.sleep(self.fsync_interval)
+            self.sync()
+
+    def sync(self):
+        with self._io_lock:
+            if self._dirty and self._segment is not None:
+                os.fsync(self._segment.fileno())
+                self._dirty = False
+
+    # ---------- Snapshots ----------
+    def write_snapshot(self, entries, upto_seq):
+        """Write every entry with ``seq <= upto_seq`` as a snapshot and drop covered segments.
+
+        ``entries`` may be any iterable of ``(seq, record, encoded)`` in sequence order; it
+        is streamed to disk, so callers can pass a view instead of a copy.
+        """
+        final = os.path.join(self.directory, f"{SNAPSHOT_PREFIX}{upto_seq:020d}{SNAPSHOT_SUFFIX}")
+        tmp = final + ".tmp"
+        with open(tmp, "wb") as f:
+            for seq, _, encoded in entries:
+                if seq > upto_seq:
+                    break
+                f.write(b"[%d,%s]\n" % (seq, encoded))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, final)
+        _fsync_dir(self.directory)
+        self.snapshot_seq = upto_seq
+
+        for seq, name in self._snapshots():
+            if seq < upto_seq:
+                os.remove(os.path.join(self.directory, name))
+        with self._io_lock:
+            segments = self._segments()
+            active = os.path.basename(self._segment.name) if self._segment is not None else None
+            for (first, name), (next_first, _) in zip(segments, segments[1:]):
+                if name != active and next_first - 1 <= upto_seq:
+                    os.remove(os.path.join(self.directory, name))
+
+    def close(self):
+        with self._cond:
+            while self._flushing:
+                self._cond.wait()
+            while self._pending:
+                self._flush_locked()
+            self._closed = True
+        with self._io_lock:
+            if self._segment is not None:
+                self._segment.flush()
+                os.fsync(self._segment.fileno())
+                self._segment.close()
+                self._segment = None
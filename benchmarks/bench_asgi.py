@@ -0,0 +1,189 @@
+"""Load test: sync (Flask, threaded server) vs async (ASGI, uvicorn) at high concurrency.
+
+    python benchmarks/bench_asgi.py --connections 50,200,1000 --requests 20
+
+Each server runs in its own process with a fresh in-memory store preloaded
+with ``--workouts`` records. For every concurrency level, that many client
+connections are opened at once and each sends ``--requests`` keep-alive
+``GET`` requests for ``--path``. The table shows the connections that were
+open at the same time (servers that close connections after each response
+force reconnects), throughput, latency percentiles, errors, and the server's
+peak thread count (sampled from /proc).
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+SERVERS = {
+    "sync": "import app.web_app as w; w.fitness_app.run(host='127.0.0.1', port={port}, threaded=True)",
+    "async": ("import uvicorn, app.asgi_app as a; "
+              "uvicorn.run(a.fitness_app, host='127.0.0.1', port={port}, log_level='warning', backlog=4096)"),
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def request(reader, writer, method, path, body=b"", content_type="application/json"):
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+    if body:
+        head += f"Content-Type: {content_type}\r\n"
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("server closed the connection")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        payload = await reader.readexactly(int(headers["content-length"]))
+    else:
+        payload = await reader.read()
+    keep_alive = status_line.startswith(b"HTTP/1.1") and headers.get("connection", "").lower() != "close"
+    return int(status_line.split()[1]), payload, keep_alive
+
+
+class Connections:
+    def __init__(self):
+        self.open = self.peak = 0
+
+    async def connect(self, port):
+        conn = await asyncio.open_connection("127.0.0.1", port)
+        self.open += 1
+        self.peak = max(self.peak, self.open)
+        return conn
+
+    def close(self, conn):
+        conn[1].close()
+        self.open -= 1
+
+
+async def client(port, path, count, latencies, errors, connections):
+    conn = None
+    for _ in range(count):
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = await connections.connect(port)
+            status, _, keep_alive = await request(*conn, "GET", path)
+            if status != 200:
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError) as exc:
+            errors.append(type(exc).__name__)
+            keep_alive = False
+        else:
+            latencies.append(time.perf_counter() - started)
+        if conn is not None and not keep_alive:
+            connections.close(conn)
+            conn = None
+    if conn is not None:
+        connections.close(conn)
+
+
+async def load(port, connections, path, count):
+    latencies, errors, tracker = [], [], Connections()
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, path, count, latencies, errors, tracker) for _ in range(connections)))
+    return latencies, errors, tracker.peak, time.perf_counter() - started
+
+
+async def preload(port, workouts):
+    body = "\n".join(json.dumps({"workout": "Push-ups", "duration": i % 60 + 1, "calories": 42.5})
+                     for i in range(workouts)).encode()
+    conn = await asyncio.open_connection("127.0.0.1", port)
+    status, payload, _ = await request(*conn, "POST", "/add/batch", body, "application/x-ndjson")
+    conn[1].close()
+    assert status == 200, payload
+
+
+def threads_of(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("Threads:"):
+                return int(line.split()[1])
+    return 0
+
+
+class ThreadSampler(threading.Thread):
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid, self.peak, self.done = pid, 0, threading.Event()
+
+    def run(self):
+        while not self.done.wait(0.05):
+            try:
+                self.peak = max(self.peak, threads_of(self.pid))
+            except OSError:
+                return
+
+
+def start(kind, port):
+    env = dict(os.environ, PYTHONPATH=ROOT, ACEEST_STORE="memory")
+    env.pop("ACEEST_DATA_DIR", None)
+    proc = subprocess.Popen([sys.executable, "-c", SERVERS[kind].format(port=port)], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(200):
+        try:
+            # Ready, not just listening: routes answer 503 until the store is open.
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", default="50,200,1000")
+    parser.add_argument("--requests", type=int, default=20, help="requests per connection")
+    parser.add_argument("--workouts", type=int, default=10_000)
+    parser.add_argument("--path", default="/view?limit=100")
+    args = parser.parse_args()
+
+    print(f"{'server':<6} {'conns':>6} {'open':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} "
+          f"{'errors':>7} {'threads':>8}")
+    for kind in SERVERS:
+        port = free_port()
+        proc = start(kind, port)
+        try:
+            asyncio.run(preload(port, args.workouts))
+            for connections in (int(c) for c in args.connections.split(",")):
+                sampler = ThreadSampler(proc.pid)
+                sampler.start()
+                latencies, errors, connected, elapsed = asyncio.run(
+                    load(port, connections, args.path, args.requests))
+                sampler.done.set()
+                sampler.join()
+                print(f"{kind:<6} {connections:>6} {connected:>7} {len(latencies) / elapsed:8.0f} "
+                      f"{percentile(latencies, 50) * 1e3:8.1f} {percentile(latencies, 99) * 1e3:8.1f} "
+                      f"{len(errors):>7} {sampler.peak:>8}")
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+if __name__ == "__main__":
+    main()
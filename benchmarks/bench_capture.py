@@ -0,0 +1,63 @@
+"""Per-request cost of traffic capture (app/capture.py).
+
+    python benchmarks/bench_capture.py --requests 20000
+
+Sends ``--requests`` requests through the Flask test client, alternating
+``POST /add`` and ``GET /view?limit=100`` into a fresh store, with capture
+off and on (into a temporary directory) in turn, ``--rounds`` times.
+Reports the best mean time per request of each, the capture's bytes per
+request and the entries dropped.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import web_app  # noqa: E402
+from app.capture import CaptureLog, capture_files  # noqa: E402
+from app.store import WorkoutStore  # noqa: E402
+
+web_app.readiness.wait()
+
+BODY = b'{"exercise": "Push-ups", "duration": 20, "category": "Workout", "regn_id": "M0001"}'
+
+
+def run(requests):
+    web_app.store = WorkoutStore()
+    client = web_app.fitness_app.test_client()
+    started = time.perf_counter()
+    for i in range(requests):
+        if i % 2:
+            client.get("/view?limit=100", headers={"Accept-Encoding": "gzip"})
+        else:
+            client.post("/add", data=BODY, headers={"Content-Type": "application/json", "X-Client-ID": f"c{i}"})
+    return (time.perf_counter() - started) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    off = on = float("inf")
+    for _ in range(args.rounds):
+        web_app.fitness_app.extensions["capture"] = None
+        off = min(off, run(args.requests))
+        with tempfile.TemporaryDirectory() as directory:
+            log = CaptureLog(directory)
+            web_app.fitness_app.extensions["capture"] = log
+            on = min(on, run(args.requests))
+            log.close()
+            size = sum(os.path.getsize(path) for path in capture_files(directory))
+    web_app.fitness_app.extensions["capture"] = None
+    print(f"capture off {off * 1e6:7.1f} us/request")
+    print(f"capture on  {on * 1e6:7.1f} us/request ({(on - off) * 1e6:+.1f}), "
+          f"{size / args.requests:.0f} bytes/request, {log.dropped} dropped")
+
+
+if __name__ == "__main__":
+    main()
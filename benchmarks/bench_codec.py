@@ -0,0 +1,91 @@
+"""Encode/decode throughput of the JSON codec backends.
+
+    python benchmarks/bench_codec.py --records 10000
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.codec as codec  # noqa: E402
+
+
+def workouts(n):
+    return [{
+        "exercise": "Push-ups",
+        "duration": i % 60 + 1,
+        "category": "Workout",
+        "calories": 42.5 + i % 7,
+        "timestamp": "2024-01-01 08:00:00",
+        "regn_id": f"M{i % 100}",
+    } for i in range(n)]
+
+
+def stdlib_codec():
+    saved = sys.modules.get("orjson")
+    sys.modules["orjson"] = None
+    try:
+        spec = importlib.util.spec_from_file_location("codec_stdlib", codec.__file__)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if saved is None:
+            del sys.modules["orjson"]
+        else:
+            sys.modules["orjson"] = saved
+    return module
+
+
+def timed(fn, items, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            fn(item)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    records = workouts(args.records)
+    batch = json.dumps(records).encode()
+    stdlib = stdlib_codec()
+    template = codec.RecordTemplate(codec.WORKOUT_SHAPE)
+
+    encoders = [
+        ("json.dumps", lambda r: json.dumps(r, separators=(",", ":"), ensure_ascii=False).encode()),
+        ("stdlib generic", stdlib.dumps),
+        ("stdlib workout template", template.encode),
+    ]
+    decoders = [("json.loads", json.loads), ("stdlib codec", stdlib.loads)]
+    if codec.BACKEND == "orjson":
+        encoders.append(("orjson", codec.encode_record))
+        decoders.append(("orjson", codec.loads))
+    else:
+        print("orjson not installed; showing the stdlib backends only")
+
+    print(f"encode one record ({args.records} records)")
+    for name, fn in encoders:
+        elapsed = timed(fn, records, args.repeat)
+        print(f"  {name:<28} {elapsed / len(records) * 1e6:8.2f} us/record")
+    print(f"encode a {args.records}-record list")
+    for name, fn in encoders[:2] + encoders[3:]:
+        elapsed = timed(fn, [records], args.repeat)
+        print(f"  {name:<28} {elapsed * 1e3:8.2f} ms")
+    print(f"decode a {len(batch)}-byte batch body")
+    for name, fn in decoders:
+        elapsed = timed(fn, [batch], args.repeat)
+        print(f"  {name:<28} {elapsed * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
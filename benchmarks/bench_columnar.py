@@ -0,0 +1,83 @@
+"""Memory per stored workout: one dict per workout versus the columnar store.
+
+    python benchmarks/bench_columnar.py --records 3000000
+
+Measures traced allocations, in bytes per workout, for:
+
+* ``dicts``: canonical workout dicts parsed from JSON, the way the web API
+  held them before the columnar store. This is measured on ``--sample``
+  workouts, since millions of dicts do not fit in a small container.
+* ``columns``: the columnar table's typed arrays and dictionaries alone.
+* ``store``: the whole memory store at ``--records`` workouts. That covers
+  the columns, the chunked JSON every listing is served from, the time and
+  name indexes, and the per-member partitions and running totals.
+
+Also times materializing dicts from the columns, which only happens for
+callers that ask for decoded workouts.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.codec import dumps, loads  # noqa: E402
+from app.store import WorkoutStore  # noqa: E402
+
+EXERCISES = ["Push-ups", "Squats", "Plank", "Burpees", "Lunges", "Deadlift", "Rowing", "Yoga Flow"]
+CATEGORIES = ["Warm-up", "Workout", "Cool-down"]
+
+
+def workouts(start, stop, members):
+    # The canonical shape app.schema.normalize produces.
+    return [{"exercise": EXERCISES[i % len(EXERCISES)], "duration": i % 60 + 1, "category": CATEGORIES[i % 3],
+             "calories": round(52.5 + i % 97 * 0.35, 2), "timestamp": 1704067200 + i * 3,
+             "regn_id": f"M{i % members:06d}"} for i in range(start, stop)]
+
+
+def traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=3_000_000)
+    parser.add_argument("--sample", type=int, default=200_000)
+    parser.add_argument("--members", type=int, default=10_000)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    baseline = traced()
+    sample = [loads(dumps(workout)) for workout in workouts(0, args.sample, args.members)]
+    dicts = (traced() - baseline) / args.sample
+    del sample
+
+    baseline = traced()
+    store = WorkoutStore()
+    started = time.perf_counter()
+    for start in range(0, args.records, 100_000):
+        store.add_many(workouts(start, min(start + 100_000, args.records), args.members))
+    ingest = time.perf_counter() - started
+    total = (traced() - baseline) / args.records
+    table = store.view()._all.table
+    columns = (sum(column.itemsize * len(column) for column in table.columns.values())
+               + sum(sys.getsizeof(value) for d in table.dictionaries.values() for value in d.values)) / args.records
+
+    print(f"{args.records:,} workouts, {args.members:,} members (ingest {ingest:.0f} s under tracemalloc)")
+    print(f"dicts   {dicts:8.1f} bytes/workout")
+    print(f"columns {columns:8.1f} bytes/workout  ({dicts / columns:5.1f}x less)")
+    print(f"store   {total:8.1f} bytes/workout  ({dicts / total:5.1f}x less, JSON and indexes included)")
+
+    tracemalloc.stop()
+    view = store.view()
+    started = time.perf_counter()
+    view.page(0, 100_000)
+    print(f"materializing 100,000 dicts: {(time.perf_counter() - started) * 1e3:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
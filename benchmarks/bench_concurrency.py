@@ -0,0 +1,67 @@
+"""Mixed reader/writer throughput against the workout store.
+
+    python benchmarks/bench_concurrency.py --records 200000 --readers 4 --writers 4
+
+Readers repeatedly serialize the full /view payload while writers add
+workouts through POST /add. Readers work on an immutable StoreView and never
+take a lock a writer needs, so whatever writer slowdown remains with readers
+running is CPU (GIL) time spent on JSON encoding, not lock waits.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.web_app as web_app  # noqa: E402
+from app.store import WorkoutStore  # noqa: E402
+
+web_app.readiness.wait()
+
+
+def run(readers, writers, seconds, records):
+    web_app.store = WorkoutStore()
+    web_app.store.add_many([{"workout": "Squats", "duration": i % 60} for i in range(records)])
+    stop = time.monotonic() + seconds
+    adds = [0] * writers
+    views = [0] * readers
+
+    def writer(n):
+        client = web_app.fitness_app.test_client()
+        while time.monotonic() < stop:
+            client.post("/add", json={"workout": "Plank", "duration": 5})
+            adds[n] += 1
+
+    def reader(n):
+        client = web_app.fitness_app.test_client()
+        while time.monotonic() < stop:
+            client.get("/view")
+            views[n] += 1
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(writers)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(readers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return sum(adds) / seconds, sum(views) / seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    for readers in (0, args.readers):
+        adds, views = run(readers, args.writers, args.seconds, args.records)
+        print(f"writers={args.writers} readers={readers}: {adds:8.0f} adds/sec  {views:6.1f} full /view/sec"
+              f"  ({args.records} stored workouts)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Records/sec for single-record POST /add versus POST /add/batch.
+
+    python benchmarks/bench_ingest.py --records 20000 --batch 5000
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.web_app as web_app  # noqa: E402
+from app.store import WorkoutStore  # noqa: E402
+
+web_app.readiness.wait()
+
+
+def workouts(n):
+    return [{"workout": "Push-ups", "duration": i % 60 + 1, "calories": 42.5} for i in range(n)]
+
+
+def bench_single(client, records):
+    started = time.perf_counter()
+    for record in records:
+        client.post("/add", json=record)
+    return len(records) / (time.perf_counter() - started)
+
+
+def bench_batch(client, records, batch, encode, headers):
+    bodies = [encode(records[i:i + batch]) for i in range(0, len(records), batch)]
+    started = time.perf_counter()
+    for body in bodies:
+        rv = client.post("/add/batch", data=body, headers=headers)
+        assert rv.status_code == 200, rv.data
+    return len(records) / (time.perf_counter() - started)
+
+
+def ndjson(records):
+    return "\n".join(json.dumps(r) for r in records).encode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=20_000)
+    parser.add_argument("--batch", type=int, default=5_000)
+    args = parser.parse_args()
+
+    records = workouts(args.records)
+    client = web_app.fitness_app.test_client()
+    cases = [
+        ("POST /add (one record per request)", lambda: bench_single(client, records)),
+        ("POST /add/batch JSON array", lambda: bench_batch(
+            client, records, args.batch, lambda r: json.dumps(r).encode(),
+            {"Content-Type": "application/json"})),
+        ("POST /add/batch NDJSON", lambda: bench_batch(
+            client, records, args.batch, ndjson, {"Content-Type": "application/x-ndjson"})),
+        ("POST /add/batch gzip NDJSON", lambda: bench_batch(
+            client, records, args.batch, lambda r: gzip.compress(ndjson(r)),
+            {"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"})),
+    ]
+    for name, run in cases:
+        web_app.store = WorkoutStore()
+        print(f"{name:<40} {run():12.0f} records/sec")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""Per-member read latency as the number of gym members grows.
+
+    python benchmarks/bench_members.py --per-member 20
+
+Latency of GET /users/<regn_id>/workouts should stay flat while /view-style
+full scans grow with the total number of workouts.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import app.web_app as web_app  # noqa: E402
+from app.store import WorkoutStore  # noqa: E402
+
+web_app.readiness.wait()
+
+
+def fill(members, per_member):
+    store = WorkoutStore()
+    chunk = []
+    for m in range(members):
+        for i in range(per_member):
+            chunk.append({"workout": "Squats", "duration": i + 1, "regn_id": f"M{m:07d}"})
+        if len(chunk) >= 50_000:
+            store.add_many(chunk)
+            chunk = []
+    store.add_many(chunk)
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--per-member", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    client = web_app.fitness_app.test_client()
+    for members in (100, 1_000, 10_000, 100_000):
+        web_app.store = fill(members, args.per_member)
+        started = time.perf_counter()
+        for i in range(args.requests):
+            client.get(f"/users/M{i % members:07d}/workouts")
+        per_request = (time.perf_counter() - started) / args.requests
+        scan = time.perf_counter()
+        matches = [w for w in web_app.store.all() if w["regn_id"] == "M0000000"]
+        scan = time.perf_counter() - scan
+        print(f"{members:>7} members: /users/<id>/workouts {per_request * 1e6:8.0f} us"
+              f"   full-scan equivalent {scan * 1e6:10.0f} us ({len(matches)} matches)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Per-request cost of the metrics instrumentation.
+
+    python benchmarks/bench_metrics.py --requests 1000000 --threads 8
+
+First the full cost: a minimal Flask app is called through WSGI
+(``--flask-requests`` times) with and without ``init_metrics``, so the
+difference includes the three request hooks, the ``g`` writes and the
+``request.url_rule`` lookup. Then the counting alone (two ``perf_counter``
+reads, the in-flight increment and decrement, one ``observe``) on one
+thread and on several threads at once, and how long a ``/metrics`` scrape
+takes.
+"""
+import argparse
+import io
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import Flask  # noqa: E402
+
+from app.metrics import Metrics, init_metrics  # noqa: E402
+
+ROUTES = [("/add", "POST", 201), ("/view", "GET", 200), ("/users/<regn_id>/workouts", "GET", 200),
+          ("/view", "GET", 304), ("/changes", "GET", 200)]
+
+
+def instrumented(metrics, n):
+    perf_counter = time.perf_counter
+    for i in range(n):
+        route, method, status = ROUTES[i % len(ROUTES)]
+        started = perf_counter()
+        shard = metrics.shard()
+        shard.in_flight += 1
+        metrics.observe(route, method, status, perf_counter() - started, 512, shard)
+        shard.in_flight -= 1
+
+
+def flask_app(metrics):
+    app = Flask("bench")
+    if metrics:
+        init_metrics(app)
+
+    @app.route("/users/<regn_id>/workouts")
+    def workouts(regn_id):
+        return "[]"
+
+    return app
+
+
+def through_flask(app, n):
+    environ = {"REQUEST_METHOD": "GET", "PATH_INFO": "/users/M1/workouts", "SERVER_NAME": "bench",
+               "SERVER_PORT": "80", "wsgi.url_scheme": "http", "wsgi.input": io.BytesIO()}
+
+    def start_response(status, headers, exc_info=None):
+        pass
+
+    for _ in range(n):
+        for _ in app.wsgi_app(dict(environ), start_response):
+            pass
+
+
+def baseline(n):
+    for i in range(n):
+        route, method, status = ROUTES[i % len(ROUTES)]
+
+
+def per_request(fn, n):
+    started = time.perf_counter()
+    fn(n)
+    return (time.perf_counter() - started) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=1_000_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--flask-requests", type=int, default=100_000)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    plain, counted = flask_app(False), flask_app(True)
+    bare = hooked = float("inf")
+    for _ in range(args.rounds):
+        bare = min(bare, per_request(lambda n: through_flask(plain, n), args.flask_requests))
+        hooked = min(hooked, per_request(lambda n: through_flask(counted, n), args.flask_requests))
+    print(f"flask:      {bare * 1e6:7.1f} us/request bare, {hooked * 1e6:.1f} with metrics "
+          f"({(hooked - bare) * 1e9:+.0f} ns, {(hooked - bare) / bare:+.1%})")
+
+    loop = per_request(baseline, args.requests)
+    metrics = Metrics()
+    one = per_request(lambda n: instrumented(metrics, n), args.requests) - loop
+    print(f"counting:   {one * 1e9:7.0f} ns/request, 1 thread")
+
+    metrics = Metrics()
+    per_thread = args.requests // args.threads
+    threads = [threading.Thread(target=instrumented, args=(metrics, per_thread)) for _ in range(args.threads)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    many = (time.perf_counter() - started) / (per_thread * args.threads) - loop
+    print(f"counting:   {many * 1e9:7.0f} ns/request, {args.threads} threads (wall clock, all threads)")
+
+    started = time.perf_counter()
+    text = metrics.render()
+    print(f"scrape:     {(time.perf_counter() - started) * 1e3:7.2f} ms for {len(text)} bytes")
+
+
+if __name__ == "__main__":
+    main()
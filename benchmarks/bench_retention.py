@@ -0,0 +1,105 @@
+"""Memory and /view cost of a long history, before and after retention compaction.
+
+    python benchmarks/bench_retention.py --records 1000000 --days 365 --retention-days 30
+
+Fills a memory store with workouts spread evenly over ``--days`` days of
+history, then compacts everything older than ``--retention-days``. Reports
+the full ``/view`` serialization time and listing size on both sides, how
+long the compaction took and the longest read latency seen while it ran.
+The same store is then rebuilt under tracemalloc, which slows everything
+down, to measure the memory it holds before and after.
+"""
+import argparse
+import gc
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.retention import DAY, retention_cutoff  # noqa: E402
+from app.store import WorkoutStore  # noqa: E402
+
+EXERCISES = ["Push-ups", "Squats", "Plank", "Burpees", "Lunges", "Deadlift", "Rowing", "Yoga Flow"]
+CATEGORIES = ["Warm-up", "Workout", "Cool-down"]
+NOW = 1735689600
+
+
+def fill(records, days, members):
+    store = WorkoutStore()
+    step = days * DAY / records
+    for start in range(0, records, 50_000):
+        store.add_many([{"exercise": EXERCISES[i % len(EXERCISES)], "duration": i % 60 + 1,
+                         "category": CATEGORIES[i % 3], "calories": 52.5,
+                         "timestamp": int(NOW - days * DAY + i * step), "regn_id": f"M{i % members:05d}"}
+                        for i in range(start, min(start + 50_000, records))])
+    return store
+
+
+def traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def timed(fn, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def report(label, store):
+    elapsed, body = timed(store.view().all_json)
+    print(f"{label:<8} {len(store):>10,} entries  /view {elapsed * 1e3:8.1f} ms  "
+          f"{len(body) / 2**20:7.1f} MiB of JSON")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--retention-days", type=float, default=30)
+    args = parser.parse_args()
+    cutoff = retention_cutoff(NOW, args.retention_days)
+
+    store = fill(args.records, args.days, args.members)
+    report("before", store)
+
+    worst = 0.0
+    done = threading.Event()
+
+    def reader():
+        nonlocal worst
+        while not done.is_set():
+            started = time.perf_counter()
+            store.view().page_json(0, 100)
+            worst = max(worst, time.perf_counter() - started)
+            time.sleep(0.001)
+    thread = threading.Thread(target=reader)
+    thread.start()
+    started = time.perf_counter()
+    compacted = store.compact(cutoff)
+    elapsed = time.perf_counter() - started
+    done.set()
+    thread.join()
+    report("after", store)
+    print(f"compacted {compacted:,} workouts in {elapsed:.1f} s; slowest first-page read meanwhile "
+          f"{worst * 1e3:.2f} ms")
+
+    del store
+    tracemalloc.start()
+    baseline = traced()
+    store = fill(args.records, args.days, args.members)
+    before = traced() - baseline
+    store.compact(cutoff)
+    after = traced() - baseline
+    print(f"memory: {before / 2**20:.1f} MiB before, {after / 2**20:.1f} MiB after ({before / after:.1f}x less)")
+
+
+if __name__ == "__main__":
+    main()
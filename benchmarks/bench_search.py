@@ -0,0 +1,92 @@
+"""Exercise-name search latency at millions of workouts.
+
+    python benchmarks/bench_search.py --records 2000000
+
+Fills a memory store with workouts drawn from a few hundred exercise names
+(spelling variants included), then times index-backed queries against the
+full scan they replace: a selective name, a broad prefix, a two-word query,
+one member's matches, and the first 100-workout page.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.search import fold  # noqa: E402
+from app.store import WorkoutStore  # noqa: E402
+
+BASES = ["Push-ups", "Squats", "Plank", "Burpees", "Lunges", "Deadlift", "Bench Press", "Rowing",
+         "Jumping Jacks", "Mountain Climbers", "Pull-ups", "Kettlebell Swing", "Box Jumps", "Yoga Flow"]
+MODIFIERS = ["", "Barbell ", "Dumbbell ", "Weighted ", "Incline ", "Single-Leg ", "Banded ", "Tempo ",
+             "Paused ", "Slow ", "Explosive ", "Wide ", "Close-Grip ", "Assisted ", "Deficit ", "Sumo ",
+             "Front ", "Back ", "Overhead ", "Goblet "]
+
+
+def names():
+    variants = []
+    for base in BASES:
+        for modifier in MODIFIERS:
+            name = modifier + base
+            variants += [name, name.lower(), name.replace("-", " ")]
+    return variants
+
+
+def fill(records, members):
+    store = WorkoutStore()
+    vocabulary = names()
+    chunk = []
+    for i in range(records):
+        chunk.append({"exercise": vocabulary[i * 7919 % len(vocabulary)], "duration": i % 60 + 1,
+                      "timestamp": 1704067200 + i, "regn_id": f"M{i % members:06d}"})
+        if len(chunk) >= 50_000:
+            store.add_many(chunk)
+            chunk = []
+    store.add_many(chunk)
+    return store
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=2_000_000)
+    parser.add_argument("--members", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    store = fill(args.records, args.members)
+    elapsed = time.perf_counter() - started
+    print(f"ingest: {args.records} workouts in {elapsed:.1f} s ({args.records / elapsed:,.0f}/s), "
+          f"{len(store.view()._names)} distinct names")
+    view = store.view()
+    member = "M000042"
+
+    scan, matches = timed(lambda: sum(1 for w in view.all() if "deadlift" in fold(w["exercise"])), 1)
+    print(f"full scan for 'deadlift': {scan * 1e3:10.1f} ms ({matches} matches)")
+    queries = [
+        ("'sumo deadlift' (all)", lambda: view.search_page_json(["sumo", "deadlift"], 0, None)),
+        ("'pull-up' first page", lambda: view.search_page_json(["pullup"], 0, 100)),
+        ("'bench' first page", lambda: view.search_page_json(["bench"], 0, 100)),
+        ("'b' first page", lambda: view.search_page_json(["b"], 0, 100)),
+        ("'deadlift' for one member", lambda: view.search_page_json(["deadlift"], 0, None, member)),
+        ("'deadlift' all, as JSON", lambda: view.search_json(["deadlift"])),
+    ]
+    for name, query in queries:
+        elapsed, result = timed(query, args.repeat)
+        count = result.count(b'"exercise"') if isinstance(result, bytes) else len(result)
+        print(f"{name:<28} {elapsed * 1e3:10.3f} ms ({count} workouts)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""Load test: Flask's development server vs the pre-fork launcher (app/server.py).
+
+    python benchmarks/bench_server.py --connections 16,64 --seconds 10
+
+Each server runs in its own process tree and is preloaded with
+``--workouts`` records. For every concurrency level, that many clients run
+for ``--seconds``. Both servers close the connection after each response,
+so clients reconnect for every request. Each client sends
+``GET /view?limit=100`` and, every ``--write-every`` requests, a
+``POST /add``. The table shows throughput, latency percentiles and errors.
+It also shows the proportional set size (PSS) of the whole server tree, in
+which pages that preloaded workers share copy-on-write count once.
+
+* ``dev``: ``fitness_app.run(threaded=True)``, the memory store.
+* ``prefork``: ``python -m app.server`` with the memory store, which is
+  always one worker with ``ACEEST_THREADS`` threads.
+* ``prefork-sqlite``: ``python -m app.server`` with SQLite and the workers
+  sized from the CPU quota, unless ``--workers`` is given.
+
+The client runs on the same machine, so give the container more CPUs
+than the servers need, or read the numbers as relative.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+DEV = "import app.web_app as w; w.fitness_app.run(host='127.0.0.1', port={port}, threaded=True)"
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def request(reader, writer, method, path, body=b"", content_type="application/json"):
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+    if body:
+        head += f"Content-Type: {content_type}\r\n"
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionResetError("server closed the connection")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        payload = await reader.readexactly(int(headers["content-length"]))
+    else:
+        payload = await reader.read()
+    keep_alive = status_line.startswith(b"HTTP/1.1") and headers.get("connection", "").lower() != "close"
+    return int(status_line.split()[1]), payload, keep_alive
+
+
+async def client(port, until, write_every, latencies, errors):
+    conn = None
+    sent = 0
+    while time.perf_counter() < until:
+        sent += 1
+        if sent % write_every:
+            method, path, body = "GET", "/view?limit=100", b""
+        else:
+            method, path, body = "POST", "/add", json.dumps({"exercise": "Plank", "duration": 5}).encode()
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = await asyncio.open_connection("127.0.0.1", port)
+            status, _, keep_alive = await request(*conn, method, path, body)
+            if status not in (200, 201):
+                errors.append(status)
+        except (OSError, asyncio.IncompleteReadError) as exc:
+            errors.append(type(exc).__name__)
+            keep_alive = False
+        else:
+            latencies.append(time.perf_counter() - started)
+        if conn is not None and not keep_alive:
+            conn[1].close()
+            conn = None
+    if conn is not None:
+        conn[1].close()
+
+
+async def load(port, connections, seconds, write_every):
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, started + seconds, write_every, latencies, errors)
+                           for _ in range(connections)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def preload(port, workouts):
+    body = "\n".join(json.dumps({"workout": "Push-ups", "duration": i % 60 + 1, "calories": 42.5})
+                     for i in range(workouts)).encode()
+    conn = await asyncio.open_connection("127.0.0.1", port)
+    status, payload, _ = await request(*conn, "POST", "/add/batch", body, "application/x-ndjson")
+    conn[1].close()
+    assert status == 200, payload
+
+
+def tree(pid):
+    pids = [pid]
+    for child in pids:
+        try:
+            with open(f"/proc/{child}/task/{child}/children") as f:
+                pids.extend(int(p) for p in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def pss(pid):
+    total = 0
+    for member in tree(pid):
+        try:
+            with open(f"/proc/{member}/smaps_rollup") as f:
+                total += sum(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+        except OSError:
+            pass
+    return total * 1024
+
+
+def start(kind, port, directory, workers):
+    env = dict(os.environ, PYTHONPATH=ROOT, ACEEST_STORE="memory", ACEEST_BIND=f"127.0.0.1:{port}")
+    env.pop("ACEEST_DATA_DIR", None)
+    if kind == "dev":
+        command = [sys.executable, "-c", DEV.format(port=port)]
+    else:
+        command = [sys.executable, "-m", "app.server"]
+    if kind == "prefork-sqlite":
+        env.update(ACEEST_STORE="sqlite", ACEEST_SQLITE_PATH=os.path.join(directory, "w.db"),
+                   ACEEST_FSYNC="interval", ACEEST_WORKERS=str(workers))
+    proc = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(400):
+        try:
+            # Ready, not just listening: routes answer 503 until the store is open.
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=1).close()
+            return proc
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError(f"{kind} server did not start")
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--connections", default="16,64")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--workouts", type=int, default=10_000)
+    parser.add_argument("--write-every", type=int, default=10)
+    parser.add_argument("--workers", type=int, default=0, help="prefork-sqlite workers; 0 sizes them")
+    args = parser.parse_args()
+
+    print(f"{'server':<15} {'conns':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'PSS MiB':>8}")
+    for kind in ("dev", "prefork", "prefork-sqlite"):
+        port = free_port()
+        with tempfile.TemporaryDirectory() as directory:
+            proc = start(kind, port, directory, args.workers)
+            try:
+                asyncio.run(preload(port, args.workouts))
+                for connections in (int(c) for c in args.connections.split(",")):
+                    latencies, errors, elapsed = asyncio.run(
+                        load(port, connections, args.seconds, args.write_every))
+                    print(f"{kind:<15} {connections:>6} {len(latencies) / elapsed:8.0f} "
+                          f"{percentile(latencies, 50) * 1e3:8.1f} {percentile(latencies, 99) * 1e3:8.1f} "
+                          f"{len(errors):>7} {pss(proc.pid) / 2**20:8.1f}")
+            finally:
+                proc.terminate()
+                proc.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""In-memory store versus the SQLite backend at 1M and 10M rows.
+
+    python benchmarks/bench_sqlite.py --rows 1000000 10000000
+
+Each backend/size pair runs in its own process so peak RSS is comparable.
+Reported: bulk insert rate, reopen-to-ready time, a deep /view page and a
+per-member listing.
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+MEMBERS = 10_000
+CHUNK = 50_000
+
+
+def rows(start, n):
+    return [{"workout": "Squats", "duration": (start + i) % 60 + 1, "category": "Workout",
+             "regn_id": f"M{(start + i) % MEMBERS:05d}", "timestamp": "2025-01-01 10:00:00"}
+            for i in range(n)]
+
+
+def open_store(backend, directory):
+    if backend == "sqlite":
+        from app.sqlite_store import SqliteStore
+        return SqliteStore(os.path.join(directory, "workouts.db"), synchronous="NORMAL")
+    from app.store import WorkoutStore
+    from app.workout_log import WorkoutLog
+    return WorkoutStore(WorkoutLog(directory), snapshot_every=10**12)
+
+
+def worker(backend, total):
+    with tempfile.TemporaryDirectory() as directory:
+        store = open_store(backend, directory)
+        started = time.perf_counter()
+        for start in range(0, total, CHUNK):
+            store.add_many(rows(start, min(CHUNK, total - start)))
+        insert = total / (time.perf_counter() - started)
+        if backend == "memory":
+            store.snapshot()
+        store.close()
+
+        started = time.perf_counter()
+        store = open_store(backend, directory)
+        view = store.view()
+        ready = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for i in range(100):
+            view.page(total - 1000 - i, 100)
+        deep_page = (time.perf_counter() - started) / 100
+
+        started = time.perf_counter()
+        for i in range(100):
+            view.member_all(f"M{i:05d}")
+        member = (time.perf_counter() - started) / 100
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        store.close()
+    print(f"{backend:<7} {total:>10} rows: insert {insert:9.0f} rows/s  ready {ready:7.2f}s  "
+          f"deep page {deep_page * 1e3:6.2f} ms  member list {member * 1e3:6.2f} ms  peak RSS {rss:7.0f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000_000, 10_000_000])
+    parser.add_argument("--worker", nargs=2, metavar=("BACKEND", "ROWS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        worker(args.worker[0], int(args.worker[1]))
+        return
+    for total in args.rows:
+        for backend in ("memory", "sqlite"):
+            subprocess.run([sys.executable, __file__, "--worker", backend, str(total)], check=True)
+
+
+if __name__ == "__main__":
+    main()
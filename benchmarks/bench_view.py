@@ -0,0 +1,55 @@
+"""GET /view latency versus store size, before and after pre-serialized buffers.
+
+    python benchmarks/bench_view.py --sizes 1000 10000 100000 1000000
+
+"jsonify" re-encodes every workout dict on each request (the original
+/view); "buffered" is the current route, which joins cached JSON chunks.
+Compression is disabled so only serialization is measured.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from flask import jsonify  # noqa: E402
+
+import app.web_app as web_app  # noqa: E402
+from app.store import WorkoutStore  # noqa: E402
+
+web_app.readiness.wait()
+
+
+def timed(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    client = web_app.fitness_app.test_client()
+    for size in args.sizes:
+        store = WorkoutStore()
+        for start in range(0, size, 50_000):
+            store.add_many([{"exercise": "Push-ups", "duration": (start + i) % 60 + 1, "category": "Workout",
+                             "calories": 52.5, "timestamp": "2025-01-01 10:00:00", "regn_id": "M1"}
+                            for i in range(min(50_000, size - start))])
+        web_app.store = store
+        with web_app.fitness_app.test_request_context("/view"):
+            before = timed(lambda: jsonify(store.view().all()).get_data(), args.repeat)
+        after = timed(lambda: client.get("/view").data, args.repeat)
+        print(f"{size:>9} workouts: jsonify {before * 1e3:9.2f} ms   buffered /view {after * 1e3:9.2f} ms"
+              f"   ({before / after:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Memory and serialization cost of workouts with and without canonical exercise names.
+
+    python benchmarks/bench_vocabulary.py --records 1000000
+
+Builds ``--records`` workouts as clients send them: the same few exercises
+in assorted case and punctuation, parsed from JSON so that every record
+holds its own strings. Both sides run them through ``app.schema``:
+
+* ``before`` keeps each spelling, with only whitespace collapsed, as
+  ingest did before ``app.vocabulary``.
+* ``after`` is ``normalize``, which folds each name to its canonical,
+  shared spelling and ID.
+
+For each side, reports the traced bytes each normalized workout keeps once
+the received JSON is gone, the distinct exercise names, the normalize time
+(under tracemalloc, so only the difference is meaningful), and the time
+and size of encoding the whole list.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import schema  # noqa: E402
+from app.codec import dumps, loads  # noqa: E402
+
+EXERCISES = ["Push-ups", "Squats", "Plank", "Burpees", "Lunges", "Deadlift", "Rowing", "Bench Press"]
+SPELLINGS = [str, str.lower, str.upper, lambda name: name.replace("-", " ").title()]
+
+
+def received(records):
+    return [loads(dumps({"exercise": SPELLINGS[i // 7 % 4](EXERCISES[i % len(EXERCISES)]), "duration": i % 60 + 1,
+                         "category": ["warm-up", "Workout", "COOL DOWN"][i % 3], "calories": 50.0,
+                         "timestamp": 1704067200 + i, "regn_id": f"M{i % 1000:04d}"}))
+            for i in range(records)]
+
+
+def traced():
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def run(label, validate, records):
+    tracemalloc.start()
+    baseline = traced()
+    raw = received(records)
+    started = time.perf_counter()
+    normalized = [validate(record) for record in raw]
+    elapsed = time.perf_counter() - started
+    del raw
+    memory = (traced() - baseline) / records
+    tracemalloc.stop()
+    names = len({record["exercise"] for record in normalized})
+    encode = float("inf")
+    for _ in range(3):
+        started = time.perf_counter()
+        body = dumps(normalized)
+        encode = min(encode, time.perf_counter() - started)
+    print(f"{label:<7} {memory:6.1f} bytes/workout  {names:3} names  normalize {elapsed / records * 1e6:5.2f} us/workout"
+          f"  encode {encode * 1e3:6.1f} ms, {len(body) / records:5.1f} bytes/workout")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    spelled = ("exercise", lambda value: " ".join(value.split()), ("workout",), None)
+    run("before", schema.compile_schema((spelled,) + schema.FIELDS[1:]), args.records)
+    run("after", schema.normalize, args.records)
+
+
+if __name__ == "__main__":
+    main()
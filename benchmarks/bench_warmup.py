@@ -0,0 +1,91 @@
+"""First-request latency of a fresh process, with and without warm-up (app/readiness.py).
+
+    python benchmarks/bench_warmup.py --workouts 200000 --store sqlite
+
+Fills a store with ``--workouts`` records, then, for each mode, imports
+``app.web_app`` in a new process and times a gzip-accepting request to
+every warm-up path twice: the first request, then the same request again.
+
+* ``cold``: warm-up is switched off, as before ``/readyz`` existed, and a
+  request arrives as soon as the app is imported.
+* ``warm``: requests wait for readiness, as behind a readiness probe.
+
+Also reports how long the import took and the warm-up phases.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+from app.config import Settings  # noqa: E402
+from app.store import create_store  # noqa: E402
+
+PROBE = """
+import json, sys, time
+from app import readiness
+if sys.argv[1] == "cold":
+    # No warm-up, but the store is still opened during the import, as before.
+    readiness.start_warm_up = lambda state, app, open_store: open_store()
+started = time.perf_counter()
+from app import web_app
+imported = time.perf_counter() - started
+if sys.argv[1] == "warm":
+    web_app.readiness.wait()
+client = web_app.fitness_app.test_client()
+timings = {}
+for path in readiness.warm_up_paths(web_app.store):
+    pair = []
+    for _ in range(2):
+        started = time.perf_counter()
+        client.get(path, headers=readiness.WARM_UP_HEADERS).close()
+        pair.append(time.perf_counter() - started)
+    timings[path] = pair
+print(json.dumps({"imported": imported, "phases": web_app.readiness.phases, "timings": timings}))
+"""
+
+
+def fill(env, workouts):
+    settings = Settings.from_env(env)
+    store = create_store(settings)
+    for start in range(0, workouts, 10_000):
+        store.add_many([{"exercise": ["Push-ups", "Squats", "Plank", "Rowing"][i % 4], "duration": i % 60 + 1,
+                         "regn_id": f"M{i % 500:03d}", "timestamp": 1704067200 + i * 60}
+                        for i in range(start, min(workouts, start + 10_000))])
+    store.close()
+
+
+def probe(mode, env):
+    out = subprocess.run([sys.executable, "-c", PROBE, mode], cwd=ROOT, env=dict(os.environ, PYTHONPATH=ROOT, **env),
+                         check=True, capture_output=True, text=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workouts", type=int, default=200_000)
+    parser.add_argument("--store", choices=("memory", "sqlite"), default="sqlite")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = {"ACEEST_STORE": args.store, "ACEEST_DATA_DIR": directory}
+        fill(env, args.workouts)
+        results = {mode: probe(mode, env) for mode in ("cold", "warm")}
+    for mode, result in results.items():
+        phases = ", ".join(f"{name} {seconds * 1e3:.1f} ms" for name, seconds in result["phases"].items())
+        print(f"{mode}: import {result['imported'] * 1e3:.1f} ms; warm-up phases: {phases or '-'}")
+    print(f"{'path':<34} {'cold 1st ms':>11} {'warm 1st ms':>11} {'cold 2nd ms':>11}")
+    for path, (cold, repeat) in results["cold"]["timings"].items():
+        warm = results["warm"]["timings"][path][0]
+        print(f"{path:<34} {cold * 1e3:11.2f} {warm * 1e3:11.2f} {repeat * 1e3:11.2f}")
+    cold = sum(pair[0] for pair in results["cold"]["timings"].values())
+    warm = sum(pair[0] for pair in results["warm"]["timings"].values())
+    print(f"{'all first requests':<34} {cold * 1e3:11.2f} {warm * 1e3:11.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Throughput and restart-to-ready benchmark for the durable workout log.
+
+    python benchmarks/bench_workout_log.py --entries 10000000
+
+Phase 1 drives ``POST /add`` through the Flask test client from several
+threads for ``--seconds`` and reports sustained adds/sec per fsync policy.
+Phase 2 fills a log with ``--entries`` workouts, snapshots all but the last
+``--tail`` of them and times how long a fresh store takes to become ready.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.store import WorkoutStore  # noqa: E402
+from app.workout_log import WorkoutLog  # noqa: E402
+
+WORKOUT = {"workout": "Push-ups", "duration": 15}
+
+
+def bench_add(policy, threads, seconds):
+    import app.web_app as web_app
+    web_app.readiness.wait()
+
+    with tempfile.TemporaryDirectory() as directory:
+        web_app.store = WorkoutStore(WorkoutLog(directory, fsync=policy), snapshot_every=10**9)
+        stop = time.monotonic() + seconds
+        counts = [0] * threads
+
+        def worker(n):
+            client = web_app.fitness_app.test_client()
+            while time.monotonic() < stop:
+                client.post("/add", json=WORKOUT)
+                counts[n] += 1
+
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for t in pool:
+            t.start()
+        for t in pool:
+            t.join()
+        web_app.store.close()
+    return sum(counts) / seconds
+
+
+def bench_restart(entries, tail, chunk=50_000):
+    with tempfile.TemporaryDirectory() as directory:
+        store = WorkoutStore(WorkoutLog(directory, fsync="batch"), snapshot_every=10**12)
+        started = time.monotonic()
+        written = 0
+        while written < entries - tail:
+            n = min(chunk, entries - tail - written)
+            store.add_many([WORKOUT] * n)
+            written += n
+        store.snapshot()
+        for _ in range(0, tail, chunk):
+            store.add_many([WORKOUT] * min(chunk, tail))
+        store.close()
+        fill = time.monotonic() - started
+
+        started = time.monotonic()
+        reopened = WorkoutStore(WorkoutLog(directory), snapshot_every=10**12)
+        ready = time.monotonic() - started
+        assert len(reopened) == entries, len(reopened)
+        reopened.close()
+    return fill, ready
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--tail", type=int, default=50_000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    for policy in ("always", "batch", "interval"):
+        rate = bench_add(policy, args.threads, args.seconds)
+        print(f"/add  fsync={policy:<8} threads={args.threads}: {rate:10.0f} adds/sec")
+
+    fill, ready = bench_restart(args.entries, args.tail)
+    print(f"fill  {args.entries} entries: {fill:.1f}s")
+    print(f"restart-to-ready with {args.entries} entries ({args.tail} in log tail): {ready:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
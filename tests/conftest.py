@@ -0,0 +1,27 @@
+import pytest
+
+from app import web_app
+from app.sqlite_store import SqliteStore
+from app.store import WorkoutStore
+
+
+@pytest.fixture(autouse=True, scope="session")
+def opened_store():
+    """Let the warm-up thread open the app's store before a test swaps it out."""
+    assert web_app.readiness.wait(30)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """Each storage backend in turn, empty."""
+    backend = WorkoutStore() if request.param == "memory" else SqliteStore(str(tmp_path / "w.db"))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    """A Flask test client serving a fresh, empty in-memory store."""
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    monkeypatch.setitem(web_app.fitness_app.config, "TESTING", True)
+    return web_app.fitness_app.test_client()
@@ -0,0 +1,289 @@
+import asyncio
+import dataclasses
+import gzip
+import json
+
+import pytest
+
+from app import asgi_app, web_app
+from app.capture import CaptureLog, read_capture
+from app.idempotency import IdempotencyCache
+from app.metrics import Metrics
+from app.ratelimit import RateLimits
+from app.store import WorkoutStore
+
+
+def scope(method, path, headers=(), query=b""):
+    return {
+        "type": "http", "method": method, "path": path, "query_string": query, "scheme": "http",
+        "server": ("testserver", 80), "client": ("127.0.0.1", 5000),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+    }
+
+
+async def acall(method, path, body=b"", headers=(), query=b""):
+    """Run one request through the ASGI app and return ``(status, headers, body)``."""
+    messages = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    await asgi_app.fitness_app(scope(method, path, headers, query), receive, send)
+    start, payload = sent
+    return start["status"], {k.decode(): v.decode() for k, v in start["headers"]}, payload["body"]
+
+
+def call(*args, **kwargs):
+    return asyncio.run(acall(*args, **kwargs))
+
+
+def post_json(path, obj):
+    return call("POST", path, json.dumps(obj).encode(), [("Content-Type", "application/json")])
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    store = WorkoutStore()
+    monkeypatch.setattr(web_app, "store", store)
+    return store
+
+
+def test_add_and_view_match_sync_app():
+    """Both apps write to the same store and render identical listings."""
+    assert call("GET", "/")[0] == 200
+    status, _, body = post_json("/add", {"workout": "Squats", "duration": 20})
+    assert status == 201 and json.loads(body) == {"message": "Workout added successfully"}
+    web_app.fitness_app.test_client().post("/add", json={"workout": "Plank", "duration": 5})
+
+    status, headers, body = call("GET", "/view")
+    flask_rv = web_app.fitness_app.test_client().get("/view")
+    assert status == 200 and body == flask_rv.data
+    assert headers["etag"] == flask_rv.headers["ETag"]
+    assert [(w["exercise"], w["duration"]) for w in json.loads(body)] == [("Squats", 20), ("Plank", 5)]
+
+
+def test_etag_pagination_and_members():
+    """Conditional requests, cursors and member routes behave as in the sync app."""
+    for i in range(3):
+        post_json("/users/M1/workouts", {"workout": f"w{i}", "duration": i + 1})
+    status, headers, body = call("GET", "/users/M1/workouts", query=b"limit=2")
+    page = json.loads(body)
+    assert [w["exercise"] for w in page["workouts"]] == ["w0", "w1"]
+    assert headers["link"].startswith("<http://testserver/users/M1/workouts?")
+    rest = json.loads(call("GET", "/users/M1/workouts", query=f"cursor={page['next_cursor']}".encode())[2])
+    assert [w["exercise"] for w in rest["workouts"]] == ["w2"]
+
+    etag = call("GET", "/view")[1]["etag"]
+    status, headers, body = call("GET", "/view", headers=[("If-None-Match", etag)])
+    assert (status, body, headers["etag"]) == (304, b"", etag)
+    assert call("GET", "/users/M1/workouts", query=b"limit=0")[0] == 400
+    assert post_json("/users/M1/workouts", [1])[0] == 400
+
+
+def test_batch_and_errors():
+    """Batches, body errors and unknown routes get JSON answers."""
+    ndjson = b'{"workout":"a","duration":1}\n{"workout":\n'
+    status, _, body = call("POST", "/add/batch", ndjson, [("Content-Type", "application/x-ndjson")])
+    assert status == 200 and json.loads(body)["accepted"] == 1
+    assert call("POST", "/add/batch", b"x", [("Content-Type", "text/plain")])[0] == 415
+    assert call("POST", "/add", b"{", [("Content-Type", "application/json")])[0] == 400
+    assert call("POST", "/add", b"{}", [("Content-Type", "text/plain")])[0] == 415
+    assert post_json("/add", {"exercise": "Plank", "duration": 0})[0] == 400
+    assert post_json("/add", {"exercise": "x" * web_app.settings.max_body_bytes, "duration": 5})[0] == 413
+    assert call("GET", "/nope")[0] == 404
+    assert call("DELETE", "/view")[0] == 405
+
+
+def test_batches_are_parsed_as_they_arrive():
+    """A batch body is decoded from each received chunk; a broken one stops before the rest is received."""
+    body = gzip.compress(b"".join(b'{"workout":"w%d","duration":1}\n' % i for i in range(2000)))
+    chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+    received = []
+
+    async def run(chunks, headers):
+        async def receive():
+            chunk = chunks[len(received)]
+            received.append(chunk)
+            return {"type": "http.request", "body": chunk, "more_body": len(received) < len(chunks)}
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+        await asgi_app.fitness_app(scope("POST", "/add/batch", headers), receive, send)
+        return sent[0]["status"], json.loads(sent[1]["body"])
+
+    ndjson = [("Content-Type", "application/x-ndjson"), ("Content-Encoding", "gzip")]
+    status, result = asyncio.run(run(chunks, ndjson))
+    assert status == 200 and result["accepted"] == 2000 and len(received) == len(chunks)
+    received.clear()
+    broken = [b'[{"workout": "a"} {'] + [b" " * 1000] * 50
+    status, _ = asyncio.run(run(broken, [("Content-Type", "application/json")]))
+    assert status == 400 and len(received) == 1
+
+
+def test_writes_are_rate_limited(monkeypatch):
+    """Clients over their write limit get 429 with Retry-After."""
+    settings = dataclasses.replace(web_app.settings, rate_limits="add_workout=0.01:2")
+    monkeypatch.setattr(asgi_app, "rate_limits", RateLimits(settings))
+    workout = {"exercise": "Plank", "duration": 5}
+    assert [post_json("/add", workout)[0] for _ in range(2)] == [201, 201]
+    status, headers, _ = post_json("/add", workout)
+    assert status == 429 and int(headers["retry-after"]) >= 99
+    assert call("GET", "/view")[0] == 200
+
+
+def test_metrics_count_matched_routes(monkeypatch):
+    """Requests are counted by route rule, with unmatched paths in one series."""
+    monkeypatch.setattr(asgi_app, "metrics", Metrics())
+    post_json("/users/M1/workouts", {"exercise": "Plank", "duration": 5})
+    call("GET", "/nope")
+    status, headers, body = call("GET", "/metrics")
+    assert status == 200 and headers["content-type"].startswith("text/plain")
+    text = body.decode()
+    assert 'aceest_http_requests_total{route="/users/<regn_id>/workouts",method="POST",status="201"} 1' in text
+    assert 'aceest_http_requests_total{route="<unmatched>",method="GET",status="404"} 1' in text
+    assert "aceest_store_workouts 1" in text
+
+
+def test_stats_match_sync_app():
+    """Store-wide and per-member totals are the same in both apps."""
+    post_json("/users/M1/workouts", {"exercise": "Squats", "duration": 20})
+    post_json("/add", {"exercise": "Jog", "duration": 10, "category": "Warm-up"})
+    client = web_app.fitness_app.test_client()
+    for path in ("/stats", "/users/M1/stats", "/users/M2/stats"):
+        status, headers, body = call("GET", path)
+        assert status == 200 and json.loads(body) == client.get(path).get_json()
+        assert call("GET", path, headers=[("If-None-Match", headers["etag"])])[0] == 304
+
+
+def test_time_range_listing():
+    """from/to select a time range, ordered by timestamp."""
+    for name, timestamp in (("late", 1704100000), ("early", 1704000000), ("outside", 1705000000)):
+        post_json("/add", {"exercise": name, "duration": 5, "timestamp": timestamp})
+    status, _, body = call("GET", "/view", query=b"from=2023-12-31&to=2024-01-02")
+    assert status == 200 and [w["exercise"] for w in json.loads(body)] == ["early", "late"]
+    assert call("GET", "/view", query=b"from=yesterday")[0] == 400
+
+
+def test_retries_are_replayed(monkeypatch):
+    """A retried /add gets the original response and stores nothing."""
+    monkeypatch.setattr(asgi_app, "idempotency", IdempotencyCache(window=10.0))
+    body = json.dumps({"exercise": "Plank", "duration": 5}).encode()
+    headers = [("Content-Type", "application/json"), ("Idempotency-Key", "k1")]
+    first, retry = call("POST", "/add", body, headers), call("POST", "/add", body, headers)
+    assert first[0] == retry[0] == 201 and first[2] == retry[2]
+    assert retry[1]["idempotent-replayed"] == "true"
+    assert call("POST", "/add", b'{"exercise":"Row","duration":5}', headers)[0] == 422
+    post_json("/add", {"exercise": "Squats", "duration": 5})
+    post_json("/add", {"exercise": "Squats", "duration": 5})
+    assert len(web_app.store) == 2
+
+
+def test_large_listing_is_compressed():
+    """Large listings are gzip-compressed and the compressed body is reused."""
+    web_app.store.add_many([{"workout": "Push-ups", "duration": i} for i in range(200)])
+    status, headers, body = call("GET", "/view", headers=[("Accept-Encoding", "gzip")])
+    assert status == 200 and headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(body))[199]["duration"] == 199
+    again = call("GET", "/view", headers=[("Accept-Encoding", "gzip")])
+    assert again[2] == body and again[1]["etag"] == headers["etag"]
+    assert call("HEAD", "/view")[2] == b""
+
+
+def test_changes_long_poll_wakes_on_commit():
+    """A waiting long-poll coroutine is woken by a write made from another thread."""
+    async def scenario():
+        poll = asyncio.ensure_future(acall("GET", "/changes", query=b"since=0&wait=10"))
+        await asyncio.sleep(0.05)
+        assert not poll.done()
+        await asyncio.to_thread(web_app.store.add, {"workout": "Run", "duration": 10})
+        return await asyncio.wait_for(poll, 5)
+
+    status, _, body = asyncio.run(scenario())
+    assert status == 200
+    assert json.loads(body)["changes"] == [{"seq": 1, "workout": {"workout": "Run", "duration": 10}}]
+
+
+def test_event_stream_until_disconnect():
+    """SSE chunks follow commits and the stream ends when the client goes away."""
+    async def scenario():
+        gone = asyncio.Event()
+        sent = []
+
+        async def receive():
+            await gone.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append(message)
+
+        app = asyncio.ensure_future(asgi_app.fitness_app(
+            scope("GET", "/changes", [("Accept", "text/event-stream")]), receive, send))
+        await asyncio.sleep(0.05)
+        web_app.store.add({"workout": "Row", "duration": 5})
+        await asyncio.sleep(0.05)
+        gone.set()
+        await asyncio.wait_for(app, 5)
+        return sent
+
+    start, *chunks = asyncio.run(scenario())
+    assert dict(start["headers"])[b"content-type"].startswith(b"text/event-stream")
+    assert b"event: epoch" in chunks[0]["body"]
+    assert chunks[1]["body"] == b'id: 1\nevent: workout\ndata: {"workout":"Row","duration":5}\n\n'
+
+
+def test_ready_after_lifespan_warm_up(monkeypatch):
+    """Lifespan startup warms the app up in the background; warm-up requests are not counted."""
+    readiness = asgi_app.Readiness()
+    monkeypatch.setattr(asgi_app, "readiness", readiness)
+    monkeypatch.setattr(asgi_app, "metrics", Metrics())
+    monkeypatch.setattr(asgi_app, "_warm_up", None)
+    web_app.store.add({"workout": "Plank", "duration": 5, "regn_id": "M1"})
+    assert call("GET", "/readyz")[0] == 503 and call("GET", "/healthz")[0] == 200
+
+    async def scenario():
+        events = [{"type": "lifespan.startup"}, {"type": "lifespan.shutdown"}]
+        sent = []
+
+        async def receive():
+            return events.pop(0)
+
+        async def send(message):
+            sent.append(message)
+        await asgi_app.fitness_app({"type": "lifespan"}, receive, send)
+        await asyncio.wait_for(asgi_app._warm_up, 5)
+        return sent
+
+    assert [m["type"] for m in asyncio.run(scenario())] == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    status, _, body = call("GET", "/readyz")
+    assert status == 200 and list(json.loads(body)["phases"]) == ["store", "indexes", "routes"]
+    assert set(asgi_app.metrics.snapshot().cells) == {("/readyz", "GET", 503), ("/healthz", "GET", 200),
+                                                      ("/readyz", "GET", 200)}
+
+
+def test_routes_wait_for_the_store(monkeypatch):
+    """Until the store is open, only the probes and /metrics answer; the rest get 503 and Retry-After."""
+    monkeypatch.setattr(web_app, "store", None)
+    status, headers, _ = call("GET", "/view")
+    assert status == 503 and headers["retry-after"] == asgi_app.RETRY_AFTER
+    assert post_json("/add", {"workout": "Squats", "duration": 20})[0] == 503
+    assert call("GET", "/healthz")[0] == 200 and call("GET", "/metrics")[0] == 200
+    assert "status" in json.loads(call("GET", "/readyz")[2])
+
+
+def test_requests_are_captured(tmp_path, monkeypatch):
+    """The ASGI app captures into the Flask app's log, with the body it received."""
+    capture = CaptureLog(str(tmp_path))
+    monkeypatch.setitem(web_app.fitness_app.extensions, "capture", capture)
+    post_json("/add", {"exercise": "Plank", "duration": 5})
+    call("GET", "/view", query=b"limit=1")
+    call("GET", "/metrics")
+    capture.close()
+    captured = list(read_capture(capture.directory))
+    assert [(e["method"], e["path"], e["status"], e["route"]) for e, _ in captured] == [
+        ("POST", "/add", 201, "/add"), ("GET", "/view?limit=1", 200, "/view")]
+    assert json.loads(captured[0][1]) == {"exercise": "Plank", "duration": 5}
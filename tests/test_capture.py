@@ -0,0 +1,96 @@
+import gzip
+import json
+import os
+import threading
+
+import pytest
+
+from app import web_app
+from app.capture import CaptureLog, capture_files, read_capture
+from app.store import WorkoutStore
+
+
+@pytest.fixture
+def capture(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    log = CaptureLog(str(tmp_path / "capture"))
+    monkeypatch.setitem(web_app.fitness_app.extensions, "capture", log)
+    return log
+
+
+def test_requests_are_captured_with_bodies(capture):
+    """Each request is captured with its body, headers, client and the response status and route."""
+    client = web_app.fitness_app.test_client()
+    body = json.dumps({"exercise": "Plank", "duration": 5}).encode()
+    client.post("/users/M 1/workouts", data=body, headers={"Content-Type": "application/json", "X-Client-ID": "c1"})
+    batch = gzip.compress(b'{"exercise": "Squats", "duration": 10}\n')
+    client.post("/add/batch", data=batch,
+                headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"})
+    client.get("/view?limit=1", headers={"Accept-Encoding": "gzip"})
+    client.get("/healthz")
+    client.get("/nope")
+    capture.close()
+    captured = list(read_capture(capture.directory))
+    assert [(e["method"], e["path"], e["status"], e["route"]) for e, _ in captured] == [
+        ("POST", "/users/M%201/workouts", 201, "/users/<regn_id>/workouts"),
+        ("POST", "/add/batch", 200, "/add/batch"),
+        ("GET", "/view?limit=1", 200, "/view"),
+        ("GET", "/nope", 404, "<unmatched>"),
+    ]
+    (first, first_body), (_, batch_body), (view, _), _ = captured
+    assert first_body == body and batch_body == batch
+    assert first["client"] == "127.0.0.1" and first["headers"]["X-Client-ID"] == "c1"
+    assert first["headers"]["Content-Type"] == "application/json"
+    assert view["headers"] == {"Accept-Encoding": "gzip"} and view["seconds"] > 0 and not view["truncated"]
+
+
+def test_long_bodies_are_truncated(capture, monkeypatch):
+    """Only ``body_bytes`` of a body are kept, and the entry says so."""
+    monkeypatch.setattr(capture, "body_bytes", 8)
+    web_app.fitness_app.test_client().post("/add", json={"exercise": "Plank", "duration": 5})
+    capture.close()
+    [(captured, body)] = list(read_capture(capture.directory))
+    assert captured["truncated"] and body == b'{"exerci' and captured["body"] == 8
+
+
+def test_files_roll_over_and_torn_tails_are_ignored(tmp_path):
+    """Files roll past ``file_bytes``, only ``files`` are kept, and a torn last entry ends a file."""
+    log = CaptureLog(str(tmp_path), file_bytes=200, files=2)
+    for i in range(40):
+        log.record({"t": float(i), "body": 1}, b"x")
+    log.close()
+    files = capture_files(str(tmp_path))
+    assert len(files) == 2
+    with open(files[-1], "ab") as f:
+        f.write(b'{"t": 99.0, "body": 5}\nab')
+    times = [entry["t"] for entry, _ in read_capture(str(tmp_path))]
+    assert times == [float(i) for i in range(20, 40)]
+    assert all(os.stat(path).st_mode & 0o777 == 0o600 for path in files)
+
+
+def test_files_are_pruned_across_processes(tmp_path, monkeypatch):
+    """Each process's new file prunes the whole directory, so every worker together keeps ``files``."""
+    for pid in (101, 102):
+        monkeypatch.setattr(os, "getpid", lambda: pid)
+        log = CaptureLog(str(tmp_path), file_bytes=200, files=3)
+        for i in range(40):
+            log.record({"t": pid * 100.0 + i, "body": 1}, b"x")
+        log.close()
+    files = capture_files(str(tmp_path))
+    assert len(files) == 3 and all(path.endswith("-102.log") for path in files)
+    times = [entry["t"] for entry, _ in read_capture(str(tmp_path))]
+    assert times == [10200.0 + i for i in range(40 - len(times), 40)] and len(times) > 20
+
+
+def test_dropped_entries_are_all_counted(tmp_path):
+    """Entries refused by a full queue are counted exactly, from any number of threads."""
+    log = CaptureLog(str(tmp_path), queue_size=1)
+    # A writer that never drains the queue.
+    log._writer = threading.current_thread()
+    threads = [threading.Thread(target=lambda: [log.record({"t": 0.0, "body": 0}, b"") for _ in range(2000)])
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert log.dropped == log.gauges()[0][2] == 8 * 2000 - 1
@@ -0,0 +1,93 @@
+import json
+import threading
+import time
+
+from app import web_app
+from app.sqlite_store import SqliteStore
+
+
+def add_later(delay, record):
+    timer = threading.Timer(delay, web_app.store.add, args=(record,))
+    timer.start()
+    return timer
+
+
+def test_changes_since_returns_newer_workouts(client):
+    """Only workouts after ``since`` come back, each with its sequence number."""
+    for i in range(5):
+        client.post("/add", json={"exercise": f"w{i}", "duration": i + 1})
+    body = client.get("/changes?since=3").get_json()
+    assert body["epoch"] == web_app.store.epoch
+    assert [(c["seq"], c["workout"]["exercise"]) for c in body["changes"]] == [(4, "w3"), (5, "w4")]
+    assert (body["last_seq"], body["more"]) == (5, False)
+
+    page = client.get("/changes?limit=2").get_json()
+    assert [c["seq"] for c in page["changes"]] == [1, 2] and page["more"] is True
+    empty = client.get("/changes?since=5").get_json()
+    assert (empty["changes"], empty["last_seq"]) == ([], 5)
+    for bad in ("since=-1", "since=x", "limit=0", "wait=61", "wait=soon"):
+        assert client.get(f"/changes?{bad}").status_code == 400
+
+
+def test_long_poll_returns_on_commit(client):
+    """``wait`` holds the request until a newer workout is committed, or times out."""
+    client.post("/add", json={"workout": "first", "duration": 1})
+    timer = add_later(0.1, {"workout": "second", "duration": 2})
+    started = time.monotonic()
+    body = client.get("/changes?since=1&wait=10").get_json()
+    timer.join()
+    assert time.monotonic() - started < 5
+    assert [c["workout"]["workout"] for c in body["changes"]] == ["second"]
+
+    started = time.monotonic()
+    assert client.get("/changes?since=2&wait=0.2").get_json()["changes"] == []
+    assert time.monotonic() - started >= 0.2
+
+
+def test_event_stream_pushes_commits(client):
+    """An event-stream request gets the backlog, then each new commit as it happens."""
+    web_app.store.add({"workout": "old", "duration": 1})
+    rv = client.get("/changes", headers={"Accept": "text/event-stream"}, buffered=False)
+    assert rv.mimetype == "text/event-stream"
+    chunks = iter(rv.response)
+    assert b"event: epoch" in next(chunks)
+    assert next(chunks) == b'id: 1\nevent: workout\ndata: {"workout":"old","duration":1}\n\n'
+    add_later(0.05, {"workout": "new", "duration": 2})
+    assert next(chunks).startswith(b"id: 2\nevent: workout\n")
+    rv.close()
+
+    resumed = client.get("/changes", headers={"Accept": "text/event-stream", "Last-Event-ID": "1"},
+                         buffered=False)
+    chunks = iter(resumed.response)
+    next(chunks)
+    assert next(chunks).startswith(b"id: 2\n")
+    resumed.close()
+
+
+def test_waiting_requests_are_capped(client, monkeypatch):
+    """Past ``max_streams`` open streams and long-polls, waiting requests get 503 until one closes."""
+    monkeypatch.setattr(web_app, "streams", threading.BoundedSemaphore(1))
+    stream = client.get("/changes", headers={"Accept": "text/event-stream"}, buffered=False)
+    assert stream.status_code == 200
+    busy = client.get("/changes?wait=0.01")
+    assert busy.status_code == 503 and busy.headers["Retry-After"] == "5"
+    assert client.get("/changes", headers={"Accept": "text/event-stream"}).status_code == 503
+    assert client.get("/changes").status_code == 200
+    stream.close()
+    assert client.get("/changes?wait=0.01").status_code == 200
+    assert client.get("/changes?wait=0.01").status_code == 200
+
+
+def test_sqlite_waiters_see_other_replicas(tmp_path):
+    """A SQLite store wakes its waiters for commits made through another connection."""
+    path = str(tmp_path / "workouts.db")
+    reader, writer = SqliteStore(path), SqliteStore(path)
+    reader.poll_interval = 0.05
+    timer = threading.Timer(0.1, writer.add, args=({"workout": "Run", "duration": 10},))
+    timer.start()
+    view = reader.wait_for(0, 5)
+    timer.join()
+    assert view.version == 1
+    assert json.loads(view.page_json(0, 10)[0][1]) == {"workout": "Run", "duration": 10}
+    reader.close()
+    writer.close()
@@ -0,0 +1,80 @@
+import importlib.util
+import json
+import sys
+
+import pytest
+
+import app.codec as codec
+import app.web_app as web_app
+from app.store import WorkoutStore
+
+WORKOUT = {
+    "exercise": "Push-ups \"wide\" – ü",
+    "duration": 20,
+    "category": "Workout",
+    "calories": 42.5,
+    "timestamp": 1704096000,
+    "regn_id": "M1",
+}
+
+
+@pytest.fixture
+def stdlib_codec(monkeypatch):
+    """A separate copy of the codec module imported as if orjson were missing."""
+    monkeypatch.setitem(sys.modules, "orjson", None)
+    spec = importlib.util.spec_from_file_location("codec_stdlib", codec.__file__)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def compact(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+
+def test_template_matches_generic_encoder():
+    """The workout template produces exactly the stdlib compact encoding."""
+    template = codec.RecordTemplate(codec.WORKOUT_SHAPE)
+    assert template.encode(WORKOUT) == compact(WORKOUT)
+    assert template.encode(dict(WORKOUT, regn_id=None)) == compact(dict(WORKOUT, regn_id=None))
+    assert json.loads(codec.encode_record(WORKOUT)) == WORKOUT
+
+
+@pytest.mark.parametrize("record", [
+    {"workout": "Plank", "duration": 5},
+    dict(WORKOUT, duration=True),
+    dict(WORKOUT, calories=10),
+    dict(WORKOUT, calories=float("inf")),
+    dict(reversed(list(WORKOUT.items()))),
+])
+def test_template_rejects_other_shapes(record, stdlib_codec):
+    """Records that do not fit the template fall back to the generic encoder."""
+    assert codec.RecordTemplate(codec.WORKOUT_SHAPE).encode(record) is None
+    assert stdlib_codec.BACKEND == "stdlib"
+    assert stdlib_codec.encode_record(record) == compact(record)
+
+
+def test_backends_agree(stdlib_codec):
+    """orjson, when installed, and the stdlib fallback emit and parse the same JSON."""
+    fallback = stdlib_codec
+    assert fallback.loads(b'{"a":[1,2.5,"\\u00fc"]}') == {"a": [1, 2.5, "ü"]}
+    assert fallback.dumps([WORKOUT, {"n": 2 ** 70}]) == compact([WORKOUT, {"n": 2 ** 70}])
+
+
+def test_big_integers_fall_back_to_stdlib():
+    """Values the fast backend refuses are still encoded."""
+    assert codec.dumps({"n": 2 ** 70}) == b'{"n":1180591620717411303424}'
+
+
+def test_flask_uses_codec(monkeypatch):
+    """Requests are parsed and responses rendered by the codec provider."""
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    client = web_app.fitness_app.test_client()
+    assert isinstance(web_app.fitness_app.json, codec.CodecJSONProvider)
+    assert client.post("/add", json=WORKOUT).status_code == 201
+    rv = client.get("/view")
+    assert rv.data == b"[" + compact(WORKOUT) + b"]"
+    assert rv.get_json() == [WORKOUT]
+    with web_app.fitness_app.app_context():
+        assert web_app.fitness_app.json.dumps({"b": 1, "a": 2}) == '{"b":1,"a":2}'
+        assert web_app.fitness_app.json.dumps({"b": 1}, indent=2) == '{\n  "b": 1\n}'
@@ -0,0 +1,51 @@
+import json
+
+from app import columnar
+from app.codec import dumps
+from app.columnar import WorkoutTable
+from app.vocabulary import EXERCISES
+
+
+def workout(i, exercise="Squats", member="M1"):
+    return {"exercise": exercise, "duration": i + 1, "category": "Workout", "calories": 50.5 + i,
+            "timestamp": 1704067200 + i, "regn_id": member}
+
+
+def fill(table, records):
+    for seq, record in enumerate(records, 1):
+        table.append(seq, record, dumps(record), record.get("timestamp"))
+
+
+def test_canonical_records_round_trip_through_columns():
+    """Canonical workouts come back equal; exercise codes are the shared vocabulary IDs."""
+    table = WorkoutTable()
+    records = [workout(i, ["Squats", "Plank"][i % 2], f"M{i % 3}") for i in range(10)]
+    fill(table, records)
+    assert table.records(range(10)) == records and table.extras == {}
+    assert list(table.columns["exercise"][:2]) == [EXERCISES.id("Squats"), EXERCISES.id("Plank")]
+    assert table.dictionaries["regn_id"].values == [None, "M0", "M1", "M2"]
+    assert list(table.seqs) == list(range(1, 11))
+
+
+def test_other_shapes_are_kept_whole():
+    """Legacy entries, out-of-range numbers and stray spellings are not squeezed into columns."""
+    table = WorkoutTable()
+    legacy = {"exercise": "Plank", "duration": 5}
+    huge = dict(workout(0), duration=2 ** 70)
+    spelled = workout(0, "PLANK")
+    fill(table, [workout(0), legacy, huge, spelled])
+    assert table.records(range(4)) == [workout(0), legacy, huge, spelled]
+    assert sorted(table.extras) == [1, 2, 3]
+
+
+def test_encoded_slices_span_chunks(monkeypatch):
+    """Per-workout JSON is sliced out of sealed chunks and the tail alike."""
+    monkeypatch.setattr(columnar, "JSON_CHUNK", 4)
+    table = WorkoutTable()
+    records = [workout(i) for i in range(10)]
+    fill(table, records)
+    assert len(table.chunks) == 2 and len(table.tail) == 2
+    assert [json.loads(part) for part in table.encoded_many(range(10))] == records
+    for count in (0, 3, 4, 9, 10):
+        assert json.loads(b"[" + table.json(count) + b"]") == records[:count]
+    assert [seq for seq, _, _ in table.entries(2, 7, records=False)] == [3, 4, 5, 6, 7]
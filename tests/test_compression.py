@@ -0,0 +1,60 @@
+import gzip
+import json
+import zlib
+
+import pytest
+
+from app import web_app
+
+
+@pytest.fixture
+def client(client):
+    web_app.store.add_many([{"workout": "Squats", "duration": i, "category": "Workout"} for i in range(200)])
+    web_app.fitness_app.extensions["compression_cache"]._entries.clear()
+    return client
+
+
+def test_gzip_when_accepted(client):
+    """Large JSON responses are gzipped for clients that ask for it."""
+    plain = client.get("/view")
+    assert "Content-Encoding" not in plain.headers
+    assert "Accept-Encoding" in plain.headers["Vary"]
+
+    rv = client.get("/view", headers={"Accept-Encoding": "gzip, deflate"})
+    assert rv.headers["Content-Encoding"] == "gzip"
+    assert len(rv.data) < len(plain.data) / 5
+    assert json.loads(gzip.decompress(rv.data)) == plain.get_json()
+    assert rv.headers["ETag"] == plain.headers["ETag"][:-1] + '-gzip"'
+
+
+def test_deflate_and_q_values(client):
+    """Encoding follows the client's preferences; q=0 refuses an encoding."""
+    rv = client.get("/view", headers={"Accept-Encoding": "gzip;q=0, deflate"})
+    assert rv.headers["Content-Encoding"] == "deflate"
+    assert len(json.loads(zlib.decompress(rv.data))) == 200
+    rv = client.get("/view", headers={"Accept-Encoding": "br"})
+    assert "Content-Encoding" not in rv.headers
+
+
+def test_small_responses_stay_plain(client):
+    rv = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in rv.headers
+
+
+def test_unchanged_version_is_compressed_once(client, monkeypatch):
+    """A second request for the same version is served from the cache without rendering."""
+    headers = {"Accept-Encoding": "gzip"}
+    first = client.get("/view?limit=50", headers=headers)
+    monkeypatch.setattr(web_app, "listing", lambda *a: pytest.fail("rendered twice"))
+    monkeypatch.setattr("app.compression.compress", lambda *a: pytest.fail("compressed twice"))
+    second = client.get("/view?limit=50", headers=headers)
+    assert second.data == first.data
+    assert second.headers["Link"] == first.headers["Link"]
+    assert second.headers["ETag"] == first.headers["ETag"]
+
+
+def test_compressed_etag_revalidates(client):
+    """The encoding-specific ETag still gets a 304."""
+    etag = client.get("/view", headers={"Accept-Encoding": "gzip"}).headers["ETag"]
+    rv = client.get("/view", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert rv.status_code == 304 and rv.headers["ETag"] == etag
@@ -0,0 +1,115 @@
+import json
+import threading
+import time
+
+import pytest
+
+from app.store import WorkoutStore
+from app.workout_log import WorkoutLog
+
+WRITERS = 8
+READERS = 8
+BATCHES = 150
+BATCH = 5
+
+
+def check_view(view):
+    """A view is internally consistent: seq order, whole batches, per-member prefixes."""
+    records = view.all()
+    assert len(records) == len(view)
+    seqs = [seq for seq, _, _ in view.entries()]
+    assert seqs == sorted(seqs) and len(set(seqs)) == len(seqs)
+    assert not seqs or seqs[-1] == view.high_seq
+    assert json.loads(view.all_json()) == records
+    progress = {}
+    for record in records:
+        key = (record["writer"], record["batch"])
+        progress[key] = progress.get(key, 0) + 1
+    # add_many is atomic: a view never shows part of a batch.
+    assert all(count == BATCH for count in progress.values())
+    for writer in range(WRITERS):
+        mine = [r["batch"] for r in view.member_all(f"W{writer}")]
+        assert mine == sorted(mine)
+        assert len(mine) == BATCH * sum(1 for (w, _) in progress if w == writer)
+
+
+def run_stress(store, batches=BATCHES):
+    stop = threading.Event()
+    errors = []
+    reads = [0] * READERS
+
+    def writer(n):
+        try:
+            for b in range(batches):
+                store.add_many([{"writer": n, "batch": b, "i": i, "regn_id": f"W{n}"} for i in range(BATCH)])
+        except Exception as exc:  # pragma: no cover - surfaced below
+            errors.append(exc)
+
+    def reader(n):
+        try:
+            last_version = 0
+            while not stop.is_set():
+                view = store.view()
+                assert view.version >= last_version
+                last_version = view.version
+                check_view(view)
+                json.dumps(view.page(0, 50))
+                reads[n] += 1
+        except Exception as exc:
+            errors.append(exc)
+
+    readers = [threading.Thread(target=reader, args=(n,)) for n in range(READERS)]
+    writers = [threading.Thread(target=writer, args=(n,)) for n in range(WRITERS)]
+    for t in readers + writers:
+        t.start()
+    for t in writers:
+        t.join()
+    stop.set()
+    for t in readers:
+        t.join()
+    assert not errors, errors[0]
+    assert sum(reads) > 0
+    check_view(store.view())
+    assert len(store) == WRITERS * batches * BATCH
+
+
+def test_stress_memory_store():
+    """Many readers and writers against the in-memory store."""
+    run_stress(WorkoutStore())
+
+
+@pytest.mark.parametrize("policy", ["batch", "interval"])
+def test_stress_durable_store(tmp_path, policy):
+    """Same stress run with group commit publishing from the log's flusher."""
+    store = WorkoutStore(WorkoutLog(str(tmp_path), fsync=policy), snapshot_every=500)
+    run_stress(store, batches=15)
+    live = store.all()
+    store.close()
+    assert WorkoutStore(WorkoutLog(str(tmp_path))).all() == live
+
+
+def test_slow_reader_does_not_block_writers():
+    """A reader walking an old view keeps seeing it while writers carry on."""
+    store = WorkoutStore()
+    store.add_many([{"i": i} for i in range(1000)])
+    view = store.view()
+    done = threading.Event()
+
+    def writer():
+        for i in range(1000):
+            store.add({"i": 1000 + i})
+        done.set()
+
+    started = time.perf_counter()
+    thread = threading.Thread(target=writer)
+    thread.start()
+    seen = 0
+    for record in view.all():
+        seen += 1
+        if seen % 100 == 0:
+            time.sleep(0.005)
+    thread.join()
+    assert done.is_set()
+    assert seen == 1000 and len(view) == 1000
+    assert len(store) == 2000 and store.version > view.version
+    assert time.perf_counter() - started < 5
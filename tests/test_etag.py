@@ -0,0 +1,53 @@
+import pytest
+
+from app import web_app
+from app.store import WorkoutStore
+from app.workout_log import WorkoutLog
+
+
+def test_view_returns_304_until_store_changes(client):
+    """A matching If-None-Match gets an empty 304; a write changes the ETag."""
+    client.post("/add", json={"workout": "Squats", "duration": 20})
+    first = client.get("/view")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and not etag.startswith("W/")
+
+    again = client.get("/view", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.data == b""
+    assert again.headers["ETag"] == etag
+
+    client.post("/add", json={"workout": "Plank", "duration": 5})
+    changed = client.get("/view", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_member_etag_ignores_other_members(client):
+    """An idle member's listing keeps its ETag while other members write."""
+    client.post("/users/M1/workouts", json={"workout": "Yoga", "duration": 30})
+    etag = client.get("/users/M1/workouts").headers["ETag"]
+    client.post("/users/M2/workouts", json={"workout": "Run", "duration": 10})
+    assert client.get("/users/M1/workouts", headers={"If-None-Match": etag}).status_code == 304
+    client.post("/users/M1/workouts", json={"workout": "Row", "duration": 10})
+    assert client.get("/users/M1/workouts", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_304_skips_serialization(client, monkeypatch):
+    """A conditional hit never touches the records."""
+    client.post("/add", json={"workout": "Squats", "duration": 20})
+    etag = client.get("/view").headers["ETag"]
+    monkeypatch.setattr(web_app, "listing", lambda *a: pytest.fail("serialized on a 304"))
+    assert client.get("/view", headers={"If-None-Match": etag}).status_code == 304
+
+
+def test_epoch_distinguishes_stores(tmp_path):
+    """Fresh in-memory stores never share ETags; a durable store keeps its epoch across restarts."""
+    assert WorkoutStore().epoch != WorkoutStore().epoch
+    store = WorkoutStore(WorkoutLog(str(tmp_path)))
+    epoch = store.epoch
+    store.add({"workout": "Squats"})
+    version = store.version
+    store.close()
+    reopened = WorkoutStore(WorkoutLog(str(tmp_path)))
+    assert (reopened.epoch, reopened.version) == (epoch, version)
+    reopened.close()
@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from app import web_app
+from app.idempotency import (BloomFilter, IdempotencyCache, InvalidKey, KeyReused, RequestInProgress,
+                             RotatingBloomFilter)
+
+ADDED = (201, b'{"message":"ok"}')
+BODY = b'{"exercise":"Squats","duration":20}'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_key_replays_original_response():
+    """A repeated key replays the stored response; a different body under it is rejected."""
+    cache = IdempotencyCache()
+    claim = cache.claim("k1", "client", "/add", BODY, ADDED)
+    assert claim.replay is None
+    with pytest.raises(RequestInProgress):
+        cache.claim("k1", "client", "/add", BODY, ADDED)
+    claim.complete(201, b"original")
+    assert cache.claim("k1", "client", "/add", BODY, ADDED).replay == (201, b"original")
+    with pytest.raises(KeyReused):
+        cache.claim("k1", "client", "/add", b"{}", ADDED)
+    assert cache.claim("k1", "other client", "/add", BODY, ADDED).replay is None
+    with pytest.raises(InvalidKey):
+        cache.claim("", "client", "/add", BODY, ADDED)
+
+
+def test_failed_write_can_be_retried():
+    """A released claim leaves nothing behind, so the retry runs the write."""
+    cache = IdempotencyCache()
+    cache.claim("k1", "client", "/add", BODY, ADDED).release()
+    assert cache.claim("k1", "client", "/add", BODY, ADDED).replay is None
+
+
+def test_body_hash_dedupes_within_window():
+    """Without a key, the same body is a retry only within the window, which is off by default."""
+    clock = Clock()
+    cache = IdempotencyCache(window=10.0, clock=clock)
+    cache.claim(None, "client", "/add", BODY, ADDED).complete(*ADDED)
+    clock.now = 9.0
+    assert cache.claim(None, "client", "/add", BODY, ADDED).replay == ADDED
+    assert cache.claim(None, "client", "/add", b'{"exercise":"Plank","duration":5}', ADDED).replay is None
+    clock.now = 10.5
+    assert cache.claim(None, "client", "/add", BODY, ADDED).replay is None
+    off = IdempotencyCache()
+    off.claim(None, "client", "/add", BODY, ADDED).complete(*ADDED)
+    assert off.claim(None, "client", "/add", BODY, ADDED).replay is None
+
+
+def test_evicted_keys_are_remembered_by_the_bloom_filter():
+    """Keys pushed out of the LRU still replay; evicted body hashes do not."""
+    cache = IdempotencyCache(max_keys=10)
+    for i in range(100):
+        cache.claim(f"key-{i}", "client", "/add", BODY, ADDED).complete(201, b"original")
+    cache.claim(None, "client", "/add", BODY, ADDED).complete(*ADDED)
+    assert len(cache) == 10
+    assert cache.claim("key-0", "client", "/add", BODY, ADDED).replay == ADDED
+    assert cache.claim("key-99", "client", "/add", BODY, ADDED).replay == (201, b"original")
+    assert cache.claim("key-100", "client", "/add", BODY, ADDED).replay is None
+
+
+def test_bloom_filters():
+    """No false negatives, few false positives, and old generations are dropped."""
+    bloom = BloomFilter(10_000, error_rate=0.01)
+    keys = [os.urandom(16) for _ in range(10_000)]
+    for key in keys:
+        bloom.add(key)
+    assert all(key in bloom for key in keys)
+    assert sum(os.urandom(16) in bloom for _ in range(10_000)) < 300
+
+    rotating = RotatingBloomFilter(100)
+    for key in keys[:250]:
+        rotating.add(key)
+    assert all(key in rotating for key in keys[100:250])
+    assert sum(key in rotating for key in keys[:100]) < 10
+
+
+@pytest.fixture
+def client(client, monkeypatch):
+    monkeypatch.setitem(web_app.fitness_app.extensions, "idempotency", IdempotencyCache(window=10.0))
+    return client
+
+
+def test_retries_do_not_touch_the_store(client):
+    """Retried /add calls get the original 201 and store the workout once."""
+    workout = {"exercise": "Squats", "duration": 20}
+    first = client.post("/add", json=workout, headers={"Idempotency-Key": "abc"})
+    retry = client.post("/add", json=workout, headers={"Idempotency-Key": "abc"})
+    assert first.status_code == retry.status_code == 201 and first.data == retry.data
+    assert "Idempotent-Replayed" not in first.headers and retry.headers["Idempotent-Replayed"] == "true"
+    assert client.post("/add", json={"exercise": "Plank", "duration": 5},
+                       headers={"Idempotency-Key": "abc"}).status_code == 422
+
+    client.post("/users/M1/workouts", json=workout)
+    client.post("/users/M1/workouts", json=workout)
+    client.post("/users/M1/workouts", json=workout, environ_base={"REMOTE_ADDR": "10.0.0.2"})
+    assert len(web_app.store) == 3
+    assert client.post("/add", json={"exercise": "Squats", "duration": 0},
+                       headers={"Idempotency-Key": "bad"}).status_code == 400
@@ -0,0 +1,114 @@
+import dataclasses
+import gzip
+import io
+import json
+
+import pytest
+
+from app import web_app
+from app import ingest
+from app.ingest import BodyTooLarge, MalformedBody, iter_chunks, iter_json_array, iter_ndjson
+
+
+@pytest.fixture
+def client():
+    web_app.fitness_app.config["TESTING"] = True
+    return web_app.fitness_app.test_client()
+
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_json_array_elements_survive_any_chunk_boundary():
+    """Elements split across chunks (including multi-byte UTF-8) still parse."""
+    workouts = [{"workout": "Squats", "duration": 20}, {"workout": "Étirement", "duration": 12345}]
+    body = json.dumps(workouts).encode()
+    for size in range(1, len(body) + 1):
+        assert list(iter_json_array(split(body, size))) == workouts
+
+
+def test_json_array_rejects_broken_structure():
+    """Structural errors end the upload."""
+    for body in (b'{"workout": "x"}', b'[{"a": 1} {"b": 2}]', b'[{"a": 1},', b'[1] 2'):
+        with pytest.raises(MalformedBody):
+            list(iter_json_array([body]))
+
+
+def test_ndjson_reports_bad_lines_individually():
+    """A bad NDJSON line becomes an error entry, the rest still parse."""
+    body = b'{"workout": "Plank"}\nnot json\n\n{"workout": "Yoga"}'
+    records = list(iter_ndjson(split(body, 3)))
+    assert records[0] == {"workout": "Plank"}
+    assert isinstance(records[1], ValueError)
+    assert records[2] == {"workout": "Yoga"}
+
+
+def test_records_over_the_limit_end_the_upload():
+    """A record longer than the per-record limit raises BodyTooLarge before the rest is read."""
+    big = json.dumps({"workout": "x" * 5000}).encode()
+    small = json.dumps({"workout": "y"}).encode()
+    chunks = iter(split(small + b"\n" + big + b"\n" + small * 1000, 100))
+    with pytest.raises(BodyTooLarge):
+        list(iter_ndjson(chunks, 4096))
+    assert next(chunks, None) is not None
+    with pytest.raises(BodyTooLarge):
+        list(iter_json_array(split(b"[" + small + b"," + big + b"]", 100), 4096))
+    assert list(iter_ndjson(split(small + b"\n" + big, 100), len(big))) == [{"workout": "y"}, json.loads(big)]
+    assert list(iter_json_array(split(b"[" + big + b"]", 100), len(big))) == [json.loads(big)]
+
+
+def test_long_json_array_element_is_not_decoded_per_chunk(monkeypatch):
+    """A long element cut across many chunks is decoded a logarithmic number of times."""
+    calls = []
+    decode = ingest._decoder.raw_decode
+    monkeypatch.setattr(ingest, "_decoder", type("Decoder", (), {
+        "raw_decode": staticmethod(lambda text, pos: calls.append(pos) or decode(text, pos))}))
+    element = {"workout": "x" * 100_000}
+    assert list(iter_json_array(split(json.dumps([element]).encode(), 100))) == [element]
+    assert len(calls) < 20
+
+
+def test_gzip_is_inflated_incrementally():
+    """Gzip bodies are inflated chunk by chunk; truncation is detected."""
+    raw = b'{"workout": "Run"}\n' * 10000
+    compressed = gzip.compress(raw)
+    assert b"".join(iter_chunks(io.BytesIO(compressed), "gzip")) == raw
+    with pytest.raises(MalformedBody):
+        list(iter_chunks(io.BytesIO(compressed[:-20]), "gzip"))
+
+
+def test_batch_endpoint_ndjson_gzip(client):
+    """Gzip NDJSON batches commit valid records and report per-record results."""
+    before = len(client.get("/view").get_json())
+    lines = [json.dumps({"workout": f"batch-{i}", "duration": i + 1}) for i in range(3)]
+    lines.insert(1, "[1, 2]")
+    rv = client.post("/add/batch", data=gzip.compress("\n".join(lines).encode()),
+                     headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"})
+    assert rv.status_code == 200
+    body = rv.get_json()
+    assert body["accepted"] == 3 and body["rejected"] == 1
+    assert body["results"][1] == {"index": 1, "status": "rejected",
+                                  "error": "workout must be a non-empty JSON object"}
+    workouts = client.get("/view").get_json()
+    assert len(workouts) == before + 3
+    assert [w["exercise"] for w in workouts[-3:]] == ["batch-0", "batch-1", "batch-2"]
+
+
+def test_batch_endpoint_json_array(client):
+    """A plain JSON array is accepted too."""
+    rv = client.post("/add/batch", json=[{"workout": "Plank", "duration": 5}])
+    assert rv.get_json()["accepted"] == 1
+
+
+def test_batch_endpoint_rejects_bad_uploads(client, monkeypatch):
+    """Unparseable bodies are 400s, other media types 415s and oversized batches 413s, with nothing stored."""
+    before = len(client.get("/view").get_json())
+    assert client.post("/add/batch", data=b"[{", content_type="application/json").status_code == 400
+    assert client.post("/add/batch", data=b"x", content_type="text/plain").status_code == 415
+    monkeypatch.setattr(web_app, "settings", dataclasses.replace(web_app.settings, batch_max_records=2))
+    rv = client.post("/add/batch", json=[{"workout": "a"}, {"workout": "b"}, {"workout": "c"}])
+    assert rv.status_code == 413
+    rv = client.post("/add/batch", json=[{"workout": "a" * web_app.settings.max_body_bytes}])
+    assert rv.status_code == 413
+    assert len(client.get("/view").get_json()) == before
@@ -0,0 +1,28 @@
+import json
+
+from app import columnar
+from app.store import WorkoutStore
+
+
+def test_listing_json_matches_records_across_chunk_boundaries(monkeypatch):
+    """Chunked buffers produce exactly the records of the view, for every count."""
+    monkeypatch.setattr(columnar, "JSON_CHUNK", 4)
+    store = WorkoutStore()
+    views = []
+    for i in range(11):
+        store.add({"workout": f"w{i}", "duration": i, "regn_id": "M1" if i % 2 else "M2", "note": "é"})
+        views.append(store.view())
+    assert len(store.view()._all.table.chunks) == 2
+    for view in views:
+        assert json.loads(view.all_json()) == view.all()
+        assert json.loads(view.member_all_json("M1")) == view.member_all("M1")
+    assert store.view().member_all_json("nobody") == b"[]"
+    assert WorkoutStore().view().all_json() == b"[]"
+
+
+def test_page_json_matches_page():
+    store = WorkoutStore()
+    store.add_many([{"i": i, "regn_id": "M1"} for i in range(10)])
+    view = store.view()
+    assert [(s, json.loads(b)) for s, b in view.page_json(3, 4)] == view.page(3, 4)
+    assert [(s, json.loads(b)) for s, b in view.member_page_json("M1", 8, 4)] == view.member_page("M1", 8, 4)
@@ -0,0 +1,39 @@
+from app.store import WorkoutStore
+
+
+def test_member_workouts_are_partitioned(client):
+    """Each member only sees their own workouts, in insertion order."""
+    client.post("/users/M001/workouts", json={"workout": "Squats", "duration": 20})
+    client.post("/add", json={"workout": "Plank", "duration": 5, "regn_id": "M002"})
+    client.post("/users/M001/workouts", json={"workout": "Yoga", "duration": 30, "regn_id": "M999"})
+    client.post("/add", json={"workout": "Anonymous", "duration": 1})
+
+    assert [w["exercise"] for w in client.get("/users/M001/workouts").get_json()] == ["Squats", "Yoga"]
+    assert [w["exercise"] for w in client.get("/users/M002/workouts").get_json()] == ["Plank"]
+    assert client.get("/users/M999/workouts").get_json() == []
+    assert len(client.get("/view").get_json()) == 4
+
+
+def test_member_workouts_paginate(client):
+    """Per-member listings use the same cursor pagination as /view."""
+    for i in range(3):
+        client.post("/users/M001/workouts", json={"workout": f"w{i}", "duration": i + 1})
+        client.post("/users/M002/workouts", json={"workout": f"other{i}", "duration": i + 1})
+    first = client.get("/users/M001/workouts?limit=2").get_json()
+    assert [w["exercise"] for w in first["workouts"]] == ["w0", "w1"]
+    second = client.get(f"/users/M001/workouts?limit=2&cursor={first['next_cursor']}").get_json()
+    assert [w["exercise"] for w in second["workouts"]] == ["w2"]
+    assert second["next_cursor"] is None
+
+
+def test_member_post_requires_object(client):
+    rv = client.post("/users/M001/workouts", json=["not", "an", "object"])
+    assert rv.status_code == 400
+
+
+def test_partitions_rebuilt_from_records():
+    """Numeric member IDs share a partition with their string form."""
+    store = WorkoutStore()
+    store.add_many([{"workout": "a", "regn_id": 7}, {"workout": "b", "regn_id": "7"}])
+    assert [w["workout"] for w in store.member_all("7")] == ["a", "b"]
+    assert store.members() == ["7"]
@@ -0,0 +1,89 @@
+import os
+import threading
+
+import pytest
+
+from app import web_app
+from app.metrics import RETIRED, Metrics, _write_shard, retire_shared
+from app.store import WorkoutStore
+
+
+def sample(text, series):
+    for line in text.splitlines():
+        if line.startswith(series + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{series} not in metrics")
+
+
+def test_histogram_counts_and_buckets():
+    """Observations land in cumulative ``le`` buckets with sum, count and bytes."""
+    metrics = Metrics(buckets=(0.01, 0.1))
+    for seconds in (0.005, 0.05, 0.05, 3.0):
+        metrics.observe("/view", "GET", 200, seconds, 100)
+    text = metrics.render([("aceest_store_workouts", "Workouts.", 7)])
+    labels = 'route="/view",method="GET",status="200"'
+    assert sample(text, f"aceest_http_requests_total{{{labels}}}") == 4
+    assert sample(text, f'aceest_http_request_duration_seconds_bucket{{{labels},le="0.01"}}') == 1
+    assert sample(text, f'aceest_http_request_duration_seconds_bucket{{{labels},le="0.1"}}') == 3
+    assert sample(text, f'aceest_http_request_duration_seconds_bucket{{{labels},le="+Inf"}}') == 4
+    assert sample(text, f"aceest_http_request_duration_seconds_sum{{{labels}}}") == pytest.approx(3.105)
+    assert sample(text, f"aceest_http_response_bytes_total{{{labels}}}") == 400
+    assert sample(text, "aceest_store_workouts") == 7
+
+
+def test_thread_shards_are_summed_and_retired():
+    """Every thread counts into its own shard; finished threads are folded into one."""
+    metrics = Metrics()
+
+    def worker():
+        for _ in range(100):
+            metrics.observe("/add", "POST", 201, 0.001, 10)
+
+    threads = [threading.Thread(target=worker) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    metrics.observe("/add", "POST", 201, 0.001, 10)
+    assert len(metrics._shards) <= 2
+    assert sample(metrics.render(), 'aceest_http_requests_total{route="/add",method="POST",status="201"}') == 2001
+
+
+def test_workers_share_their_counters(tmp_path):
+    """A process sharing a directory reports everyone's counters summed, exited workers' included."""
+    key = 'aceest_http_requests_total{route="/view",method="GET",status="200"}'
+    other = Metrics()
+    for _ in range(2):
+        other.observe("/view", "GET", 200, 0.001, 10)
+    # What worker 4242 left behind.
+    _write_shard(str(tmp_path / "4242-1.json"), other.snapshot())
+    metrics = Metrics()
+    metrics.directory, metrics._name = str(tmp_path), "4243-1.json"
+    metrics.observe("/view", "GET", 200, 0.001, 10)
+    assert sample(metrics.render(), key) == 3
+    retire_shared(str(tmp_path), 4242)
+    assert os.listdir(tmp_path) == [RETIRED]
+    metrics.observe("/view", "GET", 200, 0.001, 10)
+    assert sample(metrics.render(), key) == 4
+
+
+def test_metrics_endpoint(monkeypatch):
+    """/metrics reports routes, statuses, compressed bytes, in-flight requests and store size."""
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    monkeypatch.setitem(web_app.fitness_app.extensions, "metrics", Metrics())
+    client = web_app.fitness_app.test_client()
+    for i in range(50):
+        client.post("/users/M1/workouts", json={"exercise": f"w{i}", "duration": 5})
+    gzipped = client.get("/view", headers={"Accept-Encoding": "gzip"})
+    client.get("/missing")
+
+    rv = client.get("/metrics")
+    assert rv.status_code == 200 and rv.mimetype == "text/plain"
+    text = rv.get_data(as_text=True)
+    member = 'route="/users/<regn_id>/workouts",method="POST",status="201"'
+    assert sample(text, f"aceest_http_requests_total{{{member}}}") == 50
+    view = 'route="/view",method="GET",status="200"'
+    assert sample(text, f"aceest_http_response_bytes_total{{{view}}}") == len(gzipped.data)
+    assert sample(text, 'aceest_http_requests_total{route="<unmatched>",method="GET",status="404"}') == 1
+    assert sample(text, "aceest_http_requests_in_flight") == 1
+    assert sample(text, "aceest_store_workouts") == 50
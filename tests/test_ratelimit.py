@@ -0,0 +1,84 @@
+import dataclasses
+
+import pytest
+
+from app import web_app
+from app.config import Settings
+from app.ratelimit import RateLimiter, RateLimits, client_key, parse_rate_limits
+from app.store import WorkoutStore
+
+WORKOUT = {"exercise": "Plank", "duration": 5}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_burst_then_refills():
+    """A client gets ``burst`` requests at once, then one per ``1/rate`` seconds."""
+    clock = Clock()
+    limiter = RateLimiter(rate=2, burst=3, clock=clock)
+    assert [limiter.acquire("kiosk") for _ in range(3)] == [0, 0, 0]
+    assert limiter.acquire("kiosk") == pytest.approx(0.5)
+    assert limiter.acquire("other") == 0
+    clock.now += 0.5
+    assert limiter.acquire("kiosk") == 0
+    assert limiter.acquire("kiosk") > 0
+
+
+def test_idle_buckets_are_evicted():
+    """Refilled buckets are dropped and the table never exceeds ``max_clients``."""
+    clock = Clock()
+    limiter = RateLimiter(rate=10, burst=5, max_clients=100, clock=clock)
+    for i in range(50):
+        limiter.acquire(f"client-{i}")
+    assert len(limiter) == 50
+    clock.now += 0.5
+    limiter.acquire("late")
+    assert len(limiter) == 1
+    for i in range(1000):
+        limiter.acquire(f"flood-{i}")
+    assert len(limiter) == 100
+
+
+def test_parse_rate_limits():
+    assert parse_rate_limits("add_workout=2.5:10, add_workout_batch=1:2") == {
+        "add_workout": (2.5, 10), "add_workout_batch": (1.0, 2)}
+    assert parse_rate_limits("none") == parse_rate_limits("") == {}
+    with pytest.raises(ValueError):
+        parse_rate_limits("add_workout=fast")
+
+
+@pytest.fixture
+def limited(monkeypatch):
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    settings = dataclasses.replace(web_app.settings, rate_limits="add_workout=0.01:2")
+    monkeypatch.setitem(web_app.fitness_app.extensions, "rate_limits", RateLimits(settings))
+
+
+def test_flask_answers_429_per_client(limited):
+    """Over the limit a client gets 429 + Retry-After; other clients and routes are unaffected."""
+    client = web_app.fitness_app.test_client()
+    assert [client.post("/add", json=WORKOUT).status_code for _ in range(2)] == [201, 201]
+    rv = client.post("/add", json=WORKOUT)
+    assert rv.status_code == 429 and int(rv.headers["Retry-After"]) >= 99
+    assert client.post("/add", json=WORKOUT, headers={"X-Client-ID": "kiosk-2"}).status_code == 429
+    assert client.post("/add", json=WORKOUT, environ_base={"REMOTE_ADDR": "10.0.0.2"}).status_code == 201
+    assert client.post("/users/M1/workouts", json=WORKOUT).status_code == 201
+    assert client.get("/view").status_code == 200
+    assert len(web_app.store) == 4
+
+
+def test_clients_are_keyed_by_trusted_sources_only():
+    """``X-Forwarded-For`` and ``X-Client-ID`` count only as far as the settings trust them."""
+    headers = {"X-Forwarded-For": "6.6.6.6, 203.0.113.9", "X-Client-ID": "kiosk-2"}
+    assert client_key(headers, "10.0.0.1", Settings()) == "10.0.0.1"
+    assert client_key(headers, "10.0.0.1", Settings(trusted_proxies=1)) == "203.0.113.9"
+    assert client_key(headers, "10.0.0.1", Settings(trusted_proxies=2)) == "6.6.6.6"
+    assert client_key(headers, "10.0.0.1", Settings(trusted_proxies=3)) == "10.0.0.1"
+    assert client_key({}, "10.0.0.1", Settings(trusted_proxies=1)) == "10.0.0.1"
+    assert client_key(headers, "10.0.0.1", Settings(trust_client_id=True)) == "kiosk-2"
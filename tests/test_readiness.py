@@ -0,0 +1,73 @@
+import pytest
+
+from app import web_app
+from app.metrics import Metrics
+from app.readiness import (LIVE_PATHS, MEMBER_PATHS, RETRY_AFTER, WARM_UP_PATHS, Readiness, warm_routes,
+                           warm_up_paths)
+from app.sqlite_store import SqliteStore
+from app.store import WorkoutStore
+
+
+@pytest.fixture
+def client():
+    return web_app.fitness_app.test_client()
+
+
+def test_ready_after_warm_up(client):
+    """``/readyz`` reports each phase once warm-up is done; ``/healthz`` only says the process is up."""
+    assert web_app.readiness.wait(30)
+    response = client.get("/readyz")
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body["status"] == "ready" and list(body["phases"]) == ["store", "indexes", "routes"]
+    assert body["warm_up_seconds"] == pytest.approx(sum(body["phases"].values()), abs=1e-5)
+    assert client.get("/healthz").get_json() == {"status": "ok"}
+    assert "aceest_ready 1\n" in client.get("/metrics").get_data(as_text=True)
+
+
+def test_routes_wait_for_the_store(client, monkeypatch):
+    """Until the store is open, only the probes and /metrics answer; the rest get 503 and Retry-After."""
+    monkeypatch.setattr(web_app, "store", None)
+    response = client.get("/view")
+    assert response.status_code == 503 and response.headers["Retry-After"] == RETRY_AFTER
+    assert client.post("/add", json={"workout": "Squats", "duration": 20}).status_code == 503
+    assert [client.get(path).status_code for path in LIVE_PATHS] == [200, 200, 200]
+    assert "aceest_store_workouts" not in client.get("/metrics").get_data(as_text=True)
+
+
+def test_not_ready_while_warming_or_failed(client, monkeypatch):
+    """``/readyz`` answers 503 with the running phase, and stays 503 after a phase fails."""
+    readiness = Readiness()
+    readiness.record("store", 0.5)
+    monkeypatch.setitem(web_app.fitness_app.extensions, "readiness", readiness)
+    readiness.phase = "routes"
+    response = client.get("/readyz")
+    assert response.status_code == 503
+    assert response.get_json()["status"] == "warming up" and response.get_json()["phase"] == "routes"
+    assert client.get("/healthz").status_code == 200
+
+    def broken():
+        raise OSError("disk gone")
+    readiness.run([("indexes", lambda: None), ("routes", broken)])
+    assert not readiness.wait(0) and not readiness.ready
+    body = client.get("/readyz").get_json()
+    assert body["status"] == "failed" and body["error"] == "routes: disk gone"
+    assert list(body["phases"]) == ["store", "indexes"]
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_warm_up_requests_hot_routes_without_counting_them(backend, tmp_path, monkeypatch):
+    """Every warm-up path answers 200 on either backend, and none of them reaches the metrics."""
+    store = WorkoutStore() if backend == "memory" else SqliteStore(str(tmp_path / "w.db"))
+    store.add_many([{"exercise": "Push-ups", "duration": 10, "regn_id": "M 1"}, {"exercise": "Plank", "duration": 5}])
+    monkeypatch.setattr(web_app, "store", store)
+    metrics = Metrics()
+    monkeypatch.setitem(web_app.fitness_app.extensions, "metrics", metrics)
+    paths = warm_up_paths(store)
+    assert paths == list(WARM_UP_PATHS) + [path.format("M%201") for path in MEMBER_PATHS]
+    listings = [path for path in paths if path.split("?")[0] in ("/view", "/search", "/changes", "/users/M%201/workouts")]
+    assert len(listings) == 4 and all("limit=100" in path for path in listings)
+    store.warm_up()
+    warm_routes(web_app.fitness_app, store)
+    assert metrics.snapshot().cells == {}
+    store.close()
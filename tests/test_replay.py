@@ -0,0 +1,72 @@
+import gzip
+import json
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from app.replay import Result, difference, replay, report
+
+
+def entry(t, method, path, headers=None, route=None, truncated=False):
+    return {"t": t, "method": method, "path": path, "headers": headers or {}, "client": "c1", "status": 200,
+            "route": route or path.split("?")[0], "seconds": 0.001, "bytes": 0, "body": 0, "truncated": truncated}
+
+
+def build(version, seen):
+    def app(environ, start_response):
+        body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        seen.append((environ["REQUEST_METHOD"], environ["PATH_INFO"], environ.get("HTTP_X_CLIENT_ID"), body))
+        payload = {"epoch": version, "n": version if environ["PATH_INFO"] == "/changed" else 0}
+        data, headers = json.dumps(payload).encode(), [("Content-Type", "application/json")]
+        if "gzip" in environ.get("HTTP_ACCEPT_ENCODING", ""):
+            data = gzip.compress(data)
+            headers.append(("Content-Encoding", "gzip"))
+        start_response("200 OK", headers + [("Content-Length", str(len(data)))])
+        return [data]
+    return app
+
+
+@pytest.fixture
+def targets():
+    servers, seen = [], []
+    for version in (1, 2):
+        log = []
+        server = make_server("127.0.0.1", 0, build(version, log), threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        seen.append(log)
+    yield [f"http://127.0.0.1:{server.server_port}" for server in servers], seen
+    for server in servers:
+        server.shutdown()
+
+
+def test_replay_reports_latency_and_differences(targets):
+    """Both builds get every request; the report lines up latencies and the responses that differ."""
+    urls, seen = targets
+    captured = [
+        (entry(10.0, "POST", "/add", {"Content-Type": "application/json"}), b'{"duration": 5}'),
+        (entry(10.01, "GET", "/view", {"Accept-Encoding": "gzip"}), b""),
+        (entry(10.02, "GET", "/changed"), b""),
+        (entry(10.03, "GET", "/changes", {"Accept": "text/event-stream"}), b""),
+        (entry(10.04, "POST", "/add/batch", truncated=True), b"{"),
+    ]
+    results, skips = replay(captured, urls, speed=0, concurrency=1)
+    assert skips == 2 and [e["path"] for e, _ in results] == ["/add", "/view", "/changed"]
+    for log in seen:
+        assert log[0] == ("POST", "/add", "c1", b'{"duration": 5}') and len(log) == 3
+    text = report(results, urls, skips)
+    assert "POST /add" in text and "GET /view" in text and "captured" in text
+    assert "3 requests replayed, 2 skipped, 0 without a response" in text
+    assert "1 responses differ: 0 in status, 1 in body" in text
+    assert "$.n" in text
+
+
+def test_difference_finds_the_first_json_path():
+    """Ignored keys are left out; the first differing path is reported with both values."""
+    a = Result(200, b'{"epoch": "x", "workouts": [{"duration": 5}, {"duration": 6}]}', 0.1)
+    b = Result(200, b'{"epoch": "y", "workouts": [{"duration": 5}, {"duration": 7}]}', 0.1)
+    assert difference(a, a._replace(body=a.body.replace(b'"x"', b'"z"'))) is None
+    assert difference(a, b) == ("$.workouts[1].duration", 6, 7)
+    assert difference(a, b._replace(status=404)) == ("status", 200, 404)
+    assert difference(a, a._replace(body=a.body[:-2] + b', {"duration": 1}]}')) == ("$.workouts.length", 2, 3)
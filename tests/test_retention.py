@@ -0,0 +1,126 @@
+import json
+
+from app import store as store_module, web_app
+from app.retention import DAY, Compactor, Rollups, retention_cutoff
+from app.store import WorkoutStore
+from app.workout_log import WorkoutLog
+
+JAN_1 = 1704067200
+
+
+def workout(exercise, day, member="M1", duration=10, category="Workout", calories=50.0):
+    return {"exercise": exercise, "duration": duration, "category": category, "calories": calories,
+            "timestamp": JAN_1 + day * DAY + 3600, "regn_id": member}
+
+
+def fill(store):
+    store.add_many([
+        workout("Squats", 0), workout("Plank", 0, duration=5, calories=20.0), workout("Squats", 0, "M2"),
+        workout("Stretch", 0, category="Cool-down"), workout("Squats", 1), workout("Squats", 5),
+    ])
+
+
+def test_retention_cutoff_is_a_day_boundary():
+    """Workouts are kept for whole UTC days."""
+    assert retention_cutoff(JAN_1 + 10 * DAY + 5, 7) == JAN_1 + 3 * DAY
+    assert retention_cutoff(JAN_1 + 10 * DAY, 0.5) == JAN_1 + 9 * DAY
+
+
+def test_compaction_rolls_up_old_days(store):
+    """Old workouts become one rollup per member, day and category; recent ones stay as they were."""
+    fill(store)
+    stats = store.stats().body()
+    assert store.compact(JAN_1 + 2 * DAY) == 5
+    view = store.view()
+    assert view.generation == 1 and view.version == 6
+    listing = json.loads(view.all_json())
+    assert [(w.get("rollup"), w.get("date"), w["regn_id"], w["category"], w.get("sessions"), w["duration"])
+            for w in listing] == [
+        ("day", "2024-01-01", "M1", "Workout", 2, 15),
+        ("day", "2024-01-01", "M2", "Workout", 1, 10),
+        ("day", "2024-01-01", "M1", "Cool-down", 1, 10),
+        ("day", "2024-01-02", "M1", "Workout", 1, 10),
+        (None, None, "M1", "Workout", None, 10),
+    ]
+    assert [seq for seq, _ in view.page_json()] == [2, 3, 4, 5, 6]
+    assert store.stats().body() == stats
+    assert json.loads(view.member_all_json("M2"))[0]["calories"] == 50.0
+    assert len(json.loads(view.range_json(JAN_1, JAN_1 + DAY, "M1"))) == 2
+    assert json.loads(view.search_json(["squat"])) == [listing[-1]]
+    assert store.compact(JAN_1 + 2 * DAY) == 0 and store.view().generation == 1
+
+
+def test_late_workouts_join_their_day(store):
+    """A workout arriving for a compacted day is folded into that day's rollup."""
+    fill(store)
+    store.compact(JAN_1 + 2 * DAY)
+    seq = store.add(workout("Lunges", 1, duration=20, calories=80.0))
+    assert store.compact(JAN_1 + 2 * DAY) == 1
+    day = [w for _, w in store.view().member_page("M1") if w.get("date") == "2024-01-02"]
+    assert day == [{"rollup": "day", "date": "2024-01-02", "category": "Workout", "sessions": 2,
+                    "duration": 30, "calories": 130.0, "timestamp": JAN_1 + DAY, "regn_id": "M1"}]
+    assert store.view().member_version("M1") == seq and store.stats().body()["sessions"] == 7
+
+
+def test_writes_during_compaction_are_kept(monkeypatch):
+    """Commits published while the memory store rebuilds are carried into the new partitions."""
+    store = WorkoutStore()
+    fill(store)
+
+    class Racing(Rollups):
+        def records(self):
+            store.add(workout("Burpees", 6, "M3"))
+            return super().records()
+    monkeypatch.setattr(store_module, "Rollups", Racing)
+    store.compact(JAN_1 + 2 * DAY)
+    view = store.view()
+    assert view.version == 7 and [seq for seq, _ in view.page()] == [2, 3, 4, 5, 6, 7]
+    assert view.member_all("M3")[0]["exercise"] == "Burpees" and view.stats("M3").body()["sessions"] == 1
+
+
+def test_compacted_log_restarts_with_rollups(tmp_path):
+    """The memory store rewrites its log after compacting, so a restart loads the rollups."""
+    store = WorkoutStore(WorkoutLog(str(tmp_path)))
+    fill(store)
+    store.compact(JAN_1 + 2 * DAY)
+    store.add(workout("Squats", 6))
+    expected = store.view().all_json()
+    store.close()
+    reopened = WorkoutStore(WorkoutLog(str(tmp_path)))
+    assert reopened.view().all_json() == expected
+    reopened.close()
+
+
+def test_compactor_and_etag(monkeypatch):
+    """The compactor rolls up past retention, and listings get a new ETag at the same version."""
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    client = web_app.fitness_app.test_client()
+    fill(web_app.store)
+    before = client.get("/view")
+    assert Compactor(web_app.store, 3, clock=lambda: JAN_1 + 6 * DAY).run_once() == 5
+    after = client.get("/view", headers={"If-None-Match": before.headers["ETag"]})
+    assert after.status_code == 200 and after.headers["ETag"] != before.headers["ETag"]
+    assert client.get("/stats").get_json()["sessions"] == 6
+
+
+def test_failed_passes_are_logged_and_exported(monkeypatch, caplog):
+    """A failing pass is logged and counted on /metrics until one succeeds."""
+    class Flaky:
+        passes = 0
+
+        def compact(self, before):
+            self.passes += 1
+            if self.passes <= 2:
+                raise OSError("disk full")
+            return 0
+
+    compactor = Compactor(Flaky(), 3)
+    compactor._pass()
+    compactor._pass()
+    assert compactor.failures == 2 and compactor.last_success == 0
+    assert caplog.text.count("compaction failed") == 2 and "disk full" in caplog.text
+    monkeypatch.setattr(web_app, "compactor", compactor)
+    text = web_app.fitness_app.test_client().get("/metrics").get_data(as_text=True)
+    assert "aceest_compaction_failures 2" in text
+    compactor._pass()
+    assert compactor.failures == 0 and compactor.last_success > 0
@@ -0,0 +1,71 @@
+import dataclasses
+import gzip
+import time
+
+import pytest
+
+from app import web_app
+from app.schema import InvalidWorkout, normalize
+
+
+def test_normalize_produces_canonical_shape():
+    """Aliases, defaults and timestamp formats all end up in one compact shape."""
+    record = normalize({"regn_id": 42, "workout": "  push   UPS ", "duration": 10.0,
+                        "timestamp": "2024-01-01 08:00:00", "category": "cool down"})
+    assert record == {"exercise": "Push-ups", "duration": 10, "category": "Cool-down",
+                      "calories": 2.5 * 3.5 * 70 / 200 * 10, "timestamp": 1704096000, "regn_id": "42"}
+    assert list(record) == ["exercise", "duration", "category", "calories", "timestamp", "regn_id"]
+
+    before = int(time.time())
+    minimal = normalize({"exercise": "Plank", "duration": 5, "calories": 30})
+    assert (minimal["category"], minimal["calories"], minimal["regn_id"]) == ("Workout", 30.0, None)
+    assert before <= minimal["timestamp"] <= time.time()
+    assert normalize(dict(minimal, timestamp=1704096000.9))["timestamp"] == 1704096000
+
+
+@pytest.mark.parametrize("record, error", [
+    ([1, 2], "non-empty JSON object"),
+    ({}, "non-empty JSON object"),
+    ({"duration": 5}, "exercise is required"),
+    ({"exercise": "Plank"}, "duration is required"),
+    ({"exercise": "", "duration": 5}, "must not be empty"),
+    ({"exercise": "x" * 101, "duration": 5}, "at most 100"),
+    ({"exercise": "Plank", "duration": 0}, "between 1 and"),
+    ({"exercise": "Plank", "duration": 2.5}, "whole number"),
+    ({"exercise": "Plank", "duration": True}, "must be a number"),
+    ({"exercise": "Plank", "duration": "5"}, "must be a number"),
+    ({"exercise": "Plank", "duration": 5, "category": "Nap"}, "category must be one of"),
+    ({"exercise": "Plank", "duration": 5, "calories": -1}, "calories must be between"),
+    ({"exercise": "Plank", "duration": 5, "timestamp": "yesterday"}, "timestamp must be"),
+    ({"exercise": "Plank", "duration": 5, "timestamp": 4e10}, "out of range"),
+    ({"exercise": "Plank", "workout": "Yoga", "duration": 5}, "conflicting values"),
+    ({"exercise": "Plank", "duration": 5, "notes": "x" * 10_000}, "unknown field 'notes'"),
+])
+def test_normalize_rejects_bad_workouts(record, error):
+    with pytest.raises(InvalidWorkout, match=error):
+        normalize(record)
+
+
+def test_add_rejects_invalid_and_oversized_bodies(client):
+    """Bad, oversized or non-JSON bodies are refused and nothing is stored."""
+    rv = client.post("/add", json={"exercise": "Plank", "duration": -5})
+    assert rv.status_code == 400 and "duration" in rv.get_json()["error"]
+    assert client.post("/add", data=b"{", content_type="application/json").status_code == 400
+    assert client.post("/add", data=b"{}", content_type="text/plain").status_code == 415
+    big = b'{"exercise":"%s","duration":5}' % (b"x" * web_app.settings.max_body_bytes)
+    rv = client.post("/add", data=big, content_type="application/json")
+    assert rv.status_code == 413
+    rv = client.post("/users/M1/workouts", json={"exercise": "Plank", "duration": 5, "regn_id": "x" * 100})
+    assert rv.status_code == 201
+    assert client.get("/view").get_json()[0]["regn_id"] == "M1"
+    assert len(web_app.store) == 1
+
+
+def test_batch_inflated_size_is_bounded(client, monkeypatch):
+    """A small gzip body that inflates past the batch limit is a 413."""
+    monkeypatch.setattr(web_app, "settings", dataclasses.replace(web_app.settings, batch_max_bytes=100_000))
+    bomb = gzip.compress(b"\n" * 1_000_000)
+    rv = client.post("/add/batch", data=bomb,
+                     headers={"Content-Type": "application/x-ndjson", "Content-Encoding": "gzip"})
+    assert rv.status_code == 413
+    assert len(web_app.store) == 0
@@ -0,0 +1,88 @@
+import json
+import sqlite3
+
+import pytest
+
+from app import web_app
+from app.pagination import InvalidPageRequest, search_args
+from app.search import NameIndex, PrefixTrie, fold, terms
+from app.sqlite_store import SqliteStore
+from app.store import WorkoutStore
+
+NAMES = ["Push-ups", "PUSH UPS", "pushups", "Push Press", "Squats", "Barbell Back Squat", "Plank"]
+
+
+def exercises(listing):
+    return [workout["exercise"] for workout in json.loads(listing)]
+
+
+def test_folding_and_terms():
+    """Case, spaces and punctuation fold away; names index each word and the whole name."""
+    assert fold("Push-Ups!") == "pushups" and fold("  ") == ""
+    assert terms("Barbell Back-Squat") == {"barbell", "backsquat", "barbellbacksquat"}
+    trie = PrefixTrie()
+    for term in ("squat", "squats", "squeeze", "plank"):
+        trie.add(term)
+    assert sorted(trie.complete("squ")) == ["squat", "squats", "squeeze"]
+    assert trie.complete("x") == [] and len(trie.complete("")) == 4
+
+
+def test_name_matching():
+    """Every query word must prefix a term, or the whole folded query must."""
+    index = NameIndex()
+    for name in NAMES + NAMES:
+        index.add(name)
+    assert len(index) == len(NAMES)
+    assert index.match(["pushups"]) == {"Push-ups", "PUSH UPS", "pushups"}
+    assert index.match(["push"]) == {"Push-ups", "PUSH UPS", "pushups", "Push Press"}
+    assert index.match(["push", "up"]) == {"Push-ups", "PUSH UPS", "pushups"}
+    assert index.match(["back", "sq"]) == {"Barbell Back Squat"}
+    assert index.match(["squat", "plank"]) == set()
+
+
+def test_search_listings(store):
+    """Both backends list matching workouts in insertion order, per member and paged."""
+    store.add_many([{"exercise": name, "duration": 5, "regn_id": f"M{i % 2}"} for i, name in enumerate(NAMES)])
+    view = store.view()
+    store.add({"exercise": "Push-ups", "duration": 5, "regn_id": "M0"})
+
+    assert exercises(view.search_json(["pushups"])) == ["Push-ups", "PUSH UPS", "pushups"]
+    assert exercises(view.search_json(["squat"], "M1")) == ["Barbell Back Squat"]
+    assert exercises(store.view().search_json(["pushups"], "M0")) == ["Push-ups", "pushups", "Push-ups"]
+    assert view.search_json(["deadlift"]) == b"[]" and view.search_json(["push"], "M404") == b"[]"
+    page = view.search_page_json(["push"], 0, 2)
+    assert [seq for seq, _ in page] == [1, 2]
+    assert [seq for seq, _ in view.search_page_json(["push"], page[-1][0], 2)] == [3, 4]
+
+
+def test_sqlite_migrates_existing_databases(tmp_path):
+    """A database without the exercise column gets it, and its names, on open."""
+    path = str(tmp_path / "w.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE workouts (seq INTEGER PRIMARY KEY, member TEXT, category TEXT, ts REAL, "
+                 "body TEXT NOT NULL)")
+    conn.execute("INSERT INTO workouts (seq, body) VALUES (1, ?)", ('{"workout":"Squats","duration":5}',))
+    conn.commit()
+    conn.close()
+
+    store = SqliteStore(path)
+    assert [json.loads(body)["workout"] for _, body in store.view().search_page_json(["squat"])] == ["Squats"]
+    store.close()
+
+
+def test_search_endpoints(monkeypatch):
+    """/search and /users/<regn_id>/search take q, page like /view and reject empty queries."""
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    client = web_app.fitness_app.test_client()
+    for i, name in enumerate(NAMES):
+        client.post(f"/users/M{i % 2}/workouts", json={"exercise": name, "duration": 5})
+
+    # Ingest folds the spellings into one canonical name.
+    assert exercises(client.get("/search?q=push-up").data) == ["Push-ups"] * 3
+    assert exercises(client.get("/users/M1/search?q=Squat").data) == ["Barbell Back Squat"]
+    rv = client.get("/search", query_string={"q": "push", "limit": 3})
+    assert len(rv.get_json()["workouts"]) == 3 and "Link" in rv.headers
+    assert client.get("/search?q=--").status_code == 400
+    assert client.get("/search").status_code == 400
+    with pytest.raises(InvalidPageRequest):
+        search_args({"q": "x" * 101})
@@ -0,0 +1,146 @@
+import http.client
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from app.config import Settings
+from app.metrics import SHARE_INTERVAL
+from app.server import PooledWSGIServer, cgroup_cpus, cgroup_memory, listen, plan
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def write(path, text):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+
+
+def served(port):
+    """``GET /`` requests counted by the worker answering ``/metrics``."""
+    text = get(port, "/metrics")[1].decode()
+    series = 'aceest_http_requests_total{route="/",method="GET",status="200"} '
+    return next((int(line[len(series):]) for line in text.splitlines() if line.startswith(series)), 0)
+
+
+def get(port, path):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+    try:
+        conn.request("GET", path)
+        response = conn.getresponse()
+        return response.status, response.read()
+    finally:
+        conn.close()
+
+
+def test_cgroup_v2_limits(tmp_path):
+    """cpu.max and memory.max give the quota in CPUs and the limit in bytes."""
+    write(tmp_path / "cpu.max", "150000 100000\n")
+    write(tmp_path / "memory.max", "536870912\n")
+    assert cgroup_cpus(str(tmp_path)) == 1.5 and cgroup_memory(str(tmp_path)) == 512 * 2**20
+    write(tmp_path / "cpu.max", "max 100000\n")
+    write(tmp_path / "memory.max", "max\n")
+    assert cgroup_cpus(str(tmp_path)) is None and cgroup_memory(str(tmp_path)) is None
+
+
+def test_cgroup_v1_limits(tmp_path):
+    """cgroup v1 spells no limit as -1 for CPU and as a huge number for memory."""
+    write(tmp_path / "cpu" / "cpu.cfs_quota_us", "50000\n")
+    write(tmp_path / "cpu" / "cpu.cfs_period_us", "100000\n")
+    write(tmp_path / "memory" / "memory.limit_in_bytes", "9223372036854771712\n")
+    assert cgroup_cpus(str(tmp_path)) == 0.5 and cgroup_memory(str(tmp_path)) is None
+    write(tmp_path / "cpu" / "cpu.cfs_quota_us", "-1\n")
+    assert cgroup_cpus(str(tmp_path)) is None and cgroup_cpus(str(tmp_path / "missing")) is None
+
+
+def test_plan_sizes_workers_from_cpu_and_memory():
+    """SQLite gets a preloaded worker per CPU within the memory limit; the memory store gets one."""
+    sqlite = Settings(store="sqlite", worker_memory=256 * 2**20)
+    assert plan(sqlite, 0.5, None) == (1, 8, True)
+    assert plan(sqlite, 3.2, None) == (4, 8, True)
+    assert plan(sqlite, 8, 512 * 2**20).workers == 2
+    assert plan(Settings(store="sqlite", workers=3, threads=2), 16, None) == (3, 2, True)
+    assert plan(Settings(), 16, None) == (1, 8, False)
+    with pytest.raises(ValueError):
+        plan(Settings(workers=2), 16, None)
+
+
+def test_pooled_server_bounds_threads():
+    """Concurrent connections are served by at most ``threads`` pool threads."""
+    seen = set()
+
+    def app(environ, start_response):
+        seen.add(threading.current_thread().name)
+        start_response("200 OK", [("Content-Type", "text/plain"), ("Content-Length", "2")])
+        return [b"ok"]
+    sock = listen("127.0.0.1:0")
+    server = PooledWSGIServer(sock, app, threads=2, timeout=1.0)
+    thread = threading.Thread(target=server.serve_forever, args=(0.05,))
+    thread.start()
+    try:
+        def client():
+            for _ in range(5):
+                assert get(sock.getsockname()[1], "/") == (200, b"ok")
+        clients = [threading.Thread(target=client) for _ in range(4)]
+        for other in clients:
+            other.start()
+        for other in clients:
+            other.join()
+    finally:
+        server.shutdown()
+        thread.join()
+        sock.close()
+    assert 1 <= len(seen) <= 2 and all(name.startswith("aceest-request") for name in seen)
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return set(f.read().split())
+
+
+@pytest.mark.skipif(not os.path.exists(f"/proc/{os.getpid()}/task/{os.getpid()}/children"),
+                    reason="needs /proc children lists")
+def test_launcher_restarts_and_stops_gracefully(tmp_path):
+    """HUP replaces every worker without dropping the store or metrics; TERM stops the launcher cleanly."""
+    sock = listen("127.0.0.1:0")
+    port = sock.getsockname()[1]
+    sock.close()
+    env = dict(os.environ, PYTHONPATH=ROOT, ACEEST_BIND=f"127.0.0.1:{port}", ACEEST_STORE="sqlite",
+               ACEEST_SQLITE_PATH=str(tmp_path / "w.db"), ACEEST_WORKERS="2", ACEEST_THREADS="2")
+    proc = subprocess.Popen([sys.executable, "-m", "app.server"], cwd=ROOT, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 20
+        while True:
+            try:
+                assert get(port, "/")[0] == 200
+                break
+            except OSError:
+                assert time.monotonic() < deadline
+                time.sleep(0.05)
+        # The master warmed the app up before forking, so workers start ready.
+        assert get(port, "/readyz")[0] == 200
+        for _ in range(9):
+            get(port, "/")
+        # Whichever worker answers, the counts are those of both, once they have been written.
+        time.sleep(SHARE_INTERVAL * 2)
+        assert {served(port) for _ in range(6)} == {10}
+        workers = children(proc.pid)
+        assert len(workers) == 2
+        proc.send_signal(signal.SIGHUP)
+        while children(proc.pid) & workers:
+            assert time.monotonic() < deadline
+            time.sleep(0.05)
+        assert len(children(proc.pid)) == 2 and get(port, "/view")[0] == 200
+        # The retired workers' requests are still counted.
+        assert served(port) == 10
+        proc.send_signal(signal.SIGTERM)
+        assert proc.wait(timeout=15) == 0
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
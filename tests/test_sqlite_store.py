@@ -0,0 +1,110 @@
+import json
+import threading
+
+import pytest
+
+from app import sqlite_store, web_app
+from app.config import Settings
+from app.sqlite_store import SqliteStore, filesystem_type
+from app.store import create_store
+
+
+def test_backends_share_the_store_interface(store):
+    """Both backends answer the same queries the same way."""
+    assert store.add({"workout": "Squats", "duration": 20, "regn_id": "M1"}) == 1
+    assert store.add_many([{"workout": "Plank", "regn_id": "M2"}, {"workout": "Yoga", "regn_id": "M1"}]) == [2, 3]
+    view = store.view()
+    store.add({"workout": "Later", "regn_id": "M1"})
+
+    assert [w["workout"] for w in view.all()] == ["Squats", "Plank", "Yoga"]
+    assert json.loads(view.all_json()) == view.all()
+    assert json.loads(view.member_all_json("M1")) == view.member_all("M1")
+    assert [seq for seq, _ in view.page_json(1, 10)] == [2, 3]
+    assert [seq for seq, _ in view.page(1, 10)] == [2, 3]
+    assert [w["workout"] for w in view.member_all("M1")] == ["Squats", "Yoga"]
+    assert [seq for seq, _ in view.member_page("M1", 1, 10)] == [3]
+    assert sorted(view.members()) == ["M1", "M2"]
+    assert len(view) == 3 and len(store) == 4
+    assert store.version > view.version
+
+
+def test_sqlite_persists_and_uses_wal(tmp_path):
+    """Rows survive reopening and the database runs in WAL mode."""
+    path = str(tmp_path / "w.db")
+    store = SqliteStore(path)
+    store.add_many([{"workout": f"w{i}", "category": "Workout", "timestamp": "2025-01-01 10:00:00"}
+                    for i in range(3)])
+    assert store.execute("PRAGMA journal_mode")[0][0] == "wal"
+    store.close()
+
+    reopened = SqliteStore(path)
+    assert [w["workout"] for w in reopened.all()] == ["w0", "w1", "w2"]
+    assert reopened.add({"workout": "w3"}) == 4
+    plan = " ".join(row[-1] for row in reopened.execute(
+        "EXPLAIN QUERY PLAN SELECT seq FROM workouts WHERE ts BETWEEN ? AND ?", (0, 1)))
+    assert "workouts_ts" in plan
+    reopened.close()
+
+
+def test_sqlite_connection_per_thread(tmp_path):
+    """Concurrent writers each get their own pooled connection and unique seqs."""
+    store = SqliteStore(str(tmp_path / "w.db"))
+    seqs = []
+    lock = threading.Lock()
+
+    def writer():
+        for _ in range(20):
+            got = store.add_many([{"workout": "x"}, {"workout": "y"}])
+            with lock:
+                seqs.extend(got)
+
+    threads = [threading.Thread(target=writer) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(seqs) == list(range(1, 161))
+    assert len(store._connections) >= 4
+    store.close()
+
+
+def test_two_stores_share_one_database(tmp_path):
+    """A second replica on the same file sees the first one's writes."""
+    path = str(tmp_path / "w.db")
+    first, second = SqliteStore(path), SqliteStore(path)
+    first.add({"workout": "Squats"})
+    assert second.all() == [{"workout": "Squats"}]
+    assert second.add({"workout": "Plank"}) == 2
+    first.close()
+    second.close()
+
+
+def test_sqlite_selected_from_settings(tmp_path, monkeypatch):
+    """ACEEST_STORE=sqlite puts the web API on SQLite."""
+    settings = Settings.from_env({"ACEEST_STORE": "sqlite", "ACEEST_DATA_DIR": str(tmp_path)})
+    store = create_store(settings)
+    assert isinstance(store, SqliteStore) and store.path == str(tmp_path / "workouts.db")
+    monkeypatch.setattr(web_app, "store", store)
+    client = web_app.fitness_app.test_client()
+    assert client.post("/users/M7/workouts", json={"workout": "Row", "duration": 9}).status_code == 201
+    [row] = client.get("/users/M7/workouts").get_json()
+    assert (row["exercise"], row["duration"], row["regn_id"]) == ("Row", 9, "M7")
+    assert client.get("/view?limit=1").get_json()["next_cursor"] is None
+    store.close()
+    with pytest.raises(ValueError):
+        create_store(Settings(store="mongo"))
+
+
+def test_network_filesystems_are_refused(tmp_path, monkeypatch):
+    """The mount holding a path is its longest matching mount point; WAL refuses network ones."""
+    mounts = tmp_path / "mounts"
+    mounts.write_text("overlay / overlay rw 0 0\n"
+                      "server:/export /data nfs4 rw 0 0\n"
+                      "/dev/sda1 /data/local\\040disk ext4 rw 0 0\n")
+    assert filesystem_type("/data/db", str(mounts)) == "nfs4"
+    assert filesystem_type("/data/local disk/db", str(mounts)) == "ext4"
+    assert filesystem_type("/database", str(mounts)) == "overlay"
+    assert filesystem_type("/x", str(tmp_path / "missing")) is None
+    monkeypatch.setattr(sqlite_store, "filesystem_type", lambda path: "nfs4")
+    with pytest.raises(ValueError, match="nfs4"):
+        SqliteStore(str(tmp_path / "w.db"))
@@ -0,0 +1,84 @@
+import sqlite3
+
+from app import web_app
+from app.sqlite_store import SqliteStore
+from app.stats import WorkoutStats
+from app.store import WorkoutStore
+
+WORKOUTS = [
+    {"exercise": "Jog", "duration": 10, "category": "Warm-up", "calories": 35.0, "regn_id": "M1"},
+    {"exercise": "Squats", "duration": 20, "category": "Workout", "calories": 147.0, "regn_id": "M1"},
+    {"exercise": "Stretch", "duration": 5, "category": "Cool-down", "calories": 15.25, "regn_id": "M2"},
+    {"exercise": "Plank", "duration": 3, "category": "Workout", "calories": 22.05, "regn_id": None},
+]
+
+
+def test_totals_per_category_and_member(store):
+    """Both backends keep the same running totals, store-wide and per member."""
+    store.add_many(WORKOUTS[:2])
+    store.add_many(WORKOUTS[2:])
+    stats = store.stats()
+    assert stats.version == 4
+    assert stats.categories == {
+        "Warm-up": (1, 10, 35.0), "Workout": (2, 23, 169.05), "Cool-down": (1, 5, 15.25)}
+    assert store.stats("M1").categories == {"Warm-up": (1, 10, 35.0), "Workout": (1, 20, 147.0)}
+    assert store.stats("M1").version == 2
+    assert store.stats("M404").categories == {} and store.stats("M404").version == 0
+
+
+def test_member_stats_match_their_view():
+    """An older view's member totals leave out workouts committed after it."""
+    store = WorkoutStore()
+    store.add_many(WORKOUTS)
+    view = store.view()
+    store.add({"exercise": "Burpees", "duration": 7, "category": "Workout", "calories": 50.0, "regn_id": "M1"})
+    assert view.stats("M1").categories == {"Warm-up": (1, 10, 35.0), "Workout": (1, 20, 147.0)}
+    assert view.stats("M1").version == 2
+    assert view.stats().version == 4
+    assert store.stats("M1").categories["Workout"] == (2, 27, 197.0)
+
+
+def test_sqlite_backfills_existing_databases(tmp_path):
+    """Totals are computed once for a database written before the stats table existed."""
+    path = str(tmp_path / "w.db")
+    store = SqliteStore(path)
+    store.add_many(WORKOUTS)
+    store.close()
+    conn = sqlite3.connect(path)
+    conn.executescript("DROP TABLE stats; DELETE FROM meta WHERE key = 'stats';")
+    conn.close()
+
+    reopened = SqliteStore(path)
+    assert reopened.stats().categories["Workout"] == (2, 23, 169.05)
+    assert reopened.stats("M2").categories == {"Cool-down": (1, 5, 15.25)}
+    reopened.close()
+
+
+def test_body_lists_every_category():
+    """Categories without sessions are reported as zeros; totals add up."""
+    stats = WorkoutStats(3, {"Workout": (2, 30, 100.126), "Yoga": (1, 5, 1.0)})
+    body = stats.body("M1", ["Warm-up", "Workout"])
+    assert list(body["categories"]) == ["Warm-up", "Workout", "Yoga"]
+    assert body["categories"]["Warm-up"] == {"sessions": 0, "minutes": 0, "calories": 0.0}
+    assert (body["regn_id"], body["sessions"], body["minutes"], body["calories"]) == ("M1", 3, 35, 101.13)
+
+
+def test_stats_endpoints(monkeypatch):
+    """/stats and /users/<regn_id>/stats serve the totals with an ETag."""
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    client = web_app.fitness_app.test_client()
+    client.post("/users/M1/workouts", json={"exercise": "Squats", "duration": 20})
+    client.post("/add", json={"exercise": "Jog", "duration": 10, "category": "Warm-up"})
+
+    rv = client.get("/stats")
+    body = rv.get_json()
+    assert body["sessions"] == 2 and body["minutes"] == 30 and body["regn_id"] is None
+    assert list(body["categories"]) == ["Warm-up", "Workout", "Cool-down"]
+    assert body["categories"]["Workout"] == {"sessions": 1, "minutes": 20, "calories": 147.0}
+    assert client.get("/stats", headers={"If-None-Match": rv.headers["ETag"]}).status_code == 304
+
+    member = client.get("/users/M1/stats")
+    assert member.get_json()["regn_id"] == "M1" and member.get_json()["minutes"] == 20
+    client.post("/add", json={"exercise": "Plank", "duration": 5})
+    assert client.get("/users/M1/stats", headers={"If-None-Match": member.headers["ETag"]}).status_code == 304
+    assert client.get("/stats", headers={"If-None-Match": rv.headers["ETag"]}).status_code == 200
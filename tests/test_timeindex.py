@@ -0,0 +1,62 @@
+import json
+import random
+
+from app import web_app
+from app.store import WorkoutStore
+from app.timeindex import BLOCK, ORDINAL_MASK, TimeIndex
+
+DAY = 24 * 60 * 60
+MONDAY = 1704067200  # 2024-01-01 00:00:00 UTC
+
+
+def workout(day, name, member=None):
+    return {"exercise": name, "duration": 10, "timestamp": MONDAY + day * DAY, "regn_id": member}
+
+
+def test_out_of_order_inserts_scan_in_time_order():
+    """Keys inserted in any order come back sorted, across block splits."""
+    timestamps = [random.randrange(10_000) for _ in range(10 * BLOCK)]
+    index = TimeIndex(lambda ordinal: timestamps[ordinal - 1])
+    for ordinal, timestamp in enumerate(timestamps, 1):
+        index.add(timestamp, ordinal)
+    assert len(index) == len(timestamps) and len(index._state[1]) > 5
+    expected = sorted((t, o) for o, t in enumerate(timestamps, 1) if 2_000 <= t < 7_000)
+    keys = index.scan(2_000, 7_000, len(timestamps))
+    assert [(key >> 40, key & ORDINAL_MASK) for key in keys] == expected
+    assert index.scan(2_000, 7_000, len(timestamps), after=keys[9], limit=5) == keys[10:15]
+    assert all(key & ORDINAL_MASK <= 100 for key in index.scan(0, None, 100))
+
+
+def test_range_queries(store):
+    """Ranges are half-open, ordered by timestamp and scoped to the view and member."""
+    store.add_many([workout(3, "Thu", "M1"), workout(0, "Mon", "M2"), workout(7, "Next Mon", "M1")])
+    view = store.view()
+    store.add(workout(1, "Tue (synced late)", "M1"))
+
+    week = json.loads(view.range_json(MONDAY, MONDAY + 7 * DAY))
+    assert [w["exercise"] for w in week] == ["Mon", "Thu"]
+    assert [w["exercise"] for w in json.loads(store.view().range_json(MONDAY, MONDAY + 7 * DAY, "M1"))] == [
+        "Tue (synced late)", "Thu"]
+    assert json.loads(view.range_json(MONDAY, None, "M404")) == []
+    first = view.range_page_json(0, None, 0, 2)
+    assert [json.loads(body)["exercise"] for _, body in first] == ["Mon", "Thu"]
+    rest = view.range_page_json(0, None, first[-1][0], 2)
+    assert [json.loads(body)["exercise"] for _, body in rest] == ["Next Mon"]
+
+
+def test_view_from_to(monkeypatch):
+    """/view and member listings accept from/to as epoch seconds or ISO dates, with paging."""
+    monkeypatch.setattr(web_app, "store", WorkoutStore())
+    client = web_app.fitness_app.test_client()
+    for day in (9, 2, 5, 0, 12):
+        client.post("/users/M1/workouts", json=workout(day, f"day{day}"))
+    client.post("/add", json=workout(3, "other"))
+
+    rv = client.get("/view", query_string={"from": "2024-01-01", "to": "2024-01-08"})
+    assert [w["exercise"] for w in rv.get_json()] == ["day0", "day2", "other", "day5"]
+    rv = client.get("/users/M1/workouts", query_string={"from": MONDAY + 2 * DAY, "limit": 2})
+    assert [w["exercise"] for w in rv.get_json()["workouts"]] == ["day2", "day5"]
+    rv = client.get(rv.headers["Link"].split(">")[0].lstrip("<"))
+    assert [w["exercise"] for w in rv.get_json()["workouts"]] == ["day9", "day12"]
+    assert rv.get_json()["next_cursor"] is None
+    assert client.get("/view", query_string={"to": "next week"}).status_code == 400
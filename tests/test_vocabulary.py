@@ -0,0 +1,80 @@
+import dataclasses
+import threading
+
+import pytest
+
+from app import schema, sqlite_store, store as store_module, web_app
+from app.config import Settings
+from app.store import create_store
+from app.vocabulary import CATEGORIES, COMMON_EXERCISES, EXERCISES, Vocabulary
+
+
+def test_spellings_share_one_id_and_name():
+    """Case and punctuation variants fold to the seeded or first-seen spelling."""
+    vocabulary = Vocabulary(("Push-ups",))
+    assert {vocabulary.id(name) for name in ("Push-ups", "push ups", "PUSHUPS")} == {1}
+    assert vocabulary.canonical("jump rope") == "jump rope" and vocabulary.canonical("Jump-Rope") == "jump rope"
+    assert vocabulary.values == [None, "Push-ups", "jump rope"] and vocabulary.name(2) == "jump rope"
+    assert vocabulary.id("--") is None
+    assert vocabulary.code("Push-ups") == 1 and vocabulary.code("pushups") is None
+
+
+def test_shared_vocabularies():
+    """Categories are closed; common exercises are seeded the same in every process."""
+    assert CATEGORIES.canonical("warmup") == "Warm-up" and CATEGORIES.canonical("COOL DOWN") == "Cool-down"
+    assert CATEGORIES.id("Nap") is None and len(CATEGORIES) == 4
+    assert EXERCISES.canonical("bench-press") == "Bench Press"
+
+
+def test_concurrent_learning_assigns_one_id():
+    """Threads learning the same new name agree on its ID."""
+    vocabulary = Vocabulary()
+    found = []
+    threads = [threading.Thread(target=lambda: found.append(vocabulary.id("Kettlebell Swing")))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(found) == {1} and len(vocabulary) == 2
+
+
+@pytest.mark.parametrize("backend", ["memory", "sqlite"])
+def test_reopened_store_keeps_stored_spellings(backend, tmp_path, monkeypatch):
+    """A store seeds a fresh process's vocabulary with its names, before any request can spell them anew."""
+    settings = Settings(store=backend, data_dir=str(tmp_path))
+    first = create_store(settings)
+    first.add(schema.normalize({"exercise": "kettlebell swing", "duration": 5}))
+    first.close()
+    fresh = Vocabulary(COMMON_EXERCISES)
+    for module in (schema, sqlite_store, store_module):
+        monkeypatch.setattr(module, "EXERCISES", fresh)
+    reopened = create_store(settings)
+    assert schema.normalize({"exercise": "Kettlebell-Swing", "duration": 5})["exercise"] == "kettlebell swing"
+    reopened.close()
+
+
+def test_learned_names_are_capped():
+    """A flood of unique names stops growing the vocabulary; seeded and known names still resolve."""
+    vocabulary = Vocabulary(("Push-ups",), max_learned=100)
+    for i in range(10_000):
+        vocabulary.id(f"made up {i}")
+    assert len(vocabulary) == 102
+    assert vocabulary.id("made up 99") == 101 and vocabulary.id("made up 100") is None
+    assert vocabulary.canonical("made up 5000") is None and vocabulary.code("made up 5000") is None
+    vocabulary.seed(["Lunges"])
+    assert vocabulary.canonical("LUNGES") == "Lunges" and vocabulary.canonical("push ups") == "Push-ups"
+
+
+
+def test_rejected_requests_teach_no_names(client, monkeypatch):
+    """Names are learned once a whole request validates, so a rejected one sets no spelling and uses up no ID."""
+    fresh = Vocabulary(COMMON_EXERCISES, max_learned=1)
+    monkeypatch.setattr(schema, "EXERCISES", fresh)
+    monkeypatch.setattr(web_app, "settings", dataclasses.replace(web_app.settings, batch_max_records=1))
+    assert client.post("/add", json={"exercise": "TURKISH get-up", "duration": 0}).status_code == 400
+    batch = [{"exercise": "turkish-getup", "duration": 5}, {"exercise": "Plank", "duration": 5}]
+    assert client.post("/add/batch", json=batch).status_code == 413
+    assert len(fresh) == len(COMMON_EXERCISES) + 1
+    assert client.post("/add", json={"exercise": "Turkish Get-up", "duration": 5}).status_code == 201
+    assert schema.normalize({"exercise": "turkish getup", "duration": 5})["exercise"] == "Turkish Get-up"
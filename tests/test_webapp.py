@@ -23,8 +23,37 @@ def test_add_and_view_workout(client):
     data = json.loads(rv.data)
     assert data.get("message") == "Workout added successfully"
 
-    # View all workouts
+    # View all workouts; the legacy "workout" key is stored as "exercise"
     rv2 = client.get('/view')
     assert rv2.status_code == 200
     data2 = json.loads(rv2.data)
-    assert {"workout": "Push-ups", "duration": 10} in data2
+    stored = data2[-1]
+    assert list(stored) == ["exercise", "duration", "category", "calories", "timestamp", "regn_id"]
+    assert (stored["exercise"], stored["duration"], stored["category"]) == ("Push-ups", 10, "Workout")
+
+def test_view_pagination_walks_all_pages(client):
+    for i in range(5):
+        client.post('/add', json={"workout": f"page-{i}", "duration": i + 1})
+    total = len(client.get('/view').get_json())
+
+    seen, cursor = [], None
+    while True:
+        url = '/view?limit=2' + (f'&cursor={cursor}' if cursor else '')
+        rv = client.get(url)
+        assert rv.status_code == 200
+        body = rv.get_json()
+        assert len(body["workouts"]) <= 2
+        seen.extend(body["workouts"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            assert "Link" not in rv.headers
+            break
+        assert f'cursor={cursor}' in rv.headers["Link"]
+        assert rv.headers["Link"].endswith('rel="next"')
+    assert len(seen) == total
+    assert [w["exercise"] for w in seen[-5:]] == [f"page-{i}" for i in range(5)]
+
+def test_view_pagination_rejects_bad_arguments(client):
+    assert client.get('/view?cursor=not-a-cursor').status_code == 400
+    assert client.get('/view?limit=0').status_code == 400
+    assert client.get('/view?limit=abc').status_code == 400
@@ -0,0 +1,133 @@
+import os
+import threading
+
+import pytest
+
+from app.config import Settings
+from app.store import WorkoutStore, create_store
+from app.workout_log import LogCorruptionError, WorkoutLog, decode_entry, encode_entry
+
+
+def open_store(path, **kwargs):
+    snapshot_every = kwargs.pop("snapshot_every", 100_000)
+    return WorkoutStore(WorkoutLog(str(path), **kwargs), snapshot_every=snapshot_every)
+
+
+def test_entry_round_trip():
+    """Encoded entries decode back; torn or tampered lines are rejected."""
+    line = encode_entry(7, b'{"workout":"Plank","duration":5}')
+    assert decode_entry(line) == (7, {"workout": "Plank", "duration": 5})
+    assert decode_entry(line[:-1]) is None
+    assert decode_entry(line.replace(b"Plank", b"Plonk")) is None
+
+
+@pytest.mark.parametrize("policy", ["always", "batch", "interval"])
+def test_restart_recovers_workouts(tmp_path, policy):
+    """Workouts survive a close/reopen under every fsync policy."""
+    store = open_store(tmp_path, fsync=policy)
+    store.add({"workout": "Squats", "duration": 20})
+    store.add_many([{"workout": "Plank", "duration": 5}, {"workout": "Yoga", "duration": 30}])
+    store.close()
+
+    reopened = open_store(tmp_path, fsync=policy)
+    assert [w["workout"] for w in reopened.all()] == ["Squats", "Plank", "Yoga"]
+    assert reopened.add({"workout": "Run", "duration": 10}) == 4
+    reopened.close()
+
+
+def test_snapshot_truncates_replay(tmp_path):
+    """After a snapshot, covered segments are dropped and startup still sees everything."""
+    store = open_store(tmp_path, segment_bytes=200)
+    for i in range(20):
+        store.add({"workout": f"w{i}", "duration": i})
+    segments_before = [n for n in os.listdir(tmp_path) if n.endswith(".log")]
+    store.snapshot()
+    store.add({"workout": "tail", "duration": 1})
+    store.close()
+
+    segments_after = [n for n in os.listdir(tmp_path) if n.endswith(".log")]
+    assert len(segments_after) < len(segments_before)
+    assert any(n.startswith("snapshot-") for n in os.listdir(tmp_path))
+
+    reopened = open_store(tmp_path)
+    workouts = reopened.all()
+    assert len(workouts) == 21
+    assert workouts[-1]["workout"] == "tail"
+    reopened.close()
+
+
+def test_periodic_snapshot_is_triggered(tmp_path):
+    """Crossing ``snapshot_every`` writes a snapshot in the background."""
+    store = open_store(tmp_path, snapshot_every=5)
+    for i in range(6):
+        store.add({"workout": "w", "duration": i})
+    for _ in range(100):
+        if any(n.startswith("snapshot-") and n.endswith(".jsonl") for n in os.listdir(tmp_path)):
+            break
+        threading.Event().wait(0.01)
+    else:
+        pytest.fail("no snapshot written")
+    store.close()
+
+
+def test_torn_tail_is_truncated(tmp_path):
+    """A partially written last entry is dropped on recovery."""
+    store = open_store(tmp_path)
+    store.add({"workout": "Squats", "duration": 20})
+    store.close()
+    segment = next(n for n in os.listdir(tmp_path) if n.endswith(".log"))
+    with open(tmp_path / segment, "ab") as f:
+        f.write(b"deadbeef [2,{\"workout\":")
+
+    reopened = open_store(tmp_path)
+    assert reopened.all() == [{"workout": "Squats", "duration": 20}]
+    assert reopened.add({"workout": "Plank", "duration": 5}) == 2
+    reopened.close()
+    assert len(open_store(tmp_path).all()) == 2
+
+
+def test_corrupt_sealed_segment_raises(tmp_path):
+    """Corruption before the tail is reported, not silently skipped."""
+    store = open_store(tmp_path, segment_bytes=10)
+    store.add({"workout": "a", "duration": 1})
+    store.add({"workout": "b", "duration": 2})
+    store.close()
+    first = sorted(n for n in os.listdir(tmp_path) if n.endswith(".log"))[0]
+    (tmp_path / first).write_bytes(b"00000000 garbage\n")
+    with pytest.raises(LogCorruptionError):
+        open_store(tmp_path)
+
+
+def test_group_commit_keeps_order_under_concurrency(tmp_path):
+    """Concurrent writers share flushes and every acknowledged write is replayed in seq order."""
+    store = open_store(tmp_path)
+
+    def writer(n):
+        for i in range(50):
+            store.add({"writer": n, "i": i})
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    live = store.all()
+    store.close()
+
+    reopened = open_store(tmp_path)
+    assert reopened.all() == live
+    assert len(live) == 400
+    for n in range(8):
+        assert [w["i"] for w in live if w["writer"] == n] == list(range(50))
+    reopened.close()
+
+
+def test_create_store_from_settings(tmp_path):
+    """``ACEEST_DATA_DIR`` selects the durable log; no directory keeps memory only."""
+    assert create_store(Settings())._log is None
+    settings = Settings.from_env({"ACEEST_DATA_DIR": str(tmp_path), "ACEEST_FSYNC": "interval"})
+    store = create_store(settings)
+    assert store._log.fsync == "interval"
+    store.close()
+    with pytest.raises(ValueError):
+        Settings.from_env({"ACEEST_SNAPSHOT_EVERY": "lots"})